@@ -1,5 +1,12 @@
+from time import perf_counter as _perf_counter
+_t_import = _perf_counter()
+
 from envswitch.env_api import *
 from envswitch.gui import *
 from envswitch.env_config import *
+from envswitch.env_overlay import *
+
+from envswitch.tracing import record as _record
+_record('import', _perf_counter() - _t_import)
 
-__all__ = ['env_api', 'env_config', 'gui']
+__all__ = ['env_api', 'env_config', 'env_overlay', 'gui']
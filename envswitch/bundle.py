@@ -0,0 +1,357 @@
+import json
+import mmap
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from envswitch.env_config import EnvConfig, GlobalEnvsConfig, UnknownEnvIdException
+from envswitch.lazy_values import CommandValue, FileValue
+from envswitch.list_vars import ListVarOps
+from envswitch.tracing import logger, span
+
+_NAME = 'name'
+
+# file extension of compiled bundles
+BUNDLE_EXTENSION = '.esb'
+
+MAGIC = b'ESWB'
+VERSION = 1
+
+# Layout of a bundle (all integers are little-endian, all offsets are relative to the start of the body):
+#
+#   header   magic, version, checksum (crc32 of the body), body length, source stamp (mtime_ns, size), source path
+#            length, followed by the source path. This part never changes across versions so that the source can always
+#            be found, even in a bundle that can not be read
+#   body     number of environments, hash index capacity, and the offsets of the following tables
+#   order    the offset of each environment table, in the configuration order
+#   index    open addressing hash table of (crc32 of the environment id, offset of the environment table + 1), 0 = empty
+#   envs     for each environment, its id, name and number of variables, followed by its variables (name, kind, value)
+#   strings  all distinct strings, utf-8 encoded. Strings are referenced with (offset, length)
+_HEADER = struct.Struct('<4sHHIIqqI')
+_BODY_HEADER = struct.Struct('<IIIIII')
+_U32 = struct.Struct('<I')
+_INDEX_SLOT = struct.Struct('<II')
+_ENV_ENTRY = struct.Struct('<IIIII')
+_VAR_ENTRY = struct.Struct('<IIIII')
+
+# kinds of variable values
+_KIND_STR = 0
+_KIND_LIST_OPS = 1  # a ListVarOps, stored as its json dictionary
+# lazy values, stored as their source
+_LAZY_KINDS = {FileValue: 2, CommandValue: 3}
+_LAZY_TYPES = {kind: t for t, kind in _LAZY_KINDS.items()}
+
+
+class InvalidBundleException(Exception):
+    def __init__(self, msg):
+        """
+        Same as UnknownEnvIdException: the constructor only has one argument, use the static constructor `create_from`
+        :param msg:
+        """
+        super(InvalidBundleException, self).__init__(msg)
+
+    @staticmethod
+    def create_from(bundle_path, reason, source_path=None):
+        e = InvalidBundleException("Configuration bundle '" + bundle_path + "' can not be used: " + reason)
+        e.bundle_path = bundle_path
+        e.source_path = source_path
+        return e
+
+
+def _id_hash(env_id_bytes: bytes) -> int:
+    # python's str hash is randomized per process, so a stable hash is needed
+    return zlib.crc32(env_id_bytes)
+
+
+def _get_source_stamp(source_path: str) -> Tuple[int, int]:
+    """ Returns the (modification time, size) of a source file, or the latest and total ones for a directory """
+    if not os.path.isdir(source_path):
+        st = os.stat(source_path)
+        return st.st_mtime_ns, st.st_size
+    mtime_ns, size = os.stat(source_path).st_mtime_ns, 0
+    for file_name in os.listdir(source_path):
+        st = os.stat(os.path.join(source_path, file_name))
+        mtime_ns, size = max(mtime_ns, st.st_mtime_ns), size + st.st_size
+    return mtime_ns, size
+
+
+def compile_bundle(config: GlobalEnvsConfig, bundle_path: str, source_path: str = None):
+    """
+    Compiles `config` into a read-only binary bundle at `bundle_path`, that can then be opened with EnvsBundle in order
+    to look up environments without parsing and validating the whole configuration. The environments generated by
+    templates (see templates.EnvTemplate) are compiled as plain environments.
+
+    :param config:
+    :param bundle_path:
+    :param source_path: an optional path to the configuration file `config` was loaded from. It is recorded in the
+    bundle, so that readers can fall back to it when the bundle is outdated (the source was modified since) or invalid
+    :return:
+    """
+    with span('bundle.compile'):
+        strings = bytearray()
+        strings_offsets = dict()  # type: Dict[str, Tuple[int, int]]
+
+        def _ref(s: str) -> Tuple[int, int]:
+            ref = strings_offsets.get(s)
+            if ref is None:
+                b = s.encode('utf-8')
+                ref = strings_offsets[s] = (len(strings), len(b))
+                strings.extend(b)
+            return ref
+
+        # environments generated by templates are stored as plain environments
+        env_ids = config.get_available_envs()
+        nb_envs = len(env_ids)
+        capacity = 1
+        while capacity < 2 * nb_envs:
+            capacity *= 2
+        order_offset = _BODY_HEADER.size
+        index_offset = order_offset + nb_envs * _U32.size
+        envs_offset = index_offset + capacity * _INDEX_SLOT.size
+
+        envs = bytearray()
+        order = []
+        index = [(0, 0)] * capacity
+        for env_id in env_ids:
+            env = config.get_env(env_id)
+            env_offset = envs_offset + len(envs)
+            order.append(env_offset)
+            h = _id_hash(env_id.encode('utf-8'))
+            slot = h & (capacity - 1)
+            while index[slot][1] != 0:
+                slot = (slot + 1) & (capacity - 1)
+            index[slot] = (h, env_offset + 1)
+
+            envs.extend(_ENV_ENTRY.pack(*_ref(env_id), *_ref(env.name), len(env.env_variables_dct)))
+            for name, value in env.env_variables_dct.items():
+                if isinstance(value, ListVarOps):
+                    kind, value = _KIND_LIST_OPS, json.dumps(value.to_dict())
+                elif type(value) in _LAZY_KINDS:
+                    kind, value = _LAZY_KINDS[type(value)], value.source
+                else:
+                    kind = _KIND_STR
+                envs.extend(_VAR_ENTRY.pack(*_ref(name), kind, *_ref(value)))
+
+        strings_offset = envs_offset + len(envs)
+        body = bytearray(_BODY_HEADER.pack(nb_envs, capacity, order_offset, index_offset, envs_offset, strings_offset))
+        for env_offset in order:
+            body.extend(_U32.pack(env_offset))
+        for slot in index:
+            body.extend(_INDEX_SLOT.pack(*slot))
+        body.extend(envs)
+        body.extend(strings)
+
+        if source_path is not None:
+            source_path = os.path.abspath(source_path)
+            mtime_ns, size = _get_source_stamp(source_path)
+            source_bytes = source_path.encode('utf-8')
+        else:
+            mtime_ns, size, source_bytes = 0, 0, b''
+
+        logger.info("Writing configuration bundle '" + bundle_path + "': " + str(nb_envs) + " environment(s), "
+                    + str(len(body)) + " bytes")
+        with open(bundle_path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, 0, zlib.crc32(body), len(body), mtime_ns, size, len(source_bytes)))
+            f.write(source_bytes)
+            f.write(body)
+
+
+def is_bundle(path: str) -> bool:
+    """
+    :param path:
+    :return: True if `path` is a file starting with the bundle magic bytes
+    """
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class EnvsBundle:
+    """
+    A compiled configuration bundle (see compile_bundle), opened with mmap. Environments are looked up in constant time
+    in the bundle index, and only the environments actually requested are deserialized:
+
+        with EnvsBundle('envs.esb') as bundle:
+            env = bundle.get_env('proxy')
+
+    The version and checksum of the bundle are checked when it is opened. If the bundle records its source
+    configuration file and that file was modified since the bundle was compiled, the bundle is considered outdated. In
+    both cases an InvalidBundleException is raised, whose `source_path` may be used as a fallback.
+    """
+    __slots__ = ('path', 'source_path', '_file', '_mm', '_body', '_nb_envs', '_capacity', '_order_offset',
+                 '_index_offset', '_strings_offset')
+
+    def __init__(self, bundle_path: str, check_source: bool = True):
+        """
+        :param bundle_path:
+        :param check_source: if True (default) and the bundle records its source, the bundle is rejected when the
+        source was modified since it was compiled
+        """
+        self.path = bundle_path
+        self.source_path = None
+        self._file = open(bundle_path, 'rb')
+        self._mm = None
+        try:
+            if os.fstat(self._file.fileno()).st_size < _HEADER.size:
+                raise InvalidBundleException.create_from(self.path, 'file is too short')
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._open(check_source)
+        except Exception:
+            self.close()
+            raise
+
+    def _open(self, check_source: bool):
+        mm = self._mm
+        magic, version, _, checksum, body_len, mtime_ns, size, source_len = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            raise InvalidBundleException.create_from(self.path, 'this is not a configuration bundle')
+        if source_len > 0:
+            self.source_path = mm[_HEADER.size:_HEADER.size + source_len].decode('utf-8')
+
+        if version != VERSION:
+            raise InvalidBundleException.create_from(self.path, 'unsupported bundle version ' + str(version)
+                                                     + ', expected ' + str(VERSION), self.source_path)
+        body_start = _HEADER.size + source_len
+        with memoryview(mm) as view:
+            body = view[body_start:]
+            actual_checksum = zlib.crc32(body)
+            body.release()
+        if len(mm) != body_start + body_len or actual_checksum != checksum:
+            raise InvalidBundleException.create_from(self.path, 'checksum error, the file is corrupted',
+                                                     self.source_path)
+        if check_source and self.source_path is not None:
+            try:
+                stamp = _get_source_stamp(self.source_path)
+            except OSError:
+                # the source is not available (for example the bundle was shipped alone), the bundle is the reference
+                stamp = (mtime_ns, size)
+            if stamp != (mtime_ns, size):
+                raise InvalidBundleException.create_from(self.path, "it is outdated, source '" + self.source_path
+                                                         + "' was modified since it was compiled", self.source_path)
+
+        self._body = body_start
+        self._nb_envs, self._capacity, self._order_offset, self._index_offset, _, self._strings_offset = \
+            _BODY_HEADER.unpack_from(mm, body_start)
+
+    def close(self):
+        """
+        Closes the bundle. Environments already returned remain valid.
+
+        :return:
+        """
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def __len__(self):
+        return self._nb_envs
+
+    def __contains__(self, env_id: str):
+        return self._find(env_id) is not None
+
+    def _str(self, offset: int, length: int) -> str:
+        start = self._body + self._strings_offset + offset
+        return self._mm[start:start + length].decode('utf-8')
+
+    def _find(self, env_id: str) -> Optional[int]:
+        """ Returns the offset of the table of environment `env_id`, or None if it is not in the bundle """
+        if self._capacity == 0:
+            return None
+        env_id_bytes = env_id.encode('utf-8')
+        h = _id_hash(env_id_bytes)
+        mask = self._capacity - 1
+        slot = h & mask
+        while True:
+            slot_h, env_offset = _INDEX_SLOT.unpack_from(self._mm, self._body + self._index_offset
+                                                         + slot * _INDEX_SLOT.size)
+            if env_offset == 0:
+                return None
+            if slot_h == h:
+                id_offset, id_len = _ENV_ENTRY.unpack_from(self._mm, self._body + env_offset - 1)[:2]
+                start = self._body + self._strings_offset + id_offset
+                if self._mm[start:start + id_len] == env_id_bytes:
+                    return env_offset - 1
+            slot = (slot + 1) & mask
+
+    def _read_env(self, env_offset: int) -> Tuple[str, Dict]:
+        mm = self._mm
+        pos = self._body + env_offset
+        id_offset, id_len, name_offset, name_len, nb_vars = _ENV_ENTRY.unpack_from(mm, pos)
+        dct = OrderedDict()
+        dct[_NAME] = self._str(name_offset, name_len)
+        pos += _ENV_ENTRY.size
+        for _ in range(nb_vars):
+            name_offset, name_len, kind, value_offset, value_len = _VAR_ENTRY.unpack_from(mm, pos)
+            value = self._str(value_offset, value_len)
+            if kind == _KIND_LIST_OPS:
+                value = json.loads(value)
+            elif kind != _KIND_STR:
+                value = _LAZY_TYPES[kind](value)
+            dct[self._str(name_offset, name_len)] = value
+            pos += _VAR_ENTRY.size
+        return self._str(id_offset, id_len), dct
+
+    def _env_offsets(self) -> List[int]:
+        start = self._body + self._order_offset
+        return [_U32.unpack_from(self._mm, start + i * _U32.size)[0] for i in range(self._nb_envs)]
+
+    def get_available_envs(self) -> List[str]:
+        """
+        :return: the list of environment ids in the bundle, in the configuration order
+        """
+        ids = []
+        for env_offset in self._env_offsets():
+            id_offset, id_len = _ENV_ENTRY.unpack_from(self._mm, self._body + env_offset)[:2]
+            ids.append(self._str(id_offset, id_len))
+        return ids
+
+    def get_env(self, env_id: str) -> EnvConfig:
+        """
+        Returns environment 'id', deserialized from the bundle, or throws an error if that environment id does not
+        exist. Each call returns a new EnvConfig.
+
+        :param env_id:
+        :return:
+        """
+        env_offset = self._find(env_id)
+        if env_offset is None:
+            raise UnknownEnvIdException.create_from(env_id, self.get_available_envs())
+        return EnvConfig(*self._read_env(env_offset))
+
+    def to_config(self) -> GlobalEnvsConfig:
+        """
+        Deserializes the whole bundle
+
+        :return:
+        """
+        return GlobalEnvsConfig(OrderedDict(self._read_env(env_offset) for env_offset in self._env_offsets()))
+
+
+def load_bundle(bundle_path: str) -> GlobalEnvsConfig:
+    """
+    Loads the whole configuration in a bundle. If the bundle can not be used (outdated, corrupted, or compiled by
+    another version) and its source configuration is available, the source is loaded instead.
+
+    :param bundle_path:
+    :return:
+    """
+    try:
+        with EnvsBundle(bundle_path) as bundle:
+            return bundle.to_config()
+    except InvalidBundleException as e:
+        if e.source_path is None or not os.path.exists(e.source_path):
+            raise
+        logger.warning(str(e) + ". Loading '" + e.source_path + "' instead")
+        from envswitch.formats import read_config
+        return read_config(e.source_path)
@@ -1,19 +1,50 @@
+from time import strftime, localtime
+
+import builtins
+import os
+import subprocess
+import sys
+
 import click
 
+from envswitch.bundle import compile_bundle
+from envswitch.diff import diff_configs, diff_envs, format_unified, to_json as diff_to_json
+from envswitch.env_overlay import build_child_env, load_config, load_env
+from envswitch.formats import get_formats, read_config, write_config
+
+from envswitch.history import EnvHistory, restore_snapshot
+from envswitch.matrix import run_matrix, select_envs, format_matrix_summary, to_junit_xml, to_json, PASSED
+from envswitch.multi_root import apply_to_roots, format_roots_report
+from envswitch.proc_env import get_process_cmdline, get_process_user, inspect_process, find_stale_processes
+from envswitch.status import get_status
+from envswitch.tracing import configure_logging, enable_profiling
 from envswitch.utils import get_version
 from envswitch.gui import EnvSwitcherAppHeadless
 
-
 @click.command()
 @click.argument('env_id')
 @click.option('--env_file', '-f', type=click.Path(exists=True),
-              help='Uses the specified *.yml or *.yaml environment definition file instead of the last one opened in '
-                   'the Envswitch GUI.')
-def apply(env_id, env_file=None):
+              help='Uses the specified *.yml or *.yaml environment definition file, or directory of such files, '
+                   'instead of the last one opened in the Envswitch GUI.')
+@click.option('--whole_machine', '-m', is_flag=True, default=False,
+              help='Sets the variables for the whole machine instead of the current user.')
+@click.option('--root', '-r', 'roots', multiple=True, type=click.Path(file_okay=False),
+              help='Applies the environment into the specified target root directory instead of the current user: a '
+                   'user home, or an image root file system with --whole_machine. May be repeated.')
+@click.option('--jobs', '-j', type=int, default=None,
+              help='The maximum number of target roots written concurrently.')
+def apply(env_id, env_file=None, whole_machine=False, roots=(), jobs=None):
     """ see below for true help, this one disappears during cx_Freeze packaging """
     a = EnvSwitcherAppHeadless(config_file_path=env_file)
     try:
-        a.get_current_config().apply(env_id)
+        if len(roots) > 0:
+            results = apply_to_roots(a.get_env(env_id), roots, whole_machine=whole_machine, max_workers=jobs)
+            print(format_roots_report(results))
+            if not all(r.is_ok() for r in results):
+                print('**ERROR** could not apply into some of the roots')
+                return
+        else:
+            a.get_env(env_id).apply(whole_machine=whole_machine)
     except Exception as e:
         print('**ERROR** ' + str(e))
         return
@@ -25,18 +56,20 @@ apply.help = "Applies environment ENV_ID: sets all environment variables defined
              "By default, the definition for environment ENV_ID is looked up in the last configuration " \
              "file opened with the Envswitch GUI. Alternatively you may specify a different configuration" \
              " file with --env_file or -f. \n\n" \
-             "You may wish to use 'envswitch list' to get a list of environment ids available."
+             "You may wish to use 'envswitch list' to get a list of environment ids available. \n\n" \
+             "With one or several --root options, the environment is written into each target root directory " \
+             "concurrently (for example user homes or image root file systems, linux only) and a report is printed."
 
 
 @click.command()
 @click.option('--env_file', '-f', type=click.Path(exists=True),
-              help='Uses the specified *.yml or *.yaml environment definition file instead of the last one opened in '
-                   'the Envswitch GUI.')
+              help='Uses the specified *.yml or *.yaml environment definition file, or directory of such files, '
+                   'instead of the last one opened in the Envswitch GUI.')
 def list(env_file=None):
     """ see below for true help, this one disappears during cx_Freeze packaging """
     a = EnvSwitcherAppHeadless(config_file_path=env_file)
     file_path = a.get_current_config_file_path()
-    envs_list = a.get_current_config().get_available_envs()
+    envs_list = a.get_available_envs()
     print("Environments available in '" + file_path + "': " + str(envs_list))
 
 
@@ -52,16 +85,337 @@ def open(env_file):
     a.persist_last_opened_file()
 
 
-open.help = "Opens the specified *.yml or *.yaml environment definition file, so that it will be the default one " \
-            "available the next time a command is executed or the next time the GUI is launched"
+open.help = "Opens the specified *.yml or *.yaml environment definition file, or directory of such files, so that " \
+            "it will be the default one available the next time a command is executed or the next time the GUI is " \
+            "launched"
+
+
+@click.command()
+@click.option('--env_file', '-f', type=click.Path(exists=True),
+              help='Uses the specified *.yml or *.yaml environment definition file, or directory of such files, '
+                   'instead of the last one opened in the Envswitch GUI.')
+@click.option('--whole_machine', '-m', is_flag=True, default=False,
+              help='Checks the variables defined for the whole machine instead of the current user.')
+def status(env_file=None, whole_machine=False):
+    """ see below for true help, this one disappears during cx_Freeze packaging """
+    a = EnvSwitcherAppHeadless(config_file_path=env_file)
+    statuses = get_status(a.get_current_config(), whole_machine=whole_machine)
+    _print_statuses(statuses, 'Active environment(s): ', 'No environment is fully active')
+
+
+def _print_statuses(statuses, exact_prefix, no_exact_msg):
+    """ Prints the environments matching exactly, then the variables of the others that do not match """
+    exact = [s for s in statuses if s.is_exact_match()]
+    if len(exact) > 0:
+        print(exact_prefix + ', '.join("'" + s.name + "' (" + s.env_id + ")" for s in exact))
+    else:
+        print(no_exact_msg)
+
+    for s in statuses:
+        if not s.is_exact_match():
+            print("'%s' (%s): %s/%s variables match" % (s.name, s.env_id, s.nb_matching, s.nb_vars))
+            for var_name, (expected, current) in s.drift.items():
+                print('    %s: expected %r, current %r' % (var_name, expected, current))
+            for var_name in s.unknown:
+                print('    %s: only known when the environment is applied, not compared' % var_name)
+
+
+status.help = "Shows which environment(s) of the configuration file are currently active, by comparing their " \
+              "variables with the persisted ones. Environments that only partially match are listed with the " \
+              "variables that differ."
+
+
+@click.command()
+def undo():
+    """ see below for true help, this one disappears during cx_Freeze packaging """
+    try:
+        restore_snapshot()
+    except Exception as e:
+        print('**ERROR** ' + str(e))
+        return
+    print('**DONE**')
+
+
+undo.help = "Undoes the last environment application: restores the variables that were changed to their previous " \
+            "values. This can be repeated to go further back in the history."
+
+
+@click.command()
+@click.argument('snapshot_id', type=int)
+def restore(snapshot_id):
+    """ see below for true help, this one disappears during cx_Freeze packaging """
+    try:
+        restore_snapshot(snapshot_id)
+    except Exception as e:
+        print('**ERROR** ' + str(e))
+        return
+    print('**DONE**')
+
+
+restore.help = "Restores the variables to the state they had right before snapshot SNAPSHOT_ID was taken. Only the " \
+               "variables whose value differ are written. You may wish to use 'envswitch history' to get a list of " \
+               "snapshot ids available."
+
+
+@click.command()
+def history():
+    """ see below for true help, this one disappears during cx_Freeze packaging """
+    snapshots = EnvHistory().get_snapshots()
+    if len(snapshots) == 0:
+        print('History is empty')
+    for snapshot in reversed(snapshots):
+        print('%s  %s  before applying %r for %s: %s variable(s) changed'
+              % (snapshot.id, strftime('%Y-%m-%d %H:%M:%S', localtime(snapshot.time)), snapshot.env_id,
+                 'WHOLE MACHINE' if snapshot.whole_machine else 'CURRENT USER', len(snapshot.previous_values)))
+
+
+history.help = "Lists the snapshots available for 'envswitch restore', most recent first. A snapshot of the " \
+               "variables is taken each time an environment is applied."
+
+
+@click.command(context_settings=dict(ignore_unknown_options=True, allow_interspersed_args=False))
+@click.argument('env_id')
+@click.argument('command', nargs=-1, required=True, type=click.UNPROCESSED)
+@click.option('--env_file', '-f', type=click.Path(exists=True),
+              help='Uses the specified *.yml or *.yaml environment definition file, or directory of such files, '
+                   'instead of the last one opened in the Envswitch GUI.')
+@click.option('--spawn', is_flag=True, default=False,
+              help='Runs the command in a child process and waits for it, instead of replacing the envswitch process. '
+                   'This is always the case on Windows.')
+def run(env_id, command, env_file=None, spawn=False):
+    """ see below for true help, this one disappears during cx_Freeze packaging """
+    if command[0] == '--':
+        command = command[1:]
+    if len(command) == 0:
+        raise click.UsageError('Missing COMMAND')
+    try:
+        child_env = build_child_env(load_env(env_id, env_file))
+    except Exception as e:
+        print('**ERROR** ' + str(e))
+        sys.exit(1)
+
+    # the profiling report is written at exit, so the process can not be replaced in that case
+    if spawn or os.name == 'nt' or click.get_current_context().find_root().params.get('profile') is not None:
+        try:
+            returncode = subprocess.call(command, env=child_env)
+        except OSError as e:
+            print("**ERROR** could not run '" + command[0] + "': " + e.strerror)
+            returncode = 127
+        sys.exit(returncode)
+    else:
+        try:
+            os.execvpe(command[0], command, child_env)
+        except OSError as e:
+            print("**ERROR** could not run '" + command[0] + "': " + e.strerror)
+            sys.exit(127)
+
+
+run.help = "Runs COMMAND with environment ENV_ID: the variables of that environment are overlaid on the current " \
+           "ones for this command only, nothing is persisted. Use '--' to separate the command from the envswitch " \
+           "options, for example 'envswitch run no_proxy -- curl -v http://example.com'."
+
+
+@click.command(context_settings=dict(ignore_unknown_options=True, allow_interspersed_args=False))
+@click.argument('command', nargs=-1, required=True, type=click.UNPROCESSED)
+@click.option('--env_file', '-f', type=click.Path(exists=True),
+              help='Uses the specified *.yml or *.yaml environment definition file, or directory of such files, '
+                   'instead of the last one opened in the Envswitch GUI.')
+@click.option('--env', '-e', 'env_patterns', multiple=True,
+              help="Selects the environments whose id matches this pattern (for example 'proxy_*'). May be repeated. "
+                   "Default is all environments.")
+@click.option('--jobs', '-j', type=int, default=None, help='The maximum number of runs executed in parallel.')
+@click.option('--timeout', '-t', type=float, default=None, help='The maximum duration of each run, in seconds.')
+@click.option('--junit', type=click.Path(dir_okay=False), default=None,
+              help='Writes the results in this file as a JUnit xml report.')
+@click.option('--json', 'json_path', type=click.Path(dir_okay=False), default=None,
+              help='Writes the results, including the captured outputs, in this json file.')
+def matrix(command, env_file=None, env_patterns=(), jobs=None, timeout=None, junit=None, json_path=None):
+    """ see below for true help, this one disappears during cx_Freeze packaging """
+    if command[0] == '--':
+        command = command[1:]
+    if len(command) == 0:
+        raise click.UsageError('Missing COMMAND')
+    try:
+        envs = select_envs(load_config(env_file), env_patterns)
+    except Exception as e:
+        print('**ERROR** ' + str(e))
+        sys.exit(1)
+
+    results = run_matrix(envs, command, max_workers=jobs, timeout=timeout)
+
+    for r in results:
+        if r.status != PASSED:
+            print('---- %s (%s) ----' % (r.env_id, r.status.upper()))
+            print(r.output.rstrip('\n'))
+    print(format_matrix_summary(results))
+    if junit is not None:
+        with builtins.open(junit, 'w') as f:
+            f.write(to_junit_xml(results))
+    if json_path is not None:
+        with builtins.open(json_path, 'w') as f:
+            f.write(to_json(results))
+    sys.exit(0 if all(r.status == PASSED for r in results) else 1)
+
+
+matrix.help = "Runs COMMAND once per environment, in parallel, each time with the variables of that environment " \
+              "overlaid on the current ones. Nothing is persisted. The output of each run is captured, and a summary " \
+              "table is printed at the end, along with the output of the runs that failed. Use '--' to separate the " \
+              "command from the envswitch options, for example 'envswitch matrix -j 4 -e \"proxy_*\" -- pytest'."
+
+
+@click.command()
+@click.argument('src', type=click.Path(exists=True))
+@click.argument('dst', type=click.Path())
+@click.option('--from', 'src_format', type=click.Choice([f.name for f in get_formats()]), default=None,
+              help='The format of SRC. Default is to detect it from the extension or contents.')
+@click.option('--to', 'dst_format', type=click.Choice([f.name for f in get_formats() if f.save is not None]),
+              default=None, help='The format of DST. Default is to detect it from the extension.')
+def convert(src, dst, src_format=None, dst_format=None):
+    """ see below for true help, this one disappears during cx_Freeze packaging """
+    try:
+        config = read_config(src, src_format)
+        # the converted configuration is only saved once: nothing is cached
+        write_config(config, dst, dst_format, use_cache=False)
+    except Exception as e:
+        print('**ERROR** ' + str(e))
+        sys.exit(1)
+    print("Converted %s environment(s) from '%s' to '%s'" % (len(config.envs), src, dst))
+
+
+convert.help = "Converts the configuration file or directory SRC into DST, possibly in another format. Supported " \
+               "formats are yaml (*.yml, *.yaml), json (*.json), toml (*.toml), directories of yaml files (yaml-dir) " \
+               "and directories of dotenv files with one environment per file (dotenv-dir). Formats are detected " \
+               "from the file extensions or contents, use --from and --to for directories that do not exist yet."
+
+
+@click.command()
+@click.argument('src', type=click.Path(exists=True))
+@click.argument('bundle', type=click.Path(dir_okay=False))
+def compile(src, bundle):
+    """ see below for true help, this one disappears during cx_Freeze packaging """
+    try:
+        compile_bundle(read_config(src), bundle, source_path=src)
+    except Exception as e:
+        print('**ERROR** ' + str(e))
+        sys.exit(1)
+    print("Compiled '%s' into bundle '%s'" % (src, bundle))
+
+
+compile.help = "Compiles the configuration file or directory SRC into a read-only binary bundle file BUNDLE (*.esb), " \
+               "to distribute instead of the configuration. Commands open bundles with mmap and only read the " \
+               "environment they need, instead of parsing the whole configuration. The path to SRC is recorded in " \
+               "the bundle: if SRC is modified afterwards the bundle is considered outdated and SRC is used instead, " \
+               "until the bundle is compiled again."
+
+
+@click.command()
+@click.option('--pid', '-p', type=int, required=True, help='The id of the running process to inspect.')
+@click.option('--env_file', '-f', type=click.Path(exists=True),
+              help='Uses the specified *.yml or *.yaml environment definition file, or directory of such files, '
+                   'instead of the last one opened in the Envswitch GUI.')
+@click.option('--env', '-e', 'env_patterns', multiple=True,
+              help="Only compares with the environments whose id matches this pattern (for example 'proxy_*'). May be "
+                   "repeated. Default is all environments.")
+def inspect(pid, env_file=None, env_patterns=()):
+    """ see below for true help, this one disappears during cx_Freeze packaging """
+    try:
+        envs = select_envs(load_config(env_file), env_patterns)
+        statuses = inspect_process(pid, envs)
+        print('Process %s (%s): %s' % (pid, get_process_user(pid), get_process_cmdline(pid)))
+    except Exception as e:
+        print('**ERROR** ' + str(e))
+        sys.exit(1)
+    _print_statuses(statuses, 'Matching environment(s): ', 'No environment fully matches')
+
+
+inspect.help = "Shows which environment(s) of the configuration file are used by the running process PID, by " \
+               "comparing their variables with the environment of the process (read from /proc/PID/environ, linux " \
+               "only). This is the environment the process was started with: modifications done by the process " \
+               "itself are not visible. Inspecting the processes of other users requires root privileges."
+
+
+@click.command()
+@click.argument('env_id', required=False)
+@click.option('--env_file', '-f', type=click.Path(exists=True),
+              help='Uses the specified *.yml or *.yaml environment definition file, or directory of such files, '
+                   'instead of the last one opened in the Envswitch GUI.')
+@click.option('--jobs', '-j', type=int, default=None, help='The maximum number of threads scanning processes.')
+def stale(env_id=None, env_file=None, jobs=None):
+    """ see below for true help, this one disappears during cx_Freeze packaging """
+    try:
+        if env_id is None:
+            env_id = EnvHistory().get_snapshot().env_id
+        results, nb_unreadable = find_stale_processes(load_env(env_id, env_file), max_workers=jobs)
+    except Exception as e:
+        print('**ERROR** ' + str(e))
+        sys.exit(1)
+
+    if len(results) > 0:
+        print('%7s  %-12s  %s' % ('PID', 'USER', 'COMMAND'))
+    for p in results:
+        print('%7s  %-12s  %s' % (p.pid, p.user, p.cmdline or '?'))
+        for var_name, (expected, current) in p.stale_vars.items():
+            print('%7s  %-12s    %s: expected %r, current %r' % ('', '', var_name, expected, current))
+    print("%s process(es) still use old values of environment '%s'" % (len(results), env_id)
+          + (' (%s process(es) could not be read)' % nb_unreadable if nb_unreadable > 0 else ''))
+
+
+stale.help = "Lists the running processes (shells, services...) that still use old values of the variables of " \
+             "environment ENV_ID, for example because they were started before it was applied, and have to be " \
+             "restarted. Default is the last environment applied. Only the processes that define at least one of the " \
+             "variables are considered. Linux only: the environment of processes is read from /proc/PID/environ, and " \
+             "the processes of other users can only be read as root."
+
+
+@click.command()
+@click.argument('old')
+@click.argument('new')
+@click.option('--env_file', '-f', type=click.Path(exists=True),
+              help='Uses the specified *.yml or *.yaml environment definition file, or directory of such files, '
+                   'instead of the last one opened in the Envswitch GUI.')
+@click.option('--json', 'as_json', is_flag=True, default=False, help='Prints the differences as a json document.')
+def diff(old, new, env_file=None, as_json=False):
+    """ see below for true help, this one disappears during cx_Freeze packaging """
+    try:
+        if env_file is None and os.path.exists(old) and os.path.exists(new):
+            differences = diff_configs(read_config(old), read_config(new))
+        else:
+            config = load_config(env_file)
+            differences = diff_envs(config.get_env(old), config.get_env(new))
+    except Exception as e:
+        print('**ERROR** ' + str(e))
+        sys.exit(1)
+
+    if as_json:
+        print(diff_to_json(differences))
+    elif differences.is_empty():
+        print('No differences')
+    else:
+        print(format_unified(differences, old, new))
+
+
+diff.help = "Shows the differences between environments OLD and NEW of the configuration file, or between the " \
+            "configuration files or directories OLD and NEW (environments are then matched by id): the variables " \
+            "added, removed and changed, in unified diff style or as json with --json."
 
 
 # Note: we have to explicitly list the commands here otherwise the cx-frozen version does not find them
-@click.group(commands={'apply': apply, 'list': list, 'open': open}, no_args_is_help=True)
+@click.group(commands={'apply': apply, 'list': list, 'open': open, 'status': status, 'undo': undo,
+                       'restore': restore, 'history': history, 'run': run,
+                       'matrix': matrix, 'convert': convert, 'compile': compile, 'inspect': inspect,
+                       'stale': stale, 'diff': diff}, no_args_is_help=True)
 @click.version_option(version=get_version())
-def cli():
+@click.option('--profile', type=click.Path(dir_okay=False), default=None,
+              help='Dumps a json report of the time spent in each phase (import, parse, validation, backend writes...) '
+                   'in the specified file at exit. If the file extension is .prof, cProfile stats are dumped instead.')
+def cli(profile=None):
     """ see below for true help, this one disappears during cx_Freeze packaging """
-    print('*** ENVSWITCH <' + get_version() + '> ***')
+    if click.get_current_context().invoked_subcommand != 'run':
+        # do not alter the output of the command launched with 'run'
+        print('*** ENVSWITCH <' + get_version() + '> ***')
+    configure_logging()
+    if profile is not None:
+        enable_profiling(profile)
 
 
 cli.help = "Envswitch commandline. Use 'envswitch COMMAND --help' to get help on any specific command below."
@@ -0,0 +1,178 @@
+import sys
+from collections.abc import MutableMapping
+from weakref import WeakValueDictionary
+
+
+class KeysTable:
+    """
+    An immutable, ordered table of keys with an index from key to position. Tables are shared by all CompactDict
+    instances that have the same keys in the same order, see `get_keys_table`.
+    """
+    __slots__ = ('keys', 'index', '__weakref__')
+
+    def __init__(self, keys: tuple):
+        self.keys = keys
+        self.index = {key: i for i, key in enumerate(keys)}
+
+
+# all the keys tables currently in use. A table disappears when no CompactDict uses it anymore
+_KEYS_TABLES = WeakValueDictionary()
+
+
+def get_keys_table(keys: tuple) -> KeysTable:
+    """
+    Returns the shared KeysTable for the given tuple of keys, creating it if needed
+
+    :param keys:
+    :return:
+    """
+    table = _KEYS_TABLES.get(keys)
+    if table is None:
+        table = KeysTable(keys)
+        _KEYS_TABLES[keys] = table
+    return table
+
+
+def item_hash(key, value) -> int:
+    """ Returns the hash of a (key, value) pair """
+    return hash((key, value))
+
+
+def items_hash(items) -> int:
+    """
+    Returns an order-independent hash of (key, value) pairs with unique keys. It is the xor of the hashes of all
+    pairs (see `item_hash`), so that it can be updated incrementally when a single pair changes.
+
+    :param items: an iterable of (key, value) pairs
+    :return:
+    """
+    res = 0
+    for key, value in items:
+        res ^= item_hash(key, value)
+    return res
+
+
+def _intern(value):
+    """ Interns strings so that identical values are only stored once in memory. Other objects are left as is. """
+    return sys.intern(value) if type(value) is str else value
+
+
+class CompactDict(MutableMapping):
+    """
+    An ordered mapping with a compact memory footprint, designed for the many environments of large configurations.
+
+    * the keys are stored in a KeysTable shared with all other CompactDicts having the same keys in the same order,
+    * the values are stored in a plain list, and string values are interned so that identical values (proxy hosts, CA
+      bundle paths...) are stored only once.
+
+    Adding or removing a key switches to another shared table; modifying the value of an existing key is as cheap as
+    in a dict.
+
+    Once computed, the content hash is updated incrementally on each modification, and the owner (see `set_owner`) is
+    notified so that values derived from the contents (for example their serialized form) can be invalidated. The owner
+    also checks the values assigned, so values must be hashable.
+    """
+    __slots__ = ('_table', '_values', '_hash', '_owner')
+
+    def __init__(self, items=None):
+        """
+        Constructor with optional initial contents.
+
+        :param items: an optional mapping or iterable of (key, value) pairs
+        """
+        keys = []
+        values = []
+        if items is not None:
+            for key, value in (items.items() if hasattr(items, 'items') else items):
+                keys.append(_intern(key))
+                values.append(_intern(value))
+        self._table = get_keys_table(tuple(keys))
+        self._values = values
+        self._hash = None
+        self._owner = None
+        if len(self._table.index) != len(keys):
+            raise ValueError('Duplicate keys: ' + repr(keys))
+
+    def __getitem__(self, key):
+        return self._values[self._table.index[key]]
+
+    def __setitem__(self, key, value):
+        if self._owner is not None:
+            value = self._owner.check_item(key, value)
+        i = self._table.index.get(key)
+        previous_hash = self._hash
+        if previous_hash is not None:
+            # note: computed first, so that nothing is modified if the value is not hashable
+            self._hash = previous_hash ^ item_hash(key, value) ^ (0 if i is None else item_hash(key, self._values[i]))
+        if i is None:
+            self._table = get_keys_table(self._table.keys + (_intern(key),))
+            self._values.append(_intern(value))
+        else:
+            self._values[i] = _intern(value)
+        self._changed(previous_hash)
+
+    def __delitem__(self, key):
+        i = self._table.index[key]
+        keys = self._table.keys
+        self._table = get_keys_table(keys[:i] + keys[i + 1:])
+        previous_hash = self._hash
+        if previous_hash is not None:
+            self._hash = previous_hash ^ item_hash(key, self._values[i])
+        del self._values[i]
+        self._changed(previous_hash)
+
+    def _changed(self, previous_hash):
+        if self._owner is not None:
+            self._owner.on_variables_changed(previous_hash)
+
+    def set_owner(self, owner):
+        """
+        Sets the object to notify after each modification: `owner.on_variables_changed(previous_hash)` is called with
+        the content hash before the modification (None if it was never computed). Before an assignment,
+        `owner.check_item(key, value)` is called: it raises an error if the item is invalid, and returns the value to
+        store. Copies have no owner.
+
+        :param owner: the owner, or None
+        :return:
+        """
+        self._owner = owner
+
+    def __contains__(self, key):
+        return key in self._table.index
+
+    def __iter__(self):
+        return iter(self._table.keys)
+
+    def __len__(self):
+        return len(self._values)
+
+    def copy(self):
+        res = CompactDict.__new__(CompactDict)
+        res._table = self._table
+        res._values = list(self._values)
+        res._hash = self._hash
+        res._owner = None
+        return res
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        # keys table is immutable and strings are immutable too, so a shallow copy is enough
+        return self.copy()
+
+    def content_hash(self) -> int:
+        """
+        Returns a hash of the contents of this dictionary (keys and values, regardless of order), see `items_hash`. It
+        is computed once and then maintained on each modification.
+
+        :return:
+        """
+        if self._hash is None:
+            self._hash = items_hash(zip(self._table.keys, self._values))
+        return self._hash
+
+    def __reduce__(self):
+        return CompactDict, (list(zip(self._table.keys, self._values)),)
+
+    def __repr__(self):
+        return 'CompactDict(' + repr(list(zip(self._table.keys, self._values))) + ')'
@@ -0,0 +1,235 @@
+import json
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Tuple
+
+from envswitch.env_config import EnvConfig, GlobalEnvsConfig
+from envswitch.list_vars import ListVarOps
+
+
+class EnvDiff:
+    """
+    The differences between two environments: variables added, removed and changed, and name change
+    """
+    __slots__ = ('old_id', 'new_id', 'old_name', 'new_name', 'added', 'removed', 'changed')
+
+    def __init__(self, old_id: str, new_id: str, old_name: str, new_name: str, added: Dict[str, Any],
+                 removed: Dict[str, Any], changed: Dict[str, Tuple[Any, Any]]):
+        """
+        :param old_id:
+        :param new_id:
+        :param old_name:
+        :param new_name:
+        :param added: a dictionary var name -> value for the variables only defined in the new environment
+        :param removed: a dictionary var name -> value for the variables only defined in the old environment
+        :param changed: a dictionary var name -> (old value, new value) for the variables whose value changed
+        """
+        self.old_id = old_id
+        self.new_id = new_id
+        self.old_name = old_name
+        self.new_name = new_name
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __repr__(self):
+        return 'EnvDiff(' + repr(self.old_id) + ', ' + repr(self.new_id) + ', +' + str(len(self.added)) + ' -' \
+               + str(len(self.removed)) + ' ~' + str(len(self.changed)) + ')'
+
+    def is_empty(self) -> bool:
+        return self.old_name == self.new_name and not (self.added or self.removed or self.changed)
+
+    def to_dict(self) -> Dict[str, Any]:
+        dct = OrderedDict()
+        dct['old_id'] = self.old_id
+        dct['new_id'] = self.new_id
+        if self.old_name != self.new_name:
+            dct['name'] = [self.old_name, self.new_name]
+        dct['added'] = OrderedDict((k, _to_json_value(v)) for k, v in self.added.items())
+        dct['removed'] = OrderedDict((k, _to_json_value(v)) for k, v in self.removed.items())
+        dct['changed'] = OrderedDict((k, [_to_json_value(old), _to_json_value(new)])
+                                     for k, (old, new) in self.changed.items())
+        return dct
+
+
+class ConfigDiff:
+    """
+    The differences between two configurations: environments added, removed and changed
+    """
+    __slots__ = ('added_envs', 'removed_envs', 'changed_envs')
+
+    def __init__(self, added_envs: List[EnvConfig], removed_envs: List[EnvConfig], changed_envs: List[EnvDiff]):
+        """
+        :param added_envs: the environments only defined in the new configuration
+        :param removed_envs: the environments only defined in the old configuration
+        :param changed_envs: the differences of the environments defined in both configurations, that changed
+        """
+        self.added_envs = added_envs
+        self.removed_envs = removed_envs
+        self.changed_envs = changed_envs
+
+    def __repr__(self):
+        return 'ConfigDiff(+' + str(len(self.added_envs)) + ' -' + str(len(self.removed_envs)) + ' ~' \
+               + str(len(self.changed_envs)) + ')'
+
+    def is_empty(self) -> bool:
+        return not (self.added_envs or self.removed_envs or self.changed_envs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        dct = OrderedDict()
+        dct['added'] = OrderedDict((env.id, _env_to_json(env)) for env in self.added_envs)
+        dct['removed'] = OrderedDict((env.id, _env_to_json(env)) for env in self.removed_envs)
+        dct['changed'] = [d.to_dict() for d in self.changed_envs]
+        return dct
+
+
+def _to_text(value: Any) -> str:
+    return value if isinstance(value, str) else str(value)
+
+
+def _to_json_value(value: Any) -> Any:
+    """ ListVarOps are represented with their configuration dictionary, and lazy values with their tagged source """
+    if isinstance(value, ListVarOps):
+        return value.to_dict()
+    return _to_text(value)
+
+
+def _env_to_json(env: EnvConfig) -> Dict[str, Any]:
+    dct = OrderedDict()
+    dct['name'] = env.name
+    dct['variables'] = OrderedDict((k, _to_json_value(v)) for k, v in env.env_variables_dct.items())
+    return dct
+
+
+_MISSING = object()
+
+
+def diff_envs(old: EnvConfig, new: EnvConfig) -> EnvDiff:
+    """
+    Compares two environments in a single pass over the variables of each: variables are looked up by name in the
+    other environment, so the cost is linear in the number of variables and does not depend on their order.
+
+    :param old:
+    :param new:
+    :return:
+    """
+    old_vars = old.env_variables_dct
+    new_vars = new.env_variables_dct
+    removed = OrderedDict()
+    changed = OrderedDict()
+    for name, old_value in old_vars.items():
+        new_value = new_vars.get(name, _MISSING)
+        if new_value is _MISSING:
+            removed[name] = old_value
+        elif new_value != old_value:
+            changed[name] = (old_value, new_value)
+    added = OrderedDict((name, value) for name, value in new_vars.items() if name not in old_vars)
+    return EnvDiff(old.id, new.id, old.name, new.name, added, removed, changed)
+
+
+def diff_configs(old: GlobalEnvsConfig, new: GlobalEnvsConfig) -> ConfigDiff:
+    """
+    Compares two configurations, environment by environment (environments are matched by id). Environments whose
+    content hashes differ (see EnvConfig.content_hash) are known to differ in constant time, and identical ones are
+    skipped, so comparing two large catalogs that differ on a few environments only walks the variables of those
+    environments. Neither configuration is converted to yaml. The environments generated by templates are compared
+    too, but only the ones of templates that are not identical in both configurations are generated.
+
+    :param old:
+    :param new:
+    :return:
+    """
+    removed_envs = []
+    changed_envs = []
+    compared = set()
+
+    def _compare(old_env: EnvConfig, new_env: EnvConfig):
+        if old_env != new_env:
+            env_diff = diff_envs(old_env, new_env)
+            # environments that only differ by the order of their variables are not reported
+            if not env_diff.is_empty():
+                changed_envs.append(env_diff)
+
+    for old_env in _envs_to_compare(old, new):
+        compared.add(old_env.id)
+        new_env = new.find_env(old_env.id)
+        if new_env is None:
+            removed_envs.append(old_env)
+        else:
+            _compare(old_env, new_env)
+
+    added_envs = []
+    for new_env in _envs_to_compare(new, old):
+        if new_env.id in compared:
+            continue
+        old_env = old.find_env(new_env.id)
+        if old_env is None:
+            added_envs.append(new_env)
+        else:
+            # an environment generated by the same template in both, but defined explicitly in `new`
+            _compare(old_env, new_env)
+    return ConfigDiff(added_envs, removed_envs, changed_envs)
+
+
+def _envs_to_compare(config: GlobalEnvsConfig, other: GlobalEnvsConfig) -> Iterator[EnvConfig]:
+    """ The environments of `config`, except the ones generated by templates that are identical in `other` """
+    for env in config.envs.values():
+        yield env
+    for template_name, template in config.templates.items():
+        if other.templates.get(template_name) == template:
+            continue
+        for env_id in template.iter_env_ids():
+            if env_id not in config.envs:
+                yield template.get_env(env_id)
+
+
+def _format_env_lines(env_diff: EnvDiff, suffix: str = '') -> List[str]:
+    header = env_diff.old_id if env_diff.old_id == env_diff.new_id else env_diff.old_id + ' -> ' + env_diff.new_id
+    lines = ['@@ ' + header + ' @@' + suffix]
+    if env_diff.old_name != env_diff.new_name:
+        lines.append('-name: ' + env_diff.old_name)
+        lines.append('+name: ' + env_diff.new_name)
+    for name, value in env_diff.removed.items():
+        lines.append('-' + name + ': ' + _to_text(value))
+    for name, (old_value, new_value) in env_diff.changed.items():
+        lines.append('-' + name + ': ' + _to_text(old_value))
+        lines.append('+' + name + ': ' + _to_text(new_value))
+    for name, value in env_diff.added.items():
+        lines.append('+' + name + ': ' + _to_text(value))
+    return lines
+
+
+def format_unified(diff, old_label: str = 'old', new_label: str = 'new') -> str:
+    """
+    Returns a unified-diff-like text for an EnvDiff or a ConfigDiff: one '@@ env_id @@' section per environment, with
+    '-' lines for old values and '+' lines for new values. Removed and added environments are listed with all their
+    variables.
+
+    :param diff: an EnvDiff or a ConfigDiff
+    :param old_label:
+    :param new_label:
+    :return:
+    """
+    lines = ['--- ' + old_label, '+++ ' + new_label]
+    if isinstance(diff, EnvDiff):
+        lines += _format_env_lines(diff)
+    else:
+        for env in diff.removed_envs:
+            lines += _format_env_lines(EnvDiff(env.id, env.id, env.name, env.name, OrderedDict(),
+                                               OrderedDict(env.env_variables_dct.items()), OrderedDict()), ' removed')
+        for env_diff in diff.changed_envs:
+            lines += _format_env_lines(env_diff)
+        for env in diff.added_envs:
+            lines += _format_env_lines(EnvDiff(env.id, env.id, env.name, env.name,
+                                               OrderedDict(env.env_variables_dct.items()), OrderedDict(),
+                                               OrderedDict()), ' added')
+    return '\n'.join(lines)
+
+
+def to_json(diff) -> str:
+    """
+    Returns an EnvDiff or a ConfigDiff as a json document
+
+    :param diff:
+    :return:
+    """
+    return json.dumps(diff.to_dict(), indent=2)
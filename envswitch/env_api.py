@@ -1,5 +1,7 @@
 import os
 import platform
+from collections import OrderedDict
+from contextlib import contextmanager
 
 
 # --not needed anymore
@@ -9,7 +11,10 @@ import platform
 # except RuntimeError:
 #     # normal the second time this is called (or in the spawned processes)
 #     pass
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, Optional
+
+from envswitch.list_vars import as_list_var_ops
+from envswitch.tracing import span, count
 
 
 def print_external_env_var(var_name, whole_machine: bool=False):
@@ -43,13 +48,16 @@ def get_external_env_var(var_name, whole_machine: bool=False):
     :return:
     """
     case = check_platform_and_get_case()
+    count('vars_read')
     if case is WINDOWS:
         from envswitch.env_api_winimpl import get_env_with_cmd_win
-        return get_env_with_cmd_win(var_name, whole_machine=whole_machine)
+        with span('backend.read'):
+            return get_env_with_cmd_win(var_name, whole_machine=whole_machine)
 
     elif case is LINUX:
         from envswitch.env_api_linuximpl import get_env_with_cmd_linux
-        return get_env_with_cmd_linux(var_name, whole_machine=whole_machine)
+        with span('backend.read'):
+            return get_env_with_cmd_linux(var_name, whole_machine=whole_machine)
 
     else:
         raise NotImplementedError('Code for this platform is missing in envswitch, please create an issue '
@@ -71,10 +79,103 @@ def get_external_env_var(var_name, whole_machine: bool=False):
     # return res
 
 
+def get_external_env_vars(var_names: Iterable[str], whole_machine: bool=False, root: str=None) \
+        -> Dict[str, Optional[str]]:
+    """
+    Bulk version of get_external_env_var: reads the persisted values of several variables in a single pass on the
+    backend (the registry key or the environment file is opened only once).
+
+    :param var_names:
+    :param whole_machine: if True the env variables will be read from the MACHINE level. If False it will be read from
+    USER level
+    :param root: an optional target root directory (a user home, or an image root file system if whole_machine is
+    True) to read from instead of the current user or machine. Only supported on linux.
+    :return: a dictionary of variable name -> value, where value is None if the variable is not defined
+    """
+    var_names = tuple(var_names)
+    case = check_platform_and_get_case(root)
+    count('vars_read', len(var_names))
+    if case is WINDOWS:
+        from envswitch.env_api_winimpl import get_envs_with_cmd_win
+        with span('backend.read'):
+            return get_envs_with_cmd_win(var_names, whole_machine=whole_machine)
+
+    elif case is LINUX:
+        from envswitch.env_api_linuximpl import get_envs_with_cmd_linux
+        with span('backend.read'):
+            return get_envs_with_cmd_linux(var_names, whole_machine=whole_machine, root=root)
+
+    else:
+        raise NotImplementedError('Code for this platform is missing in envswitch, please create an issue '
+                                  'on the github project page and optionally propose a pull request')
+
+
+# incremented each time this process writes to the backend
+_write_generation = 0
+
+
+def get_backend_generation(whole_machine: bool=False):
+    """
+    Returns a value that changes whenever the persisted environment variables may have changed, either because this
+    process wrote them or because the backend store was modified by another process. It can be used to cache anything
+    computed from the persisted values.
+
+    :param whole_machine: if True the MACHINE level store is checked, otherwise the USER level store
+    :return:
+    """
+    return _write_generation, get_store_generation(whole_machine)
+
+
+def get_store_generation(whole_machine: bool=False):
+    """
+    Returns a value that changes whenever the backend store is modified, by any process. Contrary to
+    get_backend_generation it does not depend on the current process, so it can be persisted to cache results across
+    processes. It is a json-able value.
+
+    :param whole_machine: if True the MACHINE level store is checked, otherwise the USER level store
+    :return:
+    """
+    case = check_platform_and_get_case()
+    if case is WINDOWS:
+        from envswitch.env_api_winimpl import get_store_generation_win
+        return get_store_generation_win(whole_machine=whole_machine)
+
+    elif case is LINUX:
+        from envswitch.env_api_linuximpl import get_store_generation_linux
+        return get_store_generation_linux(whole_machine=whole_machine)
+
+    else:
+        raise NotImplementedError('Code for this platform is missing in envswitch, please create an issue '
+                                  'on the github project page and optionally propose a pull request')
+
+
 WINDOWS = 1
 LINUX = 2
 
 
+@contextmanager
+def store_transaction(whole_machine: bool = False, root: str = None):
+    """
+    A context manager grouping the reads and writes of persisted variables performed inside it into a single
+    transaction, protected from other processes (for example two 'envswitch apply' launched at the same time by login
+    scripts and cron jobs). Writers take an exclusive lock, while readers never block. Transactions may be nested.
+
+    On linux this is an exclusive flock on the environment file, see env_api_linuximpl.store_lock_linux. On windows
+    each registry value is written atomically and there is no lock.
+
+    :param whole_machine: if True the MACHINE level store is locked, otherwise the USER level store
+    :param root: an optional target root directory, see set_env_variables_permanently
+    :return:
+    """
+    case = check_platform_and_get_case(root)
+    if case is LINUX:
+        from envswitch.env_api_linuximpl import store_lock_linux
+        with store_lock_linux(whole_machine, root=root):
+            yield
+    else:
+        yield
+
+
 def set_env_permanently(env_varname, env_value, also_apply_on_this_process: bool=True, whole_machine: bool = False):
     """
     Similar to os.setenv(var_name, value) but performs a permanent change, not just for the current process.
@@ -91,29 +192,57 @@ def set_env_permanently(env_varname, env_value, also_apply_on_this_process: bool
 
 
 def set_env_variables_permanently(key_value_pairs: Dict[str, Any], also_apply_on_this_process: bool=True,
-                                  whole_machine: bool = False):
+                                  whole_machine: bool = False, merge_list_variables: bool = True, root: str = None):
     """
     Similar to set_env_permanently but for a dictionary of environment variable names/value
 
+    Values may be strings or ListVarOps (see list_vars.py). List operations are merged with the current persisted
+    values, read from the backend in a single pass, so that all backends only receive plain strings. The read and the
+    write are performed in a single store_transaction, so that concurrent processes do not lose updates.
+
     :param key_value_pairs:
     :param also_apply_on_this_process:
     :param whole_machine: if True the env variables will be set at the MACHINE level. If False it will be done at
     USER level
+    :param merge_list_variables: if False, string values are written as is, even for PATH. This is used to restore
+    previous values.
+    :param root: an optional target root directory (a user home, or an image root file system if whole_machine is
+    True) to write into instead of the current user or machine. Only supported on linux.
     :return:
     """
-    # -- permanent (all new processes) application
-    case = check_platform_and_get_case()
-    if case is WINDOWS:
-        from envswitch.env_api_winimpl import set_env_variables_permanently_win
-        set_env_variables_permanently_win(key_value_pairs, whole_machine)
+    list_vars = [(var_name, ops) for var_name, ops in ((var_name, as_list_var_ops(var_name, value))
+                                                       for var_name, value in key_value_pairs.items())
+                 if ops is not None and (merge_list_variables or not isinstance(key_value_pairs[var_name], str))]
+    process_key_value_pairs = key_value_pairs
+    case = check_platform_and_get_case(root)
+    with store_transaction(whole_machine=whole_machine, root=root):
+        if len(list_vars) > 0:
+            current_values = get_external_env_vars([var_name for var_name, _ in list_vars],
+                                                   whole_machine=whole_machine, root=root)
+            key_value_pairs = OrderedDict(key_value_pairs)
+            process_key_value_pairs = OrderedDict(key_value_pairs)
+            for var_name, ops in list_vars:
+                key_value_pairs[var_name] = ops.merge(current_values[var_name])
+                # the process value may be different, for example PATH contains both MACHINE and USER entries
+                process_key_value_pairs[var_name] = ops.merge(os.environ.get(var_name))
 
-    elif case is LINUX:
-        from envswitch.env_api_linuximpl import set_env_variables_permanently_linux
-        set_env_variables_permanently_linux(key_value_pairs, whole_machine)
+        # -- permanent (all new processes) application
+        global _write_generation
+        _write_generation += 1
+        count('vars_written', len(key_value_pairs))
+        if case is WINDOWS:
+            from envswitch.env_api_winimpl import set_env_variables_permanently_win
+            with span('backend.write'):
+                set_env_variables_permanently_win(key_value_pairs, whole_machine)
 
-    else:
-        raise NotImplementedError('Code for this platform is missing in envswitch, please create an issue '
-                                  'on the github project page and optionally propose a pull request')
+        elif case is LINUX:
+            from envswitch.env_api_linuximpl import set_env_variables_permanently_linux
+            with span('backend.write'):
+                set_env_variables_permanently_linux(key_value_pairs, whole_machine, root=root)
+
+        else:
+            raise NotImplementedError('Code for this platform is missing in envswitch, please create an issue '
+                                      'on the github project page and optionally propose a pull request')
 
     # -- local (this commandline if any)
     # TODO next version
@@ -123,7 +252,7 @@ def set_env_variables_permanently(key_value_pairs: Dict[str, Any], also_apply_on
 
     # -- local (this running process) application. Only useful for usage within a python script
     if also_apply_on_this_process:
-        for var_name, value in key_value_pairs.items():
+        for var_name, value in process_key_value_pairs.items():
             if value:
                 os.environ[var_name] = value
             else:
@@ -134,15 +263,18 @@ def set_env_variables_permanently(key_value_pairs: Dict[str, Any], also_apply_on
                     pass
 
 
-def check_platform_and_get_case() -> int:
+def check_platform_and_get_case(root: str = None) -> int:
     """
     Checks that the OS and version is supported
+    :param root: if a target root directory is provided, also checks that the backend for this OS supports it
     :return:
     """
     system = platform.system()
     release = platform.release()
     version = platform.version()
     if system == 'Windows':
+        if root is not None:
+            raise NotImplementedError('Target root directories are only supported by the linux backend')
         return WINDOWS
     elif system == 'Linux':
         return LINUX
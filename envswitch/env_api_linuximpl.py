@@ -1,26 +1,223 @@
-from typing import Dict, Any
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, Optional, List
+from warnings import warn
 
+from envswitch.file_lock import exclusive_lock
+from envswitch.tracing import logger
 
-def get_env_with_cmd_linux(var_name, whole_machine: bool):
+# where environment variables are persisted. The user-level file is read by systemd user sessions (environment.d) and
+# may be sourced from the shell profile; the machine-level file is read by pam_env for all users.
+USER_STORE_PATH = os.path.join('.config', 'environment.d', '90-envswitch.conf')  # relative to the user home
+MACHINE_STORE_PATH = os.path.join('etc', 'environment')  # relative to the file system root
+
+
+def get_store_path(whole_machine: bool, root: str = None) -> str:
+    """
+    Returns the path to the file where environment variables are persisted.
+
+    A target root may be provided to write into another user's home or into an image root file system instead of the
+    current user's home or the current machine: the target root replaces the user home (for USER level) or the file
+    system root (for MACHINE level).
+
+    :param whole_machine: if True the MACHINE level file path is returned, otherwise the USER level file path
+    :param root: an optional target root directory
+    :return:
+    """
+    if whole_machine:
+        return os.path.join(root or os.sep, MACHINE_STORE_PATH)
+    else:
+        return os.path.join(root or os.path.expanduser('~'), USER_STORE_PATH)
+
+
+def get_store_generation_linux(whole_machine: bool, root: str = None):
+    """
+    Returns a value that changes whenever the environment file is modified (it is always replaced, never written in
+    place, so its inode changes too)
+
+    :param whole_machine:
+    :param root: an optional target root directory, see get_store_path
+    :return:
+    """
+    try:
+        st = os.stat(get_store_path(whole_machine, root))
+        return st.st_ino, st.st_mtime_ns, st.st_size
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def store_lock_linux(whole_machine: bool, root: str = None):
+    """
+    A context manager holding an exclusive inter-process lock (flock) on the environment file, so that the reads and
+    writes performed inside it form a single transaction: two processes applying environments at the same time are
+    serialized and no update is lost. The lock is taken on the directory containing the file, since the file itself is
+    replaced on each write. It is released when the context exits, or when the process dies.
+
+    Readers do not need the lock: the file is always replaced atomically (see write_store), so they always read a
+    consistent version and never block. The lock is re-entrant within a thread.
+
+    :param whole_machine:
+    :param root: an optional target root directory, see get_store_path
+    :return:
+    """
+    store_dir = os.path.dirname(get_store_path(whole_machine, root))
+    if not os.path.isdir(store_dir):
+        os.makedirs(store_dir, exist_ok=True)
+    with exclusive_lock(store_dir, 'backend.lock'):
+        yield
+
+
+def parse_line(line: str):
+    """
+    Parses a line of an environment file, of the form KEY=VALUE, KEY="VALUE" or export KEY='VALUE'.
+
+    :param line:
+    :return: a (key, value) tuple, or None if the line is empty, a comment or not a variable definition
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if line.startswith('export '):
+        line = line[len('export '):].lstrip()
+    key, sep, value = line.partition('=')
+    if not sep:
+        return None
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in ('"', "'"):
+        value = value[1:-1]
+    return key.strip(), value
+
+
+def read_store(store_path: str) -> Dict[str, str]:
     """
-    TODO: Similar to os.environ[var_name] but reads the environment variable as defined at the os MACHINE/SYSTEM level,
-    not the value of the environment variable in the current process context
+    Reads all variables in an environment file. A missing file is considered empty.
+
+    :param store_path:
+    :return: an ordered dictionary of variable name -> value
+    """
+    res = OrderedDict()
+    try:
+        with open(store_path, 'r') as f:
+            for line in f:
+                parsed = parse_line(line)
+                if parsed is not None:
+                    res[parsed[0]] = parsed[1]
+    except FileNotFoundError:
+        pass
+    return res
+
+
+def write_store(store_path: str, key_value_pairs: Dict[str, Any]):
+    """
+    Updates the variables in an environment file. Empty or None values delete the corresponding variable. All other
+    lines of the file (comments, other variables) are preserved, and new variables are appended at the end.
+
+    The new contents is written in a temporary file that then atomically replaces the original file, so that readers
+    always see a consistent file.
+
+    :param store_path:
+    :param key_value_pairs:
+    :return:
+    """
+    try:
+        with open(store_path, 'r') as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        lines = []
+
+    remaining = OrderedDict(key_value_pairs)
+    new_lines = []  # type: List[str]
+    for line in lines:
+        parsed = parse_line(line)
+        if parsed is not None and parsed[0] in key_value_pairs:
+            value = remaining.pop(parsed[0], None)
+            if value:
+                # replace the line. Note: if the variable is defined several times only the first one is kept
+                new_lines.append(format_line(parsed[0], value))
+        else:
+            new_lines.append(line)
+
+    for name, value in remaining.items():
+        if value:
+            new_lines.append(format_line(name, value))
+
+    store_dir = os.path.dirname(store_path)
+    if store_dir and not os.path.isdir(store_dir):
+        os.makedirs(store_dir)
+    tmp_path = store_path + '.tmp' + str(os.getpid())
+    with open(tmp_path, 'w') as f:
+        f.write('\n'.join(new_lines) + ('\n' if new_lines else ''))
+    os.replace(tmp_path, store_path)
+
+
+def format_line(name: str, value: str) -> str:
+    """
+    Formats a line of an environment file, that parse_line reads back.
+
+    :param name:
+    :param value:
+    :return: the line, without line break
+    """
+    return name + '="' + value + '"'
+
+
+def get_env_with_cmd_linux(var_name, whole_machine: bool, root: str = None):
+    """
+    Similar to os.environ[var_name] but reads the environment variable as persisted at the os USER (default) or
+    MACHINE level (if whole_machine = True), not the value of the environment variable in the current process context
 
     :param var_name:
     :param whole_machine: if True the env variables will be read from the MACHINE level. If False it will be read from
     USER level
+    :param root: an optional target root directory, see get_store_path
     :return:
     """
-    raise NotImplementedError()
+    store_path = get_store_path(whole_machine, root)
+    try:
+        return read_store(store_path)[var_name]
+    except KeyError:
+        warn("Environment variable '" + var_name + "' not found in '" + store_path + "'")
+        return ''
 
 
-def set_env_variables_permanently_linux(key_value_pairs: Dict[str, Any], whole_machine: bool):
+def get_envs_with_cmd_linux(var_names: Iterable[str], whole_machine: bool, root: str = None) \
+        -> Dict[str, Optional[str]]:
     """
-    TODO: Similar to os.environ[var_name] = var_value for all pairs provided, but instead of setting the variables in
-    the current process, sets the environment variables permanently at the os MACHINE/SYSTEM level.
+    Bulk version of get_env_with_cmd_linux: the environment file is read only once.
 
+    :param var_names:
     :param whole_machine: if True the env variables will be read from the MACHINE level. If False it will be read from
     USER level
+    :param root: an optional target root directory, see get_store_path
+    :return: a dictionary of variable name -> value, where value is None if the variable is not defined
+    """
+    store = read_store(get_store_path(whole_machine, root))
+    return OrderedDict((var_name, store.get(var_name)) for var_name in var_names)
+
+
+def set_env_variables_permanently_linux(key_value_pairs: Dict[str, Any], whole_machine: bool, root: str = None):
+    """
+    Similar to os.environ[var_name] = var_value for all pairs provided, but instead of setting the variables in
+    the current process, sets the environment variables permanently at the os USER (default) or MACHINE level (if
+    whole_machine = True), in the corresponding environment file (see get_store_path)
+
+    :param key_value_pairs: a dictionary of variable name+value to set
+    :param whole_machine: if True the env variables will be set at the MACHINE level. If False it will be done at
+    USER level
+    :param root: an optional target root directory, see get_store_path
     :return:
     """
-    raise NotImplementedError()
+    store_path = get_store_path(whole_machine, root)
+    for name, value in key_value_pairs.items():
+        if value:
+            logger.info("Setting ENV VARIABLE '" + name + "' to '" + value + "' in '" + store_path + "'")
+        else:
+            logger.info("Deleting ENV VARIABLE '" + name + "' from '" + store_path + "'")
+    try:
+        with store_lock_linux(whole_machine, root=root):
+            write_store(store_path, key_value_pairs)
+    except PermissionError as e:
+        raise Exception("Encountered a PermissionError while writing '" + store_path + "'. You may need to run this "
+                        "program as root").with_traceback(e.__traceback__)
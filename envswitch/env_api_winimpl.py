@@ -1,10 +1,13 @@
 import sys
-from typing import Dict, Any
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, Optional
 from warnings import warn
 from winreg import *
 
 import subprocess
 
+from envswitch.tracing import logger, span
+
 try:
     import win32gui, win32con
 except Exception as e:
@@ -50,6 +53,62 @@ def get_env_with_cmd_win(var_name, whole_machine: bool = False):
             pass
 
 
+def get_envs_with_cmd_win(var_names: Iterable[str], whole_machine: bool = False) -> Dict[str, Optional[str]]:
+    """
+    Bulk version of get_env_with_cmd_win: the registry key is opened only once for all variables.
+
+    :param var_names:
+    :param whole_machine: if True the env variables will be looked up in the MACHINE env variables. If False it will
+    be done at USER level
+    :return: a dictionary of variable name -> value, where value is None if the variable is not defined
+    """
+    try:
+        reg = ConnectRegistry(None, HKEY_LOCAL_MACHINE if whole_machine else HKEY_CURRENT_USER)
+        path = r'SYSTEM\CurrentControlSet\Control\Session Manager\Environment' if whole_machine else r'Environment'
+        key = _open_key(reg, path, whole_machine)
+        res = OrderedDict()
+        for var_name in var_names:
+            try:
+                res[var_name] = QueryValueEx(key, var_name)[0]
+            except FileNotFoundError:
+                res[var_name] = None
+        return res
+    finally:
+        # Always try to close everything in reverse order, silently
+        try:
+            CloseKey(key)
+        except:
+            pass
+        try:
+            CloseKey(reg)
+        except:
+            pass
+
+
+def get_store_generation_win(whole_machine: bool = False):
+    """
+    Returns the last modification time of the registry key where environment variables are stored
+
+    :param whole_machine:
+    :return:
+    """
+    try:
+        reg = ConnectRegistry(None, HKEY_LOCAL_MACHINE if whole_machine else HKEY_CURRENT_USER)
+        path = r'SYSTEM\CurrentControlSet\Control\Session Manager\Environment' if whole_machine else r'Environment'
+        key = _open_key(reg, path, whole_machine)
+        return QueryInfoKey(key)[2]
+    finally:
+        # Always try to close everything in reverse order, silently
+        try:
+            CloseKey(key)
+        except:
+            pass
+        try:
+            CloseKey(reg)
+        except:
+            pass
+
+
 def set_env_variables_permanently_win(key_value_pairs: Dict[str, Any], whole_machine: bool = False):
     """
     Similar to os.environ[var_name] = var_value for all pairs provided, but instead of setting the variables in the
@@ -71,16 +130,13 @@ def set_env_variables_permanently_win(key_value_pairs: Dict[str, Any], whole_mac
             # print all values..
             show_win(key)
         else:
+            # note: list variables such as PATH have already been merged with the current values in env_api
             for name, value in key_value_pairs.items():
-                if name.upper() == 'PATH':
-                    # TODO maybe remove this security ?
-                    warn('PATH can not be entirely changed. The value will be simply appended at the end.')
-                    value = query_value_win(path, key, name, whole_machine) + ';' + value
                 if value:
-                    print("Setting ENV VARIABLE '" + name + "' to '" + value + "'")
+                    logger.info("Setting ENV VARIABLE '" + name + "' to '" + value + "'")
                     SetValueEx(key, name, 0, REG_EXPAND_SZ, value)
                 else:
-                    print("Deleting ENV VARIABLE '" + name + "'")
+                    logger.info("Deleting ENV VARIABLE '" + name + "'")
                     try:
                         DeleteValue(key, name)
                     except FileNotFoundError:
@@ -89,9 +145,10 @@ def set_env_variables_permanently_win(key_value_pairs: Dict[str, Any], whole_mac
 
             # this hangs forever, see https://stackoverflow.com/questions/1951658/sendmessagehwnd-broadcast-hangs
             # win32gui.SendMessage(win32con.HWND_BROADCAST, win32con.WM_SETTINGCHANGE, 0, 'Environment')
-            print("Broadcasting change to other windows")
-            win32gui.SendMessageTimeout(win32con.HWND_BROADCAST, win32con.WM_SETTINGCHANGE, 0, 'Environment',
-                                        win32con.SMTO_ABORTIFHUNG, 1000)
+            logger.info("Broadcasting change to other windows")
+            with span('backend.broadcast'):
+                win32gui.SendMessageTimeout(win32con.HWND_BROADCAST, win32con.WM_SETTINGCHANGE, 0, 'Environment',
+                                            win32con.SMTO_ABORTIFHUNG, 1000)
 
     finally:
         # Always try to close everything in reverse order, silently
@@ -1,23 +1,51 @@
+import os
 from collections import OrderedDict
-from copy import copy
-from typing import Optional, Dict
+from copy import deepcopy
+from io import StringIO
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, Optional, Dict, Iterable, Iterator, List, Mapping, Tuple, Any
 
 import yaml
 from autoclass import check_var
-from envswitch.env_api import set_env_variables_permanently
+from envswitch.compact_dict import CompactDict
+from envswitch.env_api import set_env_variables_permanently, store_transaction
+from envswitch.history import EnvHistory, take_snapshot
+from envswitch.lazy_values import LazyValue, resolve_lazy_values
+from envswitch.list_vars import ListVarOps
+from envswitch.templates import TEMPLATES_KEY, EnvTemplate, load_templates
+from envswitch.tracing import logger, span, count
 
 from envswitch.yaml_ordered_dict import safe_load_ordered
+from envswitch.yaml_writer import EnvsYamlWriter
 
 _NAME = 'name'
 
+# the file extensions that are considered as configuration files when a configuration directory is opened
+YAML_EXTENSIONS = ('.yml', '.yaml')
+
+# name of the file where environments with no known source file are written when saving a configuration directory
+DEFAULT_DIR_FILE_NAME = 'envswitch.yml'
+
 
 class EnvConfig:
     """
-    Represents the configuration for a single environment
+    Represents the configuration for a single environment.
+
+    Large configurations may contain thousands of environments, so this class has no __dict__ and the variables are
+    stored in a CompactDict: variable names tables are shared across environments and identical values are stored once.
+
+    The content hash (see `content_hash`) is maintained when the name or the variables are modified, and the
+    configuration owning this environment is notified so that it can maintain its own hash.
     """
-    def __init__(self, env_id: str, env_variables: Dict[str, str]):
+    __slots__ = ('id', '_name', '_variables', '_yaml_fragment', '_owner')
+
+    def __init__(self, env_id: str, env_variables: Dict[str, Any]):
         """
-        Constructor with an environment id and variables
+        Constructor with an environment id and variables. Variable values are strings, except for list variables
+        such as PATH that may be described with a dictionary of list operations (see ListVarOps), and for values
+        resolved when the environment is applied (see LazyValue)
+
         :param env_id:
         :param env_variables:
         """
@@ -25,14 +53,119 @@ class EnvConfig:
         check_var(env_id, var_types=str, var_name='environment id')
         self.id = env_id
 
-        # environment variables list
-        for env_var, env_var_val in env_variables.items():
-            check_var(env_var, var_types=str, var_name='environment variable name')
-            check_var(env_var_val, var_types=str, var_name='environment variable value')
-        self.env_variables_dct = copy(env_variables)
+        # the configuration to notify of modifications, see GlobalEnvsConfig.on_env_changed
+        self._owner = None
+
+        # the last serialized form of this environment, see to_yaml_fragment
+        self._yaml_fragment = None
 
         # the name is a special variable that should be removed from the list
-        self.name = self.env_variables_dct.pop(_NAME) if _NAME in self.env_variables_dct else self.id
+        self._name = env_variables.get(_NAME, self.id)
+        check_var(self._name, var_types=str, var_name='environment name')
+        self._variables = CompactDict((env_var, self.check_item(env_var, env_var_val))
+                                      for env_var, env_var_val in env_variables.items() if env_var != _NAME)
+        self._variables.set_owner(self)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @name.setter
+    def name(self, name: str):
+        previous_hash = self.content_hash()
+        self._name = name
+        self._content_changed(previous_hash)
+
+    @property
+    def env_variables_dct(self) -> CompactDict:
+        return self._variables
+
+    @env_variables_dct.setter
+    def env_variables_dct(self, variables: Dict[str, Any]):
+        previous_hash = self.content_hash()
+        variables = CompactDict((env_var, self.check_item(env_var, env_var_val))
+                                for env_var, env_var_val in variables.items())
+        self._variables.set_owner(None)
+        self._variables = variables
+        self._variables.set_owner(self)
+        self._content_changed(previous_hash)
+
+    def content_hash(self) -> int:
+        """
+        Returns a hash of the id, name and variables of this environment. It is computed in constant time since the
+        hash of the variables is maintained on each modification.
+
+        :return:
+        """
+        return hash((self.id, self._name, self._variables.content_hash()))
+
+    @staticmethod
+    def check_item(env_var: str, env_var_val: Any) -> Any:
+        """
+        Checks the name and value of a variable, before it is stored in the variables CompactDict
+
+        :param env_var:
+        :param env_var_val: a string, a ListVarOps or its dictionary description, or a LazyValue
+        :return: the value to store: list operations written as a dictionary are converted to a ListVarOps
+        """
+        check_var(env_var, var_types=str, var_name='environment variable name')
+        check_var(env_var_val, var_types=[str, dict, ListVarOps, LazyValue], var_name='environment variable value')
+        return ListVarOps.from_dict(env_var_val) if isinstance(env_var_val, dict) else env_var_val
+
+    def on_variables_changed(self, previous_variables_hash: Optional[int]):
+        """
+        Called by the variables CompactDict after each modification
+
+        :param previous_variables_hash: the content hash of the variables before the modification
+        :return:
+        """
+        self._content_changed(hash((self.id, self._name, previous_variables_hash)))
+
+    def set_owner(self, owner):
+        """
+        Sets the configuration to notify after each modification: `owner.on_env_changed(previous_hash, self)` is
+        called. Copies have no owner.
+
+        :param owner: the owner, or None
+        :return:
+        """
+        self._owner = owner
+
+    def _content_changed(self, previous_hash: int):
+        self._yaml_fragment = None
+        if self._owner is not None:
+            self._owner.on_env_changed(previous_hash, self)
+
+    def __hash__(self):
+        return self.content_hash()
+
+    def __eq__(self, other):
+        if type(other) is not EnvConfig:
+            return False
+        # the hashes are maintained on each modification, so in most cases inequality is detected in constant time
+        return self is other or (self.content_hash() == other.content_hash() and self.id == other.id
+                                 and self._name == other._name
+                                 and list(self._variables.items()) == list(other._variables.items()))
+
+    def __deepcopy__(self, memo):
+        # variables are immutable, so copying the CompactDict is enough. The copy has no owner
+        res = EnvConfig.__new__(EnvConfig)
+        res.id = self.id
+        res._name = self._name
+        res._variables = self._variables.copy()
+        res._variables.set_owner(res)
+        res._yaml_fragment = self._yaml_fragment
+        res._owner = None
+        return res
+
+    def get_resolved_variables(self) -> Dict[str, Any]:
+        """
+        Returns the variables of this environment where the lazy values (`!file`, `!cmd`...) are resolved, see
+        lazy_values. Only the values of this environment are resolved.
+
+        :return:
+        """
+        return resolve_lazy_values(self.env_variables_dct)
 
     def __repr__(self):
         return self.name + '[' + self.id + '] : ' + repr(self.env_variables_dct)
@@ -44,21 +177,90 @@ class EnvConfig:
         """
         dct = OrderedDict()
         dct[_NAME] = self.name
-        dct.update(self.env_variables_dct)
+        for env_var, env_var_val in self.env_variables_dct.items():
+            dct[env_var] = env_var_val.to_dict() if isinstance(env_var_val, ListVarOps) else env_var_val
         return dct
 
-    def apply(self, whole_machine: bool=False):
+    def to_yaml_fragment(self) -> str:
         """
-        Applies this environment on the OS
+        Returns this environment serialized as a yaml top-level entry, identical to its part of a full configuration
+        dump. The result is cached until the name or variables change, so that saving a large configuration only
+        serializes the environments that were edited.
+
+        :return:
+        """
+        if self._yaml_fragment is None:
+            count('yaml_fragments_dumped')
+            stream = StringIO()
+            writer = EnvsYamlWriter(stream)
+            writer.write_env(self.id, self.to_dict())
+            writer.close()
+            self._yaml_fragment = stream.getvalue()
+        return self._yaml_fragment
+
+    def apply(self, whole_machine: bool=False, history: EnvHistory=None,
+              progress: Callable[[int, int, Optional[str]], None] = None, should_cancel: Callable[[], bool] = None):
+        """
+        Applies this environment on the OS. The previous values of the variables that change are first recorded in
+        the history, so that this can be undone.
+
+        The variables are first prepared one by one (lazy values are resolved), then all written at once. Cancellation
+        is checked between variables during the preparation, and one last time before writing: once the writing has
+        started it is never interrupted, so that the environment is never partially applied.
 
         :param whole_machine: a boolean indicating if we should apply to local user environment (False) or whole
         machine (True)
+        :param history: the history where to record the snapshot. Default is EnvHistory()
+        :param progress: an optional function called as `progress(done, total, var_name)` after each variable is
+        prepared, and as `progress(total, total, None)` once all variables are written
+        :param should_cancel: an optional function returning True if the operation should be cancelled. If so an
+        ApplyCancelledException is raised, and nothing is written
         :return:
         """
         target = 'WHOLE MACHINE' if whole_machine else 'CURRENT USER'
-        print("Applying environment '" + self.name + "' (" + self.id + ") for " + target)
-        set_env_variables_permanently(self.env_variables_dct, whole_machine=whole_machine)
-        print("Applying environment DONE")
+        logger.info("Applying environment '" + self.name + "' (" + self.id + ") for " + target)
+        with span('apply'):
+            if progress is None and should_cancel is None:
+                variables = self.get_resolved_variables()
+            else:
+                variables = self._prepare_variables(progress, should_cancel)
+            # the snapshot records exactly the values that are replaced, even if other processes apply concurrently
+            with store_transaction(whole_machine=whole_machine):
+                take_snapshot(self.id, variables, whole_machine=whole_machine, history=history)
+                set_env_variables_permanently(variables, whole_machine=whole_machine)
+        if progress is not None:
+            progress(len(variables) + 1, len(variables) + 1, None)
+        logger.info("Applying environment DONE")
+
+    def _prepare_variables(self, progress: Optional[Callable[[int, int, Optional[str]], None]],
+                           should_cancel: Optional[Callable[[], bool]]) -> Dict[str, Any]:
+        """ Same as get_resolved_variables, one variable at a time, see apply """
+        total = len(self.env_variables_dct) + 1
+        variables = OrderedDict()
+        for i, (var_name, value) in enumerate(self.env_variables_dct.items()):
+            if should_cancel is not None and should_cancel():
+                raise ApplyCancelledException.create_from(self.id)
+            variables[var_name] = value.resolve() if isinstance(value, LazyValue) else value
+            if progress is not None:
+                progress(i + 1, total, var_name)
+        if should_cancel is not None and should_cancel():
+            raise ApplyCancelledException.create_from(self.id)
+        return variables
+
+
+class ApplyCancelledException(Exception):
+    def __init__(self, msg):
+        """
+        Same as UnknownEnvIdException: the constructor only has one argument, use the static constructor `create_from`
+        :param msg:
+        """
+        super(ApplyCancelledException, self).__init__(msg)
+
+    @staticmethod
+    def create_from(env_id):
+        e = ApplyCancelledException("Applying environment '" + env_id + "' was cancelled. Nothing was modified")
+        e.env_id = env_id
+        return e
 
 
 class UnknownEnvIdException(Exception):
@@ -79,53 +281,192 @@ class UnknownEnvIdException(Exception):
         return e
 
 
+class ConflictingEnvIdException(Exception):
+    def __init__(self, msg):
+        """
+        Same as UnknownEnvIdException: the constructor only has one argument, use the static constructor `create_from`
+        :param msg:
+        """
+        super(ConflictingEnvIdException, self).__init__(msg)
+
+    @staticmethod
+    def create_from(env_id, first_file, second_file):
+        e = ConflictingEnvIdException("Environment id '" + env_id + "' is defined in several configuration files: '"
+                                      + first_file + "' and '" + second_file + "'")
+        e.env_id = env_id
+        e.files = [first_file, second_file]
+        return e
+
+
 class GlobalEnvsConfig:
     """
     Represents the configuration for all environments
+
+    Besides the environments in `envs`, a configuration may contain environment templates (see templates.EnvTemplate)
+    in its `_templates` section. The environments of templates are only generated on demand, by get_available_envs,
+    iter_envs and get_env. When a template generates an id that is also defined in `envs`, the latter wins.
+
+    The content hash (see `content_hash`) is maintained in constant time when an environment is modified, so that
+    comparing configurations (for example to detect unsaved modifications) is cheap, and configurations can be used as
+    cache keys. For the same reason `envs` is a read-only mapping: environments can be modified, but not added or
+    removed after creation.
     """
+    __slots__ = ('_envs', 'templates', 'env_sources', '_hash')
 
     def __init__(self, dct: Dict[str, Dict[str, Optional[str]]]):
         """
         Constructor with an initial dictionary of environments (key is id)
         :param dct:
         """
-        self.envs = OrderedDict()
+        self._envs = OrderedDict()
+
+        # the file each environment comes from, relative to the directory this configuration was loaded from, so that
+        # it can be saved to another directory. Templates are recorded as '_templates/<template name>'
+        self.env_sources = dict()
+
+        self._hash = 0
+        self.templates = load_templates(dct[TEMPLATES_KEY]) if TEMPLATES_KEY in dct else OrderedDict()
+        for template in self.templates.values():
+            self._hash ^= template.content_hash()
 
         for env_id, env_desc in dct.items():
+            if env_id == TEMPLATES_KEY:
+                continue
             # create environment configuration
             cfg = EnvConfig(env_id, env_desc)
-            self.envs[env_id] = cfg
+            self._envs[env_id] = cfg
+            cfg.set_owner(self)
+
+            # precompute the hashes now so that `envswitch status` and comparisons are fast
+            self._hash ^= cfg.content_hash()
 
     def __repr__(self):
-        return repr(self.envs)
+        return repr(self._envs)
+
+    @property
+    def envs(self) -> Mapping[str, EnvConfig]:
+        """ The environments defined in this configuration, by id, as a read-only mapping """
+        return MappingProxyType(self._envs)
+
+    def content_hash(self) -> int:
+        """
+        Returns a hash of the contents of all environments, regardless of their order.
+
+        :return:
+        """
+        return self._hash
+
+    def on_env_changed(self, previous_hash: int, env: EnvConfig):
+        """
+        Called by an environment of this configuration after it was modified
+
+        :param previous_hash: the content hash of the environment before the modification
+        :param env:
+        :return:
+        """
+        self._hash ^= previous_hash ^ env.content_hash()
+
+    def __hash__(self):
+        return self._hash
 
     def __eq__(self, other):
         if type(other) != GlobalEnvsConfig:
             return False
-        else:
-            return self.to_yaml() == other.to_yaml()
+        # the hashes are maintained on each modification: only configurations with the same hash are compared
+        return self is other or (self._hash == other._hash
+                                 and list(self.envs.items()) == list(other.envs.items())
+                                 and list(self.templates.items()) == list(other.templates.items()))
+
+    def __deepcopy__(self, memo):
+        res = GlobalEnvsConfig.__new__(GlobalEnvsConfig)
+        res._envs = OrderedDict()
+        for env_id, env in self.envs.items():
+            env_copy = deepcopy(env, memo)
+            env_copy.set_owner(res)
+            res._envs[env_id] = env_copy
+        # templates are immutable
+        res.templates = OrderedDict(self.templates)
+        res.env_sources = dict(self.env_sources)
+        res._hash = self._hash
+        return res
 
     def get_available_envs(self):
         """
+        Returns the ids of all environments, including the ones generated by templates. No environment is generated.
 
         :return: the list of available environments
         """
-        return list(self.envs.keys())
+        return list(self.envs.keys()) + [env_id for template in self.templates.values()
+                                         for env_id in template.iter_env_ids() if env_id not in self.envs]
+
+    def iter_envs(self):
+        """
+        Iterates over all environments: the environments of `envs`, then the ones generated by templates. Generated
+        environments are created one at a time, when the iteration reaches them.
+
+        :return:
+        """
+        for env in self.envs.values():
+            yield env
+        for template in self.templates.values():
+            for env_id in template.iter_env_ids():
+                if env_id not in self.envs:
+                    yield template.get_env(env_id)
+
+    def iter_env_names(self) -> Iterator[Tuple[str, str]]:
+        """
+        Iterates over the ids and names of all environments, in the same order than iter_envs. No environment is
+        generated.
 
-    def apply(self, env_id, whole_machine: bool = False):
+        :return: an iterator of (env_id, name)
+        """
+        for env_id, env in self.envs.items():
+            yield env_id, env.name
+        for template in self.templates.values():
+            for env_id, name in template.iter_env_names():
+                if env_id not in self.envs:
+                    yield env_id, name
+
+    def apply(self, env_id, whole_machine: bool = False, history: EnvHistory = None):
         """
         Applies environment 'id', or throws an error if that environment id does not exist
 
         :param env_id: the environment id to apply
         :param whole_machine: a boolean indicating if we should apply to local user environment (False) or whole
         machine (True)
+        :param history: the history where to record the snapshot of previous values. Default is EnvHistory()
         :return:
         """
-        # if the environment required is known, apply it
-        if env_id in self.envs.keys():
-            self.envs[env_id].apply(whole_machine=whole_machine)
-        else:
-            raise UnknownEnvIdException.create_from(env_id, list(self.envs.keys()))
+        self.get_env(env_id).apply(whole_machine=whole_machine, history=history)
+
+    def get_env(self, env_id) -> EnvConfig:
+        """
+        Returns environment 'id', or throws an error if that environment id does not exist
+
+        :param env_id:
+        :return:
+        """
+        env = self.find_env(env_id)
+        if env is None:
+            raise UnknownEnvIdException.create_from(env_id, self.get_available_envs())
+        return env
+
+    def find_env(self, env_id) -> Optional[EnvConfig]:
+        """
+        Returns environment 'id', or None if that environment id does not exist. Environments generated by templates
+        are created by this call.
+
+        :param env_id:
+        :return:
+        """
+        env = self.envs.get(env_id)
+        if env is not None:
+            return env
+        for template in self.templates.values():
+            env = template.get_env(env_id)
+            if env is not None:
+                return env
+        return None
 
     def to_dict(self):
         """
@@ -135,6 +476,8 @@ class GlobalEnvsConfig:
         dct = OrderedDict()
         for env_id, env in self.envs.items():
             dct[env_id] = env.to_dict()
+        if len(self.templates) > 0:
+            dct[TEMPLATES_KEY] = OrderedDict((name, t.to_dict()) for name, t in self.templates.items())
 
         return dct
 
@@ -147,17 +490,254 @@ class GlobalEnvsConfig:
         :param file:
         :return:
         """
-        conf = safe_load_ordered(file)
-        res = GlobalEnvsConfig(conf)
+        with span('config.parse'):
+            conf = safe_load_ordered(file)
+        with span('config.validate'):
+            res = GlobalEnvsConfig(conf)
 
         # safety: make sure the result is an instance of GlobalEnvsConfig
         assert isinstance(res, GlobalEnvsConfig)
 
         return res
 
-    def to_yaml(self, stream=None):
+    @staticmethod
+    def from_yaml_dir(dir_path: str, max_workers: int = None, use_processes: bool = False):
+        """
+        Loads all *.yml and *.yaml configuration files in a directory (conf.d style) and merges them into a single
+        configuration. Files are parsed in parallel, and merged in alphabetical order of their file names. Each file
+        is cached separately, so that only the files that changed since last load are parsed again.
+
+        Raises a ConflictingEnvIdException if the same environment id is defined in several files.
+
+        :param dir_path: the path to the configuration directory
+        :param max_workers: the maximum number of parallel workers used to parse the files
+        :param use_processes: if True a process pool will be used instead of a thread pool. This is faster for large
+        directories since the YAML parser is pure python, but has a higher startup cost.
+        :return:
+        """
+        with span('config.parse'):
+            files_confs = load_config_dir(dir_path, max_workers=max_workers, use_processes=use_processes)
+
+        with span('config.validate'):
+            merged = OrderedDict()
+            sources = dict()
+            templates = OrderedDict()
+            for file_path, conf in files_confs:
+                rel_path = os.path.relpath(file_path, dir_path)
+                for template_name, template_desc in (conf.get(TEMPLATES_KEY) or {}).items():
+                    key = TEMPLATES_KEY + '/' + template_name
+                    if template_name in templates:
+                        raise ConflictingEnvIdException.create_from(key, os.path.join(dir_path, sources[key]),
+                                                                    file_path)
+                    templates[template_name] = template_desc
+                    sources[key] = rel_path
+                for env_id, env_desc in conf.items():
+                    if env_id == TEMPLATES_KEY:
+                        continue
+                    if env_id in merged:
+                        raise ConflictingEnvIdException.create_from(env_id, os.path.join(dir_path, sources[env_id]),
+                                                                    file_path)
+                    merged[env_id] = env_desc
+                    sources[env_id] = rel_path
+
+            if len(templates) > 0:
+                merged[TEMPLATES_KEY] = templates
+            res = GlobalEnvsConfig(merged)
+        res.env_sources = sources
+        return res
+
+    @staticmethod
+    def from_path(path: str):
         """
-        Dumps this configuration into a yaml str
+        Loads a configuration file, or a configuration directory (see from_yaml_dir). The format (yaml, json,
+        toml...) is detected automatically, see envswitch.formats
+
+        :param path:
+        :return:
+        """
+        from envswitch.formats import read_config
+        return read_config(path)
+
+    def to_yaml(self, stream=None, use_cache: bool = True):
+        """
+        Dumps this configuration into a yaml str, or writes it to `stream` one environment at a time.
+
+        :param stream: an optional text stream where to write the configuration. If None the yaml str is returned
+        :param use_cache: if True (default) the serialized form of each environment is cached (see
+        EnvConfig.to_yaml_fragment), so that next saves only serialize the modified environments. If False and a
+        stream is provided, nothing is cached and environments are emitted directly to the stream, so that the memory
+        used does not depend on the size of the configuration
         :return:
         """
-        return yaml.dump(self.to_dict(), stream=stream)
+        with span('config.save'):
+            if len(self.envs) == 0 and len(self.templates) == 0:
+                return yaml.dump(self.to_dict(), stream=stream)
+
+            # the templates section is small and always written last
+            templates_fragment = _templates_yaml_fragment(self.templates.values())
+            if stream is None:
+                # the top-level entries are independent, so the dump is the concatenation of the environments fragments
+                return ''.join(env.to_yaml_fragment() for env in self.envs.values()) + templates_fragment
+            elif use_cache:
+                for env in self.envs.values():
+                    stream.write(env.to_yaml_fragment())
+                stream.write(templates_fragment)
+            else:
+                _stream_envs(stream, self.envs.values())
+                stream.write(templates_fragment)
+
+    def to_yaml_dir(self, dir_path: str, use_cache: bool = True):
+        """
+        Dumps this configuration into a configuration directory. Each environment is written back to the file it was
+        loaded from (relative to dir_path, see env_sources), and environments with no known source file are written to
+        DEFAULT_DIR_FILE_NAME. Source files that no longer contain any environment or template are emptied, otherwise
+        their environments would come back on the next load. Files whose contents would not change are not written.
+
+        :param dir_path:
+        :param use_cache: if True (default) the serialized form of each environment is cached, see to_yaml. If False
+        nothing is cached and each file is written one environment at a time, even if its contents do not change
+        :return:
+        """
+        default_path = os.path.join(dir_path, DEFAULT_DIR_FILE_NAME)
+
+        # group the environments by file, preserving order
+        files_envs = OrderedDict()
+        for env_id, env in self.envs.items():
+            source = self.env_sources.get(env_id)
+            file_path = os.path.join(dir_path, source) if source else default_path
+            files_envs.setdefault(file_path, []).append(env)
+        files_templates = OrderedDict()
+        for template_name in self.templates:
+            source = self.env_sources.get(TEMPLATES_KEY + '/' + template_name)
+            file_path = os.path.join(dir_path, source) if source else default_path
+            files_templates.setdefault(file_path, []).append(self.templates[template_name])
+            files_envs.setdefault(file_path, [])
+        # the source files of environments that were removed
+        for source in sorted(set(self.env_sources.values())):
+            files_envs.setdefault(os.path.join(dir_path, source), [])
+
+        if not use_cache:
+            for file_path, envs in files_envs.items():
+                logger.info("saving configuration file : '" + file_path + "'")
+                with open(file_path, mode='w') as f:
+                    if len(envs) > 0:
+                        _stream_envs(f, envs)
+                    f.write(_templates_yaml_fragment(files_templates.get(file_path, ())))
+            return
+
+        files_contents = OrderedDict()
+        for file_path, envs in files_envs.items():
+            files_contents[file_path] = [env.to_yaml_fragment() for env in envs]
+        for file_path, templates in files_templates.items():
+            files_contents[file_path].append(_templates_yaml_fragment(templates))
+
+        for file_path, fragments in files_contents.items():
+            new_contents = ''.join(fragments)
+            try:
+                with open(file_path, 'r') as f:
+                    if f.read() == new_contents:
+                        continue
+            except FileNotFoundError:
+                pass
+            logger.info("saving configuration file : '" + file_path + "'")
+            with open(file_path, mode='w') as f:
+                f.write(new_contents)
+
+
+def _stream_envs(stream, envs: Iterable[EnvConfig]):
+    """
+    Writes environments to `stream` one at a time with an EnvsYamlWriter, without caching their serialized form
+
+    :param stream:
+    :param envs:
+    :return:
+    """
+    writer = EnvsYamlWriter(stream)
+    for env in envs:
+        writer.write_env(env.id, env.to_dict())
+    writer.close()
+
+
+def _templates_yaml_fragment(templates: Iterable[EnvTemplate]) -> str:
+    """
+    Returns the templates section of a yaml configuration, or '' if there is no template
+
+    :param templates:
+    :return:
+    """
+    dct = OrderedDict((t.template_name, t.to_dict()) for t in templates)
+    if len(dct) == 0:
+        return ''
+    stream = StringIO()
+    writer = EnvsYamlWriter(stream)
+    writer.write_env(TEMPLATES_KEY, dct)
+    writer.close()
+    return stream.getvalue()
+
+
+# cache of parsed configuration files: absolute path -> ((mtime_ns, size), parsed contents)
+_PARSED_FILES_CACHE = dict()
+
+
+def list_config_dir(dir_path: str) -> List[str]:
+    """
+    Returns the sorted list of paths to the configuration files (*.yml and *.yaml) in directory dir_path
+
+    :param dir_path:
+    :return:
+    """
+    return sorted(os.path.join(dir_path, f) for f in os.listdir(dir_path)
+                  if f.lower().endswith(YAML_EXTENSIONS) and os.path.isfile(os.path.join(dir_path, f)))
+
+
+def _parse_yaml_file(file_path: str):
+    """
+    Parses a single yaml configuration file. This is a module-level function so that it can be sent to a process pool
+
+    :param file_path:
+    :return:
+    """
+    with open(file_path, 'r') as f:
+        return safe_load_ordered(f) or OrderedDict()
+
+
+def load_config_dir(dir_path: str, max_workers: int = None, use_processes: bool = False) \
+        -> List[Tuple[str, OrderedDict]]:
+    """
+    Parses all configuration files in directory dir_path, in parallel. Files that did not change (same modification
+    time and size) since the last time they were parsed are not parsed again.
+
+    :param dir_path:
+    :param max_workers: the maximum number of parallel workers used to parse the files
+    :param use_processes: if True a process pool will be used instead of a thread pool
+    :return: a list of (file path, parsed contents) tuples, sorted by file name
+    """
+    files = [os.path.abspath(p) for p in list_config_dir(dir_path)]
+
+    # first get what we can from the cache
+    parsed = dict()
+    to_parse = []
+    for file_path in files:
+        st = os.stat(file_path)
+        file_key = (st.st_mtime_ns, st.st_size)
+        cached = _PARSED_FILES_CACHE.get(file_path)
+        if cached is not None and cached[0] == file_key:
+            parsed[file_path] = cached[1]
+        else:
+            to_parse.append((file_path, file_key))
+
+    # then parse the remaining ones in parallel
+    if len(to_parse) == 1:
+        results = [_parse_yaml_file(to_parse[0][0])]
+    elif len(to_parse) > 1:
+        executor_type = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with executor_type(max_workers=max_workers) as executor:
+            results = list(executor.map(_parse_yaml_file, [file_path for file_path, _ in to_parse]))
+    else:
+        results = []
+
+    for (file_path, file_key), conf in zip(to_parse, results):
+        _PARSED_FILES_CACHE[file_path] = (file_key, conf)
+        parsed[file_path] = conf
+
+    return [(file_path, parsed[file_path]) for file_path in files]
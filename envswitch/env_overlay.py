@@ -0,0 +1,208 @@
+import os
+from collections import OrderedDict
+from contextlib import ContextDecorator
+from typing import Dict, List, Optional, Union, Tuple
+
+from envswitch.bundle import EnvsBundle, InvalidBundleException, is_bundle
+from envswitch.env_config import EnvConfig, GlobalEnvsConfig
+from envswitch.lazy_values import LazyValue
+from envswitch.list_vars import ListVarOps, as_list_var_ops
+from envswitch.tracing import count
+
+
+def get_last_opened_file_path() -> str:
+    """
+    Returns the path to the configuration file (or directory) last opened with the Envswitch GUI or with
+    'envswitch open', or '' if there is none.
+
+    :return:
+    """
+    # Qt is only imported when this is actually needed
+    from PyQt5.QtCore import QSettings
+    from envswitch.gui import EnvSwitcherAppHeadless
+    return QSettings('smarie', 'envswitch').value(EnvSwitcherAppHeadless.SETTING_LAST_OPENED_FILE_PATH, type=str) or ''
+
+
+def _get_config_path(config_path: Optional[str]) -> str:
+    """
+    Returns the absolute path of `config_path`, or of the configuration last opened with the GUI if `config_path` is
+    None. Raises a FileNotFoundError if there is none: an empty path would otherwise designate the current directory.
+    """
+    if not config_path:
+        config_path = get_last_opened_file_path()
+        if config_path == '':
+            raise FileNotFoundError('No configuration file was specified, and none was opened with the Envswitch GUI '
+                                    "or with 'envswitch open'")
+    return os.path.abspath(config_path)
+
+
+# the configurations already loaded: absolute path -> (stamp, configuration)
+_CONFIGS_CACHE = dict()
+
+
+def _get_stamp(path: str):
+    """ Returns a value that changes whenever the configuration file or directory at `path` is modified """
+    paths = [os.path.join(path, f) for f in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+    stamps = []
+    for p in paths:
+        st = os.stat(p)
+        stamps.append((p, st.st_mtime_ns, st.st_size))
+    return tuple(stamps)
+
+
+def load_config(config_path: str = None) -> GlobalEnvsConfig:
+    """
+    Loads the configuration at `config_path` (a file or a directory), or the last one opened with the GUI if
+    `config_path` is None. Configurations are cached until their file(s) change, so that this can be called often.
+    Raises a FileNotFoundError if `config_path` is None and no configuration was opened with the GUI.
+
+    :param config_path:
+    :return:
+    """
+    config_path = _get_config_path(config_path)
+    stamp = _get_stamp(config_path)
+    cached = _CONFIGS_CACHE.get(config_path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    config = GlobalEnvsConfig.from_path(config_path)
+    _CONFIGS_CACHE[config_path] = (stamp, config)
+    return config
+
+
+def load_env(env_id: str, config_path: str = None) -> EnvConfig:
+    """
+    Loads environment `env_id` from the configuration at `config_path`, or from the last one opened with the GUI if
+    `config_path` is None. If the configuration is a compiled bundle, only this environment is read (see EnvsBundle).
+
+    :param env_id:
+    :param config_path:
+    :return:
+    """
+    config_path = _get_config_path(config_path)
+    if is_bundle(config_path):
+        try:
+            with EnvsBundle(config_path) as bundle:
+                return bundle.get_env(env_id)
+        except InvalidBundleException:
+            # load_config falls back to the source configuration if possible, see load_bundle
+            pass
+    return load_config(config_path).get_env(env_id)
+
+
+def get_overlay(env: EnvConfig) -> Tuple[Tuple[str, Union[None, str, ListVarOps, LazyValue]], ...]:
+    """
+    Returns the overlay of environment `env`: a tuple of (variable name, value) where value is None for variables to
+    remove, a string for variables to set, a ListVarOps for list variables that have to be merged with the current
+    value, or a LazyValue that is resolved each time the overlay is used (see lazy_values for the cache).
+
+    :param env:
+    :return:
+    """
+    return tuple((name, value if isinstance(value, LazyValue) else as_list_var_ops(name, value) or value or None)
+                 for name, value in env.env_variables_dct.items())
+
+
+def _overlaid_value(name: str, value: Union[None, str, ListVarOps, LazyValue],
+                    current: Optional[str]) -> Optional[str]:
+    """ Returns the value of a variable once the overlay `value` is applied on `current`. None means 'undefined' """
+    if isinstance(value, LazyValue):
+        resolved = value.resolve()
+        value = as_list_var_ops(name, resolved) or resolved or None
+    if type(value) is ListVarOps:
+        return value.merge(current) or None
+    return value
+
+
+def build_child_env(env: EnvConfig, base: Dict[str, str] = None) -> Dict[str, str]:
+    """
+    Returns the environment of a child process running with environment `env`: a copy of `base` (default is the
+    environment of the current process) on which the overlay of `env` is applied.
+
+    :param env:
+    :param base:
+    :return:
+    """
+    child_env = dict(os.environ if base is None else base)
+    for name, value in get_overlay(env):
+        new = _overlaid_value(name, value, child_env.get(name))
+        if new is None:
+            child_env.pop(name, None)
+        else:
+            child_env[name] = new
+    return child_env
+
+
+class temporary(ContextDecorator):
+    """
+    A context manager and decorator that overlays an environment onto os.environ, without modifying the persisted
+    variables:
+
+        with envswitch.temporary('no_proxy'):
+            ...
+
+        @envswitch.temporary('proxy', config_path='conf.yml')
+        def test_download():
+            ...
+
+    Only the variables whose value actually changes are recorded, and on exit exactly those are restored (a variable
+    that was not defined is removed again), so entering and exiting costs O(number of changed variables). Empty values
+    remove the variable, and list variables such as PATH are merged with the current value, the same way than when the
+    environment is applied permanently.
+
+    The same instance can be entered several times (re-entrant), and overlays can be nested: each exit restores the
+    state of the matching enter. Note that os.environ is shared by all threads of the process.
+    """
+
+    def __init__(self, env: Union[str, EnvConfig], config: GlobalEnvsConfig = None, config_path: str = None):
+        """
+        :param env: the id of the environment to overlay, or the environment itself
+        :param config: the configuration where to look for the environment id. Default is to load `config_path`
+        :param config_path: the configuration file or directory where to look for the environment id, when `config`
+        is not provided. Default is the last one opened with the Envswitch GUI
+        """
+        self._env = env if isinstance(env, EnvConfig) else None
+        self._env_id = env.id if isinstance(env, EnvConfig) else env
+        self._config = config
+        self._config_path = config_path
+        # for each enter that was not exited yet, the previous values of the variables that were changed
+        self._stack = []  # type: List[Dict[str, Optional[str]]]
+
+    def get_env(self) -> EnvConfig:
+        """
+        Returns the environment overlaid by this object. It is looked up in the configuration the first time only.
+
+        :return:
+        """
+        if self._env is None:
+            if self._config is not None:
+                self._env = self._config.get_env(self._env_id)
+            else:
+                self._env = load_env(self._env_id, self._config_path)
+        return self._env
+
+    def __enter__(self) -> EnvConfig:
+        env = self.get_env()
+        environ = os.environ
+        previous = OrderedDict()
+        for name, value in get_overlay(env):
+            current = environ.get(name)
+            new = _overlaid_value(name, value, current)
+            if new != current:
+                previous[name] = current
+                if new is None:
+                    del environ[name]
+                else:
+                    environ[name] = new
+        count('vars_overlaid', len(previous))
+        self._stack.append(previous)
+        return env
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        environ = os.environ
+        for name, value in self._stack.pop().items():
+            if value is None:
+                environ.pop(name, None)
+            else:
+                environ[name] = value
+        return False
@@ -0,0 +1,73 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+
+from envswitch.tracing import span
+
+# the paths locked by the current thread, with the lock depth, so that exclusive_lock is re-entrant
+_LOCKS_HELD = threading.local()
+
+
+@contextmanager
+def exclusive_lock(path: str, span_name: str = 'lock'):
+    """
+    A context manager holding an exclusive inter-process lock on `path`, waiting as long as needed. The lock is
+    released when the context exits, or when the process dies. It is re-entrant within a thread.
+
+    `path` may be an existing directory (linux only) or a lock file, that is created if needed along with its parent
+    directory. Files that are replaced on each write can not be locked themselves: lock their directory or a separate
+    lock file instead.
+
+    :param path: the path to the directory or the lock file
+    :param span_name: the name of the span measuring the time spent waiting for the lock, see tracing.span
+    :return:
+    """
+    held = _LOCKS_HELD.__dict__.setdefault('paths', dict())
+    if path in held:
+        held[path] += 1
+        try:
+            yield
+        finally:
+            held[path] -= 1
+        return
+
+    if os.path.isdir(path):
+        fd = os.open(path, os.O_RDONLY)
+    else:
+        parent_dir = os.path.dirname(path)
+        if parent_dir and not os.path.isdir(parent_dir):
+            os.makedirs(parent_dir, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        with span(span_name):
+            _lock_file(fd)
+        held[path] = 1
+        try:
+            yield
+        finally:
+            del held[path]
+            if fcntl is None:
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        # closing the file descriptor releases the flock
+        os.close(fd)
+
+
+def _lock_file(fd: int):
+    """ Takes an exclusive lock on open file `fd`, waiting as long as needed """
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return
+    while True:
+        try:
+            # locks the first byte. LK_LOCK retries for 10 seconds, then raises an OSError
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            pass
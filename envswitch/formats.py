@@ -0,0 +1,391 @@
+import json
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from envswitch.bundle import BUNDLE_EXTENSION, MAGIC, load_bundle
+from envswitch.env_api_linuximpl import parse_line, format_line
+from envswitch.env_config import GlobalEnvsConfig, YAML_EXTENSIONS
+from envswitch.lazy_values import LazyValue
+from envswitch.list_vars import ListVarOps
+from envswitch.tracing import logger, span
+
+_NAME = 'name'
+
+
+class UnknownFormatException(Exception):
+    """ Raised whenever the format of a configuration can not be determined, or is not registered """
+
+
+class ReadOnlyFormatException(Exception):
+    """ Raised whenever a configuration is saved in a format that can only be loaded, such as compiled bundles """
+
+
+class ConfigFormat:
+    """
+    A configuration format: how to load a GlobalEnvsConfig from a path, and how to save it to a path. Formats are
+    registered with `register_format` and then automatically detected by `detect_format`.
+
+    The save function receives a `use_cache` keyword argument, see write_config. Formats that do not cache anything
+    may ignore it. Formats without save function can only be loaded.
+    """
+    __slots__ = ('name', 'extensions', 'is_dir', 'load', 'save', 'sniff')
+
+    def __init__(self, name: str, extensions: List[str], is_dir: bool,
+                 load: Callable[[str], GlobalEnvsConfig], save: Optional[Callable[..., None]],
+                 sniff: Callable[[str], bool] = None):
+        """
+        :param name: the format name, for example 'json'
+        :param extensions: the file extensions of this format (without the dot), or for directories the extensions of
+        the files they contain
+        :param is_dir: True if the configuration is a directory of files
+        :param load: a function loading the configuration at a path
+        :param save: a function saving a configuration to a path, `save(config, path, use_cache=True)`, or None if
+        configurations can not be saved in this format
+        :param sniff: an optional function receiving the beginning of a file (or for directories the list of file
+        names) and returning True if it looks like this format. Used when the extension is not known
+        """
+        self.name = name
+        self.extensions = tuple(extensions)
+        self.is_dir = is_dir
+        self.load = load
+        self.save = save
+        self.sniff = sniff
+
+    def __repr__(self):
+        return 'ConfigFormat(' + repr(self.name) + ')'
+
+
+# all registered formats, by name, in detection order
+_FORMATS = OrderedDict()  # type: Dict[str, ConfigFormat]
+
+
+def register_format(config_format: ConfigFormat):
+    """
+    Registers a configuration format, replacing any format with the same name
+
+    :param config_format:
+    :return:
+    """
+    _FORMATS[config_format.name] = config_format
+
+
+def get_format(name: str) -> ConfigFormat:
+    """
+    :param name:
+    :return: the registered format with this name. Raises an UnknownFormatException if there is none
+    """
+    try:
+        return _FORMATS[name]
+    except KeyError:
+        raise UnknownFormatException('Unknown configuration format ' + repr(name) + '. Available formats: '
+                                     + str([n for n in _FORMATS]))
+
+
+def get_formats() -> List[ConfigFormat]:
+    """
+    :return: all registered formats
+    """
+    return [f for f in _FORMATS.values()]
+
+
+def get_file_extensions(savable_only: bool = False) -> List[str]:
+    """
+    :param savable_only: if True, the extensions of formats that can only be loaded (bundles) are not returned
+    :return: the extensions of all registered file (not directory) formats, for example ['yml', 'yaml', 'json']
+    """
+    return [ext for f in _FORMATS.values() if not f.is_dir and (f.save is not None or not savable_only)
+            for ext in f.extensions]
+
+
+def detect_format(path: str, must_exist: bool = True) -> ConfigFormat:
+    """
+    Detects the format of the configuration at `path`: first from the file extension, and if it is not known from the
+    contents of the file (or of the directory).
+
+    :param path: the path to a configuration file or directory
+    :param must_exist: if False and nothing exists at `path`, only the extension is used
+    :return: the format. Raises an UnknownFormatException if the format can not be determined
+    """
+    if os.path.isdir(path):
+        names = os.listdir(path)
+        for f in _FORMATS.values():
+            if f.is_dir and f.sniff is not None and f.sniff(names):
+                return f
+        raise UnknownFormatException('Could not find any configuration file in directory ' + repr(path))
+
+    ext = os.path.splitext(path)[1][1:].lower()
+    for f in _FORMATS.values():
+        if not f.is_dir and ext in f.extensions:
+            return f
+
+    if not must_exist and not os.path.exists(path):
+        raise UnknownFormatException('Unknown configuration file extension ' + repr(ext) + ' for ' + repr(path)
+                                     + '. Known extensions: ' + str(get_file_extensions()))
+
+    # binary formats are sniffed too, so decoding errors are ignored
+    with open(path, 'r', errors='replace') as fd:
+        head = fd.read(4096)
+    for f in _FORMATS.values():
+        if not f.is_dir and f.sniff is not None and f.sniff(head):
+            return f
+    # json is valid yaml, so yaml is the default
+    return get_format('yaml')
+
+
+def read_config(path: str, config_format: str = None) -> GlobalEnvsConfig:
+    """
+    Loads the configuration at `path`
+
+    :param path: the path to a configuration file or directory
+    :param config_format: an optional format name. Default is to detect it, see detect_format
+    :return:
+    """
+    f = get_format(config_format) if config_format is not None else detect_format(path)
+    logger.debug("Loading %r as %s", path, f.name)
+    return f.load(path)
+
+
+def write_config(config: GlobalEnvsConfig, path: str, config_format: str = None, use_cache: bool = True):
+    """
+    Saves a configuration at `path`
+
+    :param config:
+    :param path: the path to a configuration file or directory
+    :param config_format: an optional format name. Default is to detect it from the existing file or directory, or
+    from the extension of `path`
+    :param use_cache: if True (default) the serialized environments are cached when the format supports it, so that
+    the next saves of `config` only serialize the modified environments (see GlobalEnvsConfig.to_yaml). Use False when
+    `config` is saved only once, for example by a conversion: environments are then written one at a time and the
+    memory used does not depend on the size of the configuration
+    :return:
+    """
+    f = get_format(config_format) if config_format is not None else detect_format(path, must_exist=False)
+    if f.save is None:
+        raise ReadOnlyFormatException("Configurations can not be saved as " + f.name + " ('" + path + "'), this "
+                                      "format can only be opened")
+    with span('config.save.' + f.name):
+        f.save(config, path, use_cache=use_cache)
+
+
+def _lazy_value_error(value: LazyValue, format_name: str) -> ValueError:
+    return ValueError("Value '" + str(value) + "' is resolved when applied, it can only be saved in yaml "
+                      "configurations or bundles, not in " + format_name)
+
+
+def _templates_error(format_name: str) -> ValueError:
+    return ValueError("Environment templates can only be saved in yaml or json configurations, not in " + format_name
+                      + ". Compile a bundle to save the generated environments")
+
+
+# ---- yaml: file or conf.d style directory
+
+
+def _load_yaml(path: str) -> GlobalEnvsConfig:
+    with open(path, 'r') as f:
+        return GlobalEnvsConfig.from_yaml(f)
+
+
+def _save_yaml(config: GlobalEnvsConfig, path: str, use_cache: bool = True):
+    with open(path, 'w') as f:
+        config.to_yaml(f, use_cache=use_cache)
+
+
+def _save_yaml_dir(config: GlobalEnvsConfig, path: str, use_cache: bool = True):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    config.to_yaml_dir(path, use_cache=use_cache)
+
+
+# ---- json
+
+
+def _load_json(path: str) -> GlobalEnvsConfig:
+    with span('config.parse'):
+        with open(path, 'r') as f:
+            dct = json.load(f, object_pairs_hook=OrderedDict)
+    with span('config.validate'):
+        return GlobalEnvsConfig(dct)
+
+
+def _json_default(value: Any):
+    if isinstance(value, LazyValue):
+        raise _lazy_value_error(value, 'json')
+    raise TypeError('Object of type ' + type(value).__name__ + ' is not JSON serializable')
+
+
+def _save_json(config: GlobalEnvsConfig, path: str, use_cache: bool = True):
+    with open(path, 'w') as f:
+        json.dump(config.to_dict(), f, indent=2, default=_json_default)
+        f.write('\n')
+
+
+def _sniff_json(head: str) -> bool:
+    return head.lstrip().startswith('{')
+
+
+# ---- toml
+
+
+def _load_toml(path: str) -> GlobalEnvsConfig:
+    try:
+        # python 3.11+
+        import tomllib
+        with span('config.parse'):
+            with open(path, 'rb') as f:
+                dct = tomllib.load(f)
+    except ImportError:
+        try:
+            import toml
+        except ImportError as e:
+            raise ImportError("Reading TOML files requires python 3.11 or the 'toml' package: pip install toml") \
+                .with_traceback(e.__traceback__)
+        with span('config.parse'):
+            with open(path, 'r') as f:
+                dct = toml.load(f, _dict=OrderedDict)
+    with span('config.validate'):
+        return GlobalEnvsConfig(dct)
+
+
+_TOML_BARE_KEY = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def _toml_key(key: str) -> str:
+    return key if _TOML_BARE_KEY.match(key) else _toml_value(key)
+
+
+def _toml_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    elif isinstance(value, list):
+        return '[' + ', '.join(_toml_value(v) for v in value) + ']'
+    elif isinstance(value, LazyValue):
+        raise _lazy_value_error(value, 'toml')
+    else:
+        # json escaping is valid in toml basic strings, except for non-ascii characters that toml accepts as is
+        return json.dumps(value, ensure_ascii=False)
+
+
+def _save_toml(config: GlobalEnvsConfig, path: str, use_cache: bool = True):
+    if len(config.templates) > 0:
+        raise _templates_error('toml')
+    # the schema is flat (one table per environment, and one sub-table per list variable), so it is written directly
+    with open(path, 'w') as f:
+        first = True
+        for env_id, env in config.envs.items():
+            list_vars = []
+            f.write(('' if first else '\n') + '[' + _toml_key(env_id) + ']\n')
+            first = False
+            for name, value in env.to_dict().items():
+                if isinstance(value, dict):
+                    list_vars.append((name, value))
+                else:
+                    f.write(_toml_key(name) + ' = ' + _toml_value(value) + '\n')
+            for name, ops in list_vars:
+                f.write('\n[' + _toml_key(env_id) + '.' + _toml_key(name) + ']\n')
+                for op, value in ops.items():
+                    f.write(op + ' = ' + _toml_value(value) + '\n')
+
+
+def _sniff_toml(head: str) -> bool:
+    for line in head.splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            return line.startswith('[') and line.endswith(']')
+    return False
+
+
+# ---- directory of dotenv files, one environment per file
+
+DOTENV_EXTENSION = '.env'
+_DOTENV_NAME_PREFIX = '# name: '
+
+
+def _is_dotenv_file(file_name: str) -> bool:
+    # dotfiles such as a stray '.env' are not environments: their id would be empty
+    return file_name.endswith(DOTENV_EXTENSION) and not file_name.startswith('.')
+
+
+def _sniff_dotenv_dir(names: List[str]) -> bool:
+    # yaml files win when present, so that a conf.d directory with a stray .env file is still a yaml-dir
+    return any(_is_dotenv_file(n) for n in names) and not any(n.lower().endswith(YAML_EXTENSIONS) for n in names)
+
+
+def _load_dotenv_dir(path: str) -> GlobalEnvsConfig:
+    with span('config.parse'):
+        dct = OrderedDict()
+        for file_name in sorted(os.listdir(path)):
+            if not _is_dotenv_file(file_name):
+                continue
+            env = OrderedDict()
+            with open(os.path.join(path, file_name), 'r') as f:
+                for line in f:
+                    if line.startswith(_DOTENV_NAME_PREFIX):
+                        env[_NAME] = line[len(_DOTENV_NAME_PREFIX):].strip()
+                        continue
+                    parsed = parse_line(line)
+                    if parsed is not None:
+                        env[parsed[0]] = parsed[1]
+            dct[file_name[:-len(DOTENV_EXTENSION)]] = env
+    with span('config.validate'):
+        return GlobalEnvsConfig(dct)
+
+
+def _to_dotenv_value(env_id: str, name: str, value: Any) -> str:
+    if isinstance(value, ListVarOps):
+        # a plain PATH value is appended to the current value, see list_vars.as_list_var_ops
+        if name.upper() != 'PATH' or value.prepend or value.remove or value.separator is not None or not value.dedupe:
+            raise ValueError("List variable '" + name + "' of environment '" + env_id + "' can not be saved in a "
+                             "dotenv file")
+        value = os.pathsep.join(value.append)
+    elif isinstance(value, LazyValue):
+        raise _lazy_value_error(value, 'dotenv files')
+    if '\n' in value:
+        raise ValueError("Variable '" + name + "' of environment '" + env_id + "' contains a line break and can not "
+                         "be saved in a dotenv file")
+    return value
+
+
+def _check_dotenv_env_id(env_id: str):
+    """
+    Raises a ValueError if `env_id` can not be used as a file name in the directory, for example '../x'. Ids starting
+    with a dot are rejected too, since dotfiles are skipped when loading the directory
+    """
+    separators = [sep for sep in (os.sep, os.altsep, '/') if sep is not None]
+    if env_id == '' or env_id.startswith('.') or '\0' in env_id or any(sep in env_id for sep in separators):
+        raise ValueError("Environment id '" + env_id + "' can not be used as a file name and can not be saved in a "
+                         "directory of dotenv files")
+
+
+def _save_dotenv_dir(config: GlobalEnvsConfig, path: str, use_cache: bool = True):
+    if len(config.templates) > 0:
+        raise _templates_error('dotenv files')
+    # checked first, so that nothing is written if an id is invalid
+    for env_id in config.envs:
+        _check_dotenv_env_id(env_id)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    for env_id, env in config.envs.items():
+        lines = []
+        if env.name != env_id:
+            lines.append(_DOTENV_NAME_PREFIX + env.name)
+        for name, value in env.env_variables_dct.items():
+            lines.append(format_line(name, _to_dotenv_value(env_id, name, value)))
+        with open(os.path.join(path, env_id + DOTENV_EXTENSION), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+register_format(ConfigFormat('yaml', [ext[1:] for ext in YAML_EXTENSIONS], is_dir=False, load=_load_yaml,
+                             save=_save_yaml))
+# bundles are compiled from a source configuration (see compile_bundle and `envswitch compile`), not saved
+register_format(ConfigFormat('bundle', [BUNDLE_EXTENSION[1:]], is_dir=False, load=load_bundle, save=None,
+                             sniff=lambda head: head.startswith(MAGIC.decode('ascii'))))
+register_format(ConfigFormat('json', ['json'], is_dir=False, load=_load_json, save=_save_json, sniff=_sniff_json))
+register_format(ConfigFormat('toml', ['toml'], is_dir=False, load=_load_toml, save=_save_toml, sniff=_sniff_toml))
+register_format(ConfigFormat('dotenv-dir', [DOTENV_EXTENSION[1:]], is_dir=True, load=_load_dotenv_dir,
+                             save=_save_dotenv_dir,
+                             sniff=_sniff_dotenv_dir))
+register_format(ConfigFormat('yaml-dir', [ext[1:] for ext in YAML_EXTENSIONS], is_dir=True,
+                             load=GlobalEnvsConfig.from_yaml_dir, save=_save_yaml_dir,
+                             sniff=lambda names: True))  # default for directories, including empty ones
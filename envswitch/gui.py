@@ -5,9 +5,12 @@ from abc import abstractmethod
 from contextlib import ContextDecorator
 from functools import partial
 from traceback import format_exception
-from typing import Dict, List
+from time import perf_counter
+from typing import Dict, Iterator, List, Tuple
 from warnings import warn
 
+from envswitch.tracing import logger, span, record, configure_logging, enable_profiling
+
 if getattr(sys, 'frozen', False):
     # frozen (cx_Freeze) mode: trick to be sure that Qt loads correctly even when the cli is called form another folder
     cur = os.getcwd()
@@ -18,17 +21,25 @@ else:
     # set the icon path for non-frozen mode
     _abs_icon_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'resources', 'envswitch.png')
 
-from PyQt5.QtCore import pyqtSignal, QObject, QFileInfo, QSettings
-from PyQt5.QtGui import QCloseEvent, QIcon
+_t_qt_import = perf_counter()
+from PyQt5.QtCore import pyqtSignal, QObject, QFileInfo, QSettings, QThread, Qt
+from PyQt5.QtGui import QCloseEvent, QCursor, QIcon
 from PyQt5.QtWidgets import QApplication, QMainWindow, QFileDialog, QAbstractButton, QDialogButtonBox, QWidget, \
-    QGridLayout, QFormLayout, QLabel, QLineEdit, QErrorMessage, QMessageBox
+    QFormLayout, QLabel, QLineEdit, QErrorMessage, QMessageBox, QMenu, QSystemTrayIcon, QProgressDialog, QSplitter, \
+    QVBoxLayout, QListView, QScrollArea, QAbstractItemView
+record('import.qt', perf_counter() - _t_qt_import)
 if getattr(sys, 'frozen', False):
     # frozen : set cwd back to normal now that Qt has been loaded
     os.chdir(cur)
 
 from copy import deepcopy
 
-from envswitch.env_config import GlobalEnvsConfig
+from envswitch.bundle import EnvsBundle, InvalidBundleException, is_bundle
+from envswitch.env_config import ApplyCancelledException, EnvConfig, GlobalEnvsConfig
+from envswitch.formats import detect_format, read_config, write_config, get_file_extensions
+from envswitch.history import EnvHistory, NoSuchSnapshotException
+from envswitch.lazy_values import LazyValue
+from envswitch.navigator import EnvListModel
 from envswitch.qt_design import Ui_MainWindow
 from envswitch.utils import get_version
 
@@ -68,7 +79,7 @@ class EnvSwitcherState:  # maybe one day convert to a QStandardItemModel ?
 
     The state of the application is composed of several things:
     * self.current_config_file: the path to the currently open configuration file. It can't be None and always
-    represents a valid file
+    represents a valid file, or a valid configuration directory containing *.yml/*.yaml files
     * self.current_configuration: the currently loaded configuration. It is the same than the one in the file if
     self.is_dirty = False
     * self.is_dirty: True if the current configuration has some modifications that are yet not saved.
@@ -88,6 +99,9 @@ class EnvSwitcherState:  # maybe one day convert to a QStandardItemModel ?
         # init the fields so that the IDE knows them :)
         self.current_configuration = None
         self.current_configuration_bak = None
+        self._read_only = False
+        # the last environment generated by a template, with its configuration, see _get_env
+        self._generated_env = None
 
         # Load the configuration at the given path (see property setter)
         self.current_config_file = configuration_file_path
@@ -113,10 +127,14 @@ class EnvSwitcherState:  # maybe one day convert to a QStandardItemModel ?
         """
         self.ensure_not_dirty()
 
-        # open the file and read the new current configuration
-        print("Opening configuration file : '" + new_conf_file_path + "'")
-        with open(new_conf_file_path, 'r') as f:
-            self.current_configuration = GlobalEnvsConfig.from_yaml(f)
+        # open the file (or the configuration directory) and read the new current configuration
+        if os.path.isdir(new_conf_file_path):
+            logger.info("Opening configuration directory : '" + new_conf_file_path + "'")
+        else:
+            logger.info("Opening configuration file : '" + new_conf_file_path + "'")
+        config_format = detect_format(new_conf_file_path)
+        self.current_configuration = read_config(new_conf_file_path, config_format.name)
+        self._read_only = config_format.save is None
 
         # keep a backup for 'cancel'
         self.current_configuration_bak = deepcopy(self.current_configuration)
@@ -131,6 +149,13 @@ class EnvSwitcherState:  # maybe one day convert to a QStandardItemModel ?
     def is_dirty(self):
         return self.current_configuration != self.current_configuration_bak
 
+    def is_read_only(self) -> bool:
+        """
+        :return: True if the current configuration file can only be loaded, not saved (compiled bundles). Modifications
+        then have to be saved to another file, see save_as
+        """
+        return self._read_only
+
     def ensure_not_dirty(self):
         """
         If the state is dirty, raises a DirtyStateException.
@@ -141,19 +166,29 @@ class EnvSwitcherState:  # maybe one day convert to a QStandardItemModel ?
 
     def save_modifications(self):
         """
-        Saves self.current_configuration to the disk at self.configuration_file_path
+        Saves self.current_configuration to the disk at self.configuration_file_path. Raises a
+        CouldNotSaveCurrentConfigurationException if that file is read-only (see is_read_only), so that the view
+        proposes to save it to another file instead
         :return:
         """
+        if self.is_read_only():
+            raise CouldNotSaveCurrentConfigurationException("'" + self.current_config_file + "' is a compiled bundle "
+                                                            "and can not be modified. Save the configuration to "
+                                                            "another file, and compile it again")
         if os.path.exists(self.current_config_file):
-            print("saving current configuration to : '" + str(self.current_config_file) + "'")
-            with open(self.current_config_file, mode='w') as f:
-                # save to yaml file
-                self.current_configuration.to_yaml(f)
-                # update the 'reference' data
-                self.current_configuration_bak = deepcopy(self.current_configuration)
-                # alert the view
-                # noinspection PyUnresolvedReferences
-                self.signals.current_config_changed_or_saved.emit(None)
+            if os.path.isdir(self.current_config_file):
+                logger.info("saving current configuration to directory : '" + str(self.current_config_file) + "'")
+            else:
+                logger.info("saving current configuration to : '" + str(self.current_config_file) + "'")
+            # save in the same format (for a yaml directory each environment is saved back to its own file). The
+            # serialized environments are kept in memory so that the next saves only serialize the modified ones:
+            # this trades memory (about the size of the saved file) for fast repeated saves of large configurations
+            write_config(self.current_configuration, self.current_config_file, use_cache=True)
+            # update the 'reference' data
+            self.current_configuration_bak = deepcopy(self.current_configuration)
+            # alert the view
+            # noinspection PyUnresolvedReferences
+            self.signals.current_config_changed_or_saved.emit(None)
         else:
             raise CouldNotSaveCurrentConfigurationException('File does not exist any more: ' + self.current_config_file)
 
@@ -163,14 +198,13 @@ class EnvSwitcherState:  # maybe one day convert to a QStandardItemModel ?
         :return:
         """
         if overwrite or not os.path.exists(new_file_path):
-            print("saving current configuration to : '" + str(new_file_path) + "'")
-            with open(new_file_path, mode='w') as f:
-                # save to yaml file
-                self.current_configuration.to_yaml(f)
-                # update the backup otherwise reopening the file will raise a DirtyStateException
-                self.current_configuration_bak = deepcopy(self.current_configuration)
-                # reopen it to alert the view
-                self.current_config_file = new_file_path
+            logger.info("saving current configuration to : '" + str(new_file_path) + "'")
+            # the format is determined by the file extension
+            write_config(self.current_configuration, new_file_path)
+            # update the backup otherwise reopening the file will raise a DirtyStateException
+            self.current_configuration_bak = deepcopy(self.current_configuration)
+            # reopen it to alert the view
+            self.current_config_file = new_file_path
         else:
             raise CouldNotSaveCurrentConfigurationException('File already exists: ' + new_file_path)
 
@@ -186,13 +220,36 @@ class EnvSwitcherState:  # maybe one day convert to a QStandardItemModel ?
         self.signals.current_config_changed_or_saved.emit(None)
 
     def get_env_ids(self) -> List[str]:
-        return list(self.current_configuration.envs)
+        """ The ids of all environments, including the ones generated by templates """
+        return self.current_configuration.get_available_envs()
+
+    def iter_env_names(self) -> Iterator[Tuple[str, str]]:
+        """ The (env_id, name) of all environments, including the ones generated by templates (not generated here) """
+        return self.current_configuration.iter_env_names()
 
     def get_env_name(self, env_id: str) -> str:
-        return self.current_configuration.envs[env_id].name
+        return self._get_env(env_id).name
 
     def get_env_variables(self, env_id: str) -> Dict[str, str]:
-        return self.current_configuration.envs[env_id].env_variables_dct
+        return self._get_env(env_id).env_variables_dct
+
+    def is_generated(self, env_id: str) -> bool:
+        """
+        :param env_id:
+        :return: True if environment `env_id` is generated by a template. It can then not be edited: its template has
+        to be edited in the configuration file
+        """
+        return env_id not in self.current_configuration.envs
+
+    def _get_env(self, env_id: str):
+        env = self.current_configuration.envs.get(env_id)
+        if env is not None:
+            return env
+        # generated environments are created on demand. The last one is kept, since the view asks for it repeatedly
+        if self._generated_env is None or self._generated_env[0] is not self.current_configuration \
+                or self._generated_env[1].id != env_id:
+            self._generated_env = (self.current_configuration, self.current_configuration.get_env(env_id))
+        return self._generated_env[1]
 
     def set_env_variable(self, env_id: str, var_name: str, var_value: str, cause: QObject=None):
         """
@@ -248,10 +305,64 @@ class PopupOnError(ContextDecorator):
         """ If an exception has been raised, display a popup"""
         if type is not None:
             # there was an exception, display a popup
-            QMessageBox.critical(self.parent, "Application",
-                                 "An unexpected error happened while executing this action: '" + str(value) + "'\n\n"
-                                 "Traceback: " + ''.join(format_exception(type, value, traceback)),
-                                 QMessageBox.NoButton)
+            PopupOnError.show_error(self.parent, value)
+
+    @staticmethod
+    def show_error(parent: QWidget, error: BaseException):
+        """
+        Displays the popup for `error`. This is used for errors raised in worker threads, see ApplyWorker
+        :param parent:
+        :param error:
+        :return:
+        """
+        QMessageBox.critical(parent, "Application",
+                             "An unexpected error happened while executing this action: '" + str(error) + "'\n\n"
+                             "Traceback: " + ''.join(format_exception(type(error), error, error.__traceback__)),
+                             QMessageBox.NoButton)
+
+
+class ApplyWorker(QThread):
+    """
+    Applies an environment in a worker thread, so that the GUI never freezes during a switch: writing to the registry
+    and broadcasting the change to other windows may take several seconds on windows, and lazy values may run helper
+    commands. Progress, success, cancellation and failure are reported with signals, received in the GUI thread.
+
+    Cancellation is requested with `requestInterruption()`. It is checked between variables until they are written,
+    see EnvConfig.apply.
+    """
+    # (done, total, variable name or '' once all variables are written)
+    progress = pyqtSignal(int, int, str)
+    # the environment id
+    succeeded = pyqtSignal(str)
+    cancelled = pyqtSignal(str)
+    # the exception
+    failed = pyqtSignal(object)
+
+    def __init__(self, env: EnvConfig, whole_machine: bool, parent: QObject=None):
+        """
+        :param env: the environment to apply. It should not be modified while it is applied, use a copy
+        :param whole_machine:
+        :param parent:
+        """
+        super(ApplyWorker, self).__init__(parent)
+        self.env = env
+        self.whole_machine = whole_machine
+
+    def run(self):
+        try:
+            self.env.apply(whole_machine=self.whole_machine, progress=self._report_progress,
+                           should_cancel=self.isInterruptionRequested)
+        except ApplyCancelledException:
+            logger.info("Applying environment '" + self.env.id + "' was cancelled")
+            self.cancelled.emit(self.env.id)
+        except Exception as e:
+            logger.exception("Could not apply environment '" + self.env.id + "'")
+            self.failed.emit(e)
+        else:
+            self.succeeded.emit(self.env.id)
+
+    def _report_progress(self, done: int, total: int, var_name: str):
+        self.progress.emit(done, total, var_name or '')
 
 
 class FileAwareMixin(QWidget):
@@ -262,14 +373,16 @@ class FileAwareMixin(QWidget):
 
     def setup_file_aware(self, file_type_short: str, file_extensions: List[str], enable_when_dirty: List[QObject],
                          open_signals: List, save_signals: List, save_as_signals: List, cancel_signals: List,
-                         quit_signals: List):
+                         quit_signals: List, save_file_extensions: List[str] = None):
         """
         This function needs to be called once in order to configure the object
         :param enable_when_dirty:
+        :param save_file_extensions: the extensions proposed by 'save as', if they differ from `file_extensions`
         :return:
         """
         self.file_type_short = file_type_short
         self.file_extensions = file_extensions
+        self.save_file_extensions = save_file_extensions if save_file_extensions is not None else file_extensions
         self.enable_when_dirty = enable_when_dirty
 
         for signal in open_signals:
@@ -291,7 +404,7 @@ class FileAwareMixin(QWidget):
     def rslot_current_file_changed(self):  # , file: QFileInfo=None
         """
         This right slot should be called whenever the file has been changed.
-        We have to recreate the tabs view and update the title bar
+        We have to recreate the environments view and update the title bar
         :return:
         """
         with PopupOnError(self):
@@ -312,7 +425,7 @@ class FileAwareMixin(QWidget):
     def rslot_current_file_contents_changed_or_saved(self, cause=None):
         """
         Should be called whenever the current contents is changed or saved.
-        * refreshes all QLineEdit widgets in the tabs
+        * refreshes all QLineEdit widgets of the view
         * check the 'dirtiness' and update the window title, menu bar and buttons accordingly
         :return:
         """
@@ -349,11 +462,11 @@ class FileAwareMixin(QWidget):
 
                     # 'cancel' will return without exception but with an empty config_file_path
                     if file_path == '':
-                        print('User cancelled opening file.')
+                        logger.info('User cancelled opening file.')
                         return
                 except FileNotFoundError:
                     # 'exit' button press will raise a FileNotFoundError
-                    print('User cancelled opening file.')
+                    logger.info('User cancelled opening file.')
                     return
 
                 # call the logic finally
@@ -392,10 +505,10 @@ class FileAwareMixin(QWidget):
             new_file_path, _ = QFileDialog.getSaveFileName(parent=self,
                                                            caption='Save ' + self.file_type_short + ' File As...',
                                                            filter=self.file_type_short + " files ("
-                                                           + ' '.join(self.file_extensions) + ")")
+                                                           + ' '.join(self.save_file_extensions) + ")")
             # 'cancel' will return without exception but with an empty config_file_path
             if new_file_path == '':
-                print('User cancelled saving file.')
+                logger.info('User cancelled saving file.')
                 return False
 
             # save
@@ -405,7 +518,7 @@ class FileAwareMixin(QWidget):
 
         except FileNotFoundError:
             # 'exit' button press will raise a FileNotFoundError
-            print('User cancelled saving file.')
+            logger.info('User cancelled saving file.')
             return False
 
     @abstractmethod
@@ -440,7 +553,7 @@ class FileAwareMixin(QWidget):
             # try to save persisted state >> no need anymore, the QSettings() do it for us automatically
             # can_exit = self.internal_state.persist_state_to_disk(
             #                                      self.get_file_path(EnvSwitcherApp.PERSISTED_STATE_FILE))
-            print('Terminating...')
+            logger.info('Terminating...')
             event.accept()
         else:
             event.ignore()
@@ -477,23 +590,21 @@ class EnvSwitcherView(QMainWindow, Ui_MainWindow, FileAwareMixin):
     The 'View' in the MVC pattern.
 
     The static design is generated from qt_designer in qt_design.py. The rest concerns
-    * how the view is dynamically created when a new model is loaded (see recreate_tabs_view)
+    * how the view is dynamically created when a new model is loaded (see recreate_envs_view): a navigator lists the
+    environments, and a single editor pane displays the variables of the selected one
     * the slots related to file menu actions, See also Main window tutorial:
     http://doc.qt.io/qt-5/qtwidgets-mainwindows-application-example.html
 
     """
 
-    ENV_TAB_WIDGET_PREFIX = "envTab_"
     TARGET_IS_WHOLE_MACHINE = 'target_is_whole_machine'
 
-    # TODO allow user to add & rename tabs see https://stackoverflow.com/questions/44450775/pyqt-gui-with-multiple-tabs
-
-    def __init__(self, apply_environment_hook, set_environment_target_hook, initial_config: Dict):
+    def __init__(self, create_apply_worker_hook, set_environment_target_hook, initial_config: Dict):
         """
         Creates the main application's window.
         The controller should provide method hooks for all main events.
-        :param apply_environment_hook: a function that will be called when the user clicks on 'apply'. It should have
-        one input that is the environment id
+        :param create_apply_worker_hook: a function that will be called when the user clicks on 'apply'. It should have
+        one input that is the environment id, and return an ApplyWorker that is not started yet
         :param set_environment_target_hook: a function that will be called when the user changes the 'environment
         target' setting. It should have one boolean input indicating if the target is the whole machine or not.
         """
@@ -506,7 +617,7 @@ class EnvSwitcherView(QMainWindow, Ui_MainWindow, FileAwareMixin):
         # noinspection PyTypeChecker
         self.setWindowTitle(None)
 
-        # **** remove the part of generated code responsible for the tab, it will be replaced with dynamic tabs later
+        # **** remove the part of generated code responsible for the tabs, they are replaced with a navigator
         # -- retrieve various information we want to remember about the tab
         self.env_tab_size_policy_from_design = self.envTab1.sizePolicy()
         self.var_line_edit_size_policy_from_design = self.var1LineEdit.sizePolicy()
@@ -521,10 +632,14 @@ class EnvSwitcherView(QMainWindow, Ui_MainWindow, FileAwareMixin):
         del self.var2Label
         del self.var2LineEdit
         # del self.envTab1TableView
+        self._create_navigator()
 
         # **** connect buttons and menu actions to events
         # -- file-related: we use this helper class
-        self.setup_file_aware(file_type_short='Configuration', file_extensions=['*.yml', '*.yaml'],
+        # compiled bundles can be opened but not saved
+        self.setup_file_aware(file_type_short='Configuration', file_extensions=['*.' + ext for ext in
+                                                                                get_file_extensions()],
+                              save_file_extensions=['*.' + ext for ext in get_file_extensions(savable_only=True)],
                               enable_when_dirty=[self.actionSave, self.mainButtonBox.buttons()[0],
                                                  self.mainButtonBox.buttons()[1]],
                               open_signals=[self.actionOpen.triggered],
@@ -535,9 +650,11 @@ class EnvSwitcherView(QMainWindow, Ui_MainWindow, FileAwareMixin):
                               )
 
         # -- apply current environment
-        self.apply_environment_hook = apply_environment_hook
+        self.create_apply_worker_hook = create_apply_worker_hook
+        # the ApplyWorker currently running, if any
+        self.apply_worker = None
         def clicked_hook(button: QAbstractButton):
-            if button.foregroundRole() == QDialogButtonBox.ApplyRole:
+            if self.mainButtonBox.buttonRole(button) == QDialogButtonBox.ApplyRole:
                 self.lslot_apply_clicked()
         self.mainButtonBox.clicked.connect(clicked_hook)
 
@@ -559,17 +676,76 @@ class EnvSwitcherView(QMainWindow, Ui_MainWindow, FileAwareMixin):
         self.actionSet_for_current_user.triggered.connect(partial(set_environment_target_hook, whole_machine=False))
         self.actionSet_for_local_machine.triggered.connect(partial(set_environment_target_hook, whole_machine=True))
 
-        # *** the list of value editors that will be used in rslot_current_file_contents_changed_or_saved
+        # *** the value editors of the environment displayed in the editor pane, used in
+        # rslot_current_file_contents_changed_or_saved. They are the first ones of self._editor_rows
         self.line_editors = []
 
+    def _create_navigator(self):
+        """
+        Replaces the tabs of the generated design with a navigator (a filter and the list of the environments) and a
+        single editor pane displaying the variables of the selected environment. The list view only creates what is
+        visible, and the editor pane reuses its widgets, so the number of environments does not change the number of
+        widgets.
+        :return:
+        """
+        # -- the navigator
+        navigator = QWidget()
+        navigator_layout = QVBoxLayout(navigator)
+        navigator_layout.setContentsMargins(0, 0, 0, 0)
+        self.envFilterLineEdit = QLineEdit(navigator)
+        self.envFilterLineEdit.setObjectName("envFilterLineEdit")
+        self.envFilterLineEdit.setPlaceholderText('Filter environments')
+        self.envFilterLineEdit.setClearButtonEnabled(True)
+        navigator_layout.addWidget(self.envFilterLineEdit)
+        self.envs_model = EnvListModel(self)
+        self.envsListView = QListView(navigator)
+        self.envsListView.setObjectName("envsListView")
+        self.envsListView.setUniformItemSizes(True)
+        self.envsListView.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.envsListView.setModel(self.envs_model)
+        navigator_layout.addWidget(self.envsListView)
+
+        # -- the editor pane
+        self.envEditorScrollArea = QScrollArea()
+        self.envEditorScrollArea.setObjectName("envEditorScrollArea")
+        self.envEditorScrollArea.setWidgetResizable(True)
+        self.envEditorWidget = QWidget()
+        self.envEditorWidget.setObjectName("envEditorWidget")
+        # reuse size policy from generated code
+        self.envEditorWidget.setSizePolicy(self.env_tab_size_policy_from_design)
+        self.envEditorFormLayout = QFormLayout(self.envEditorWidget)
+        self.envEditorFormLayout.setObjectName("envEditorFormLayout")
+        self.envEditorScrollArea.setWidget(self.envEditorWidget)
+        # the (label, editor) rows of the form, reused from one environment to the other. Rows that are not needed by
+        # the current environment are hidden
+        self._editor_rows = []
+
+        # -- replace the tabs
+        self.envsSplitter = QSplitter(Qt.Horizontal, self.centralwidget)
+        self.envsSplitter.setObjectName("envsSplitter")
+        self.envsSplitter.addWidget(navigator)
+        self.envsSplitter.addWidget(self.envEditorScrollArea)
+        self.envsSplitter.setStretchFactor(1, 1)
+        self.verticalLayout.replaceWidget(self.envsTabWidget, self.envsSplitter)
+        self.envsTabWidget.close()
+        self.envsTabWidget.deleteLater()
+        del self.envsTabWidget
+
+        # the id of the environment displayed in the editor pane, if any
+        self.current_env_id = None
+        # noinspection PyUnresolvedReferences
+        self.envsListView.selectionModel().currentChanged.connect(self.lslot_current_env_changed)
+        # noinspection PyUnresolvedReferences
+        self.envFilterLineEdit.textChanged.connect(self.lslot_filter_changed)
+
     # noinspection PyUnresolvedReferences
     def set_model(self, state: EnvSwitcherState):
         """
         Associates the view with the given state.
 
-        Binds the QTabWidget http://doc.qt.io/qt-5/qtabwidget.html in this view to the state, by
-        * creating one tab for each environment
-        * and binding each tab widgets to the model thanks to dedicated signals-slots
+        Binds the navigator and the editor pane in this view to the state, by
+        * listing the environments in the navigator
+        * and binding the editor pane widgets to the model thanks to dedicated signals-slots
 
         :param state:
         :return:
@@ -579,88 +755,147 @@ class EnvSwitcherView(QMainWindow, Ui_MainWindow, FileAwareMixin):
         state.signals.current_file_changed.connect(self.rslot_current_file_changed)
         self.state = state
 
-        # refresh the tabs and current file name
+        # refresh the navigator and current file name
         self.rslot_current_file_changed()
 
         # refresh the buttons status according to 'dirtiness' of the state
         self.rslot_current_file_contents_changed_or_saved()
 
     class EnvVarEditor(QLineEdit):
-        """ A QLineEdit to edit an environment variable value. It remembers the associated env id and var name """
+        """
+        A QLineEdit to edit an environment variable value. It remembers the associated env id and var name, that change
+        when the editor is reused for another environment
+        """
         def __init__(self, parent, env_id, var_name):
             super(EnvSwitcherView.EnvVarEditor, self).__init__(parent)
             self.env_id = env_id
             self.var_name = var_name
 
-    def recreate_tabs_view(self, state: EnvSwitcherState):
+    def recreate_envs_view(self, state: EnvSwitcherState):
         """
-        Destroys all tabs in the view and creates them again according to the given state
+        Lists the environments of the given state in the navigator, and displays the previously selected environment
+        again if it still exists, or the first one
         :param state:
         :return:
         """
-        # Remove all existing tabs
-        for tab_idx in range(0, self.envsTabWidget.count()):
-            tab_widget = self.envsTabWidget.widget(0)
-            tab_widget.close()
-            tab_widget.deleteLater()
-            del tab_widget
-            self.envsTabWidget.removeTab(0)
-
-        # clear the list of value editors (used in self.lslot_apply_current_env)
-        self.line_editors.clear()
-
-        # For each environment described in the state, create a tab
-        for env_id in state.get_env_ids():
-
-            # Create tab widget
-            new_env_tab = QWidget()
-            new_env_tab.setSizePolicy(self.env_tab_size_policy_from_design)  # reuse size policy from generated code
-            new_env_tab.setObjectName(EnvSwitcherView.ENV_TAB_WIDGET_PREFIX + env_id)  # object name > reuse id
-
-            # Apply a Grid layout on the tab
-            new_tab_grid_layout = QGridLayout(new_env_tab)
-            new_tab_grid_layout.setContentsMargins(11, 11, 11, 11)
-            new_tab_grid_layout.setObjectName("envTab_" + env_id + "_GridLayout")
-
-            # There are two ways that we could design the widget
-            # (1) a form >> in that case it is not possible to reuse a QTableModel
-            # Create a form layout inside the tab
-            new_env_tab_form_layout = QFormLayout()
-            new_env_tab_form_layout.setObjectName("envTab_" + env_id + "_FormLayout")
-
-            # Fill the form with as many rows as needed
-            idx = 0
-            for var_name, var_value in state.get_env_variables(env_id).items():
-                idx += 1
-
-                # label
-                var_label = QLabel(new_env_tab)
-                var_label.setObjectName("envTab_" + env_id + "_var_" + str(idx) + "_Label")
-                var_label.setText(var_name)
-                new_env_tab_form_layout.setWidget(idx, QFormLayout.LabelRole, var_label)
-
-                # line edit
-                var_value_editor = EnvSwitcherView.EnvVarEditor(new_env_tab, env_id, var_name)
-                var_value_editor.setSizePolicy(self.var_line_edit_size_policy_from_design)
-                var_value_editor.setObjectName("envTab_" + env_id + "_var_" + str(idx) + "_LineEdit")
-                var_value_editor.setText(var_value)
-                # link to model, bidirectional
-                # -- editor > model
-                # noinspection PyUnresolvedReferences
-                var_value_editor.textEdited.connect(state.create_slot_set_env_variable(env_id, var_name,
-                                                                                       var_value_editor))
-                # -- model > editor
-                self.line_editors.append(var_value_editor)
-                new_env_tab_form_layout.setWidget(idx, QFormLayout.FieldRole, var_value_editor)
-
-            new_tab_grid_layout.addLayout(new_env_tab_form_layout, 0, 0, 1, 1)
-
-            # (2) other option: a TableView mapped to a TableModel --> too ugly :(  (still available in the git history)
-
-            # Finally add the tab with the appropriate name
-            self.envsTabWidget.addTab(new_env_tab, state.get_env_name(env_id))
-
-        print('Done refreshing environment tabs to reflect opened configuration')
+        with span('gui.recreate_envs'):
+            self.envs_model.set_envs(state.iter_env_names())
+            self._restore_selection()
+
+        logger.info('Done refreshing environments list to reflect opened configuration')
+
+    def _restore_selection(self):
+        """ Selects self.current_env_id in the navigator if it is listed, otherwise the first listed environment """
+        # the model was reset: the editor pane still displays self.current_env_id
+        row = None if self.current_env_id is None else self.envs_model.get_row(self.current_env_id)
+        if row is None and self.envs_model.rowCount() > 0:
+            row = 0
+        if row is None:
+            self.show_env(None)
+        else:
+            self.select_env(self.envs_model.get_env_id(row))
+
+    def select_env(self, env_id: str):
+        """
+        Selects environment `env_id` in the navigator, and displays it in the editor pane
+        :param env_id:
+        :return:
+        """
+        row = self.envs_model.get_row(env_id)
+        if row is None:
+            raise ValueError("Environment '" + env_id + "' is not listed in the navigator")
+        self.envsListView.setCurrentIndex(self.envs_model.index(row))
+        # setCurrentIndex does not notify if the row did not change but the model was reset
+        if self.current_env_id != env_id:
+            self.show_env(env_id)
+
+    def lslot_current_env_changed(self, current, previous=None):
+        """
+        Called by the navigator when the selected environment changes
+        :param current: the index of the new current row
+        :param previous:
+        :return:
+        """
+        if current.isValid():
+            self.show_env(self.envs_model.get_env_id(current.row()))
+
+    def lslot_filter_changed(self, text: str):
+        """
+        Called by the filter field of the navigator when its text changes
+        :param text:
+        :return:
+        """
+        self.envs_model.set_filter(text)
+        self._restore_selection()
+
+    def show_env(self, env_id: str = None):
+        """
+        Displays the variables of environment `env_id` in the editor pane, reusing the existing rows
+        :param env_id: the environment to display, or None to display nothing
+        :return:
+        """
+        variables = dict() if env_id is None else self.state.get_env_variables(env_id)
+        generated = env_id is not None and self.state.is_generated(env_id)
+        self.current_env_id = env_id
+        while len(self._editor_rows) < len(variables):
+            self._add_editor_row()
+
+        self.line_editors = []
+        for (var_label, var_value_editor), (var_name, var_value) in zip(self._editor_rows, variables.items()):
+            var_label.setText(var_name)
+            var_value_editor.env_id = env_id
+            var_value_editor.var_name = var_name
+            var_value_editor.setText(str(var_value))
+            if generated:
+                # environments generated by a template can only be modified by editing the template
+                var_value_editor.setReadOnly(True)
+                var_value_editor.setToolTip('Generated by a template: edit the template in the configuration file')
+            elif isinstance(var_value, LazyValue):
+                # values resolved when applied (files, helper commands) can only be edited in the configuration file
+                var_value_editor.setReadOnly(True)
+                var_value_editor.setToolTip('Resolved when the environment is applied: ' + repr(var_value))
+            elif not isinstance(var_value, str):
+                # list variables operations (prepend, append...) can only be edited in the configuration file
+                var_value_editor.setReadOnly(True)
+                var_value_editor.setToolTip('List variable operations: ' + repr(var_value))
+            else:
+                var_value_editor.setReadOnly(False)
+                var_value_editor.setToolTip('')
+            self.line_editors.append(var_value_editor)
+
+        for idx, (var_label, var_value_editor) in enumerate(self._editor_rows):
+            var_label.setVisible(idx < len(variables))
+            var_value_editor.setVisible(idx < len(variables))
+
+    def _add_editor_row(self):
+        """ Adds a row to the form of the editor pane """
+        idx = len(self._editor_rows) + 1
+
+        # label
+        var_label = QLabel(self.envEditorWidget)
+        var_label.setObjectName("envVar_" + str(idx) + "_Label")
+
+        # line edit
+        var_value_editor = EnvSwitcherView.EnvVarEditor(self.envEditorWidget, None, None)
+        var_value_editor.setSizePolicy(self.var_line_edit_size_policy_from_design)
+        var_value_editor.setObjectName("envVar_" + str(idx) + "_LineEdit")
+        # link to model, bidirectional
+        # -- editor > model
+        # noinspection PyUnresolvedReferences
+        var_value_editor.textEdited.connect(partial(self.lslot_var_value_edited, var_value_editor))
+        # -- model > editor: see refresh_view_on_file_contents_changed_or_saved
+
+        self.envEditorFormLayout.addRow(var_label, var_value_editor)
+        self._editor_rows.append((var_label, var_value_editor))
+
+    def lslot_var_value_edited(self, var_value_editor: 'EnvSwitcherView.EnvVarEditor', text: str):
+        """
+        Called by the value editors of the editor pane when the user edits them
+        :param var_value_editor:
+        :param text:
+        :return:
+        """
+        self.state.set_env_variable(var_value_editor.env_id, var_value_editor.var_name, text, var_value_editor)
 
     def get_current_file(self):
         """ Overridden from FileAwareMixin """
@@ -668,12 +903,12 @@ class EnvSwitcherView(QMainWindow, Ui_MainWindow, FileAwareMixin):
 
     def refresh_view_on_file_change(self):
         """ Overridden from FileAwareMixin """
-        self.recreate_tabs_view(self.state)
+        self.recreate_envs_view(self.state)
 
     def refresh_view_on_file_contents_changed_or_saved(self, cause):
         """
         Called whenever the current configuration data is changed or saved.
-        * refreshes all QLineEdit widgets in the tabs
+        * refreshes the QLineEdit widgets of the editor pane
         * check the 'dirtiness' and update the window title, menu bar and buttons accordingly
         :return:
         """
@@ -681,7 +916,7 @@ class EnvSwitcherView(QMainWindow, Ui_MainWindow, FileAwareMixin):
         for var_value_editor in self.line_editors:
             if cause != var_value_editor:
                 var_value_editor.setText(
-                    self.state.get_env_variables(var_value_editor.env_id)[var_value_editor.var_name])
+                    str(self.state.get_env_variables(var_value_editor.env_id)[var_value_editor.var_name]))
 
     def is_dirty(self):
         """ Overriden from FileAwareMixin """
@@ -714,9 +949,55 @@ class EnvSwitcherView(QMainWindow, Ui_MainWindow, FileAwareMixin):
         :return:
         """
         with PopupOnError(self):
-            current_tab_widget = self.envsTabWidget.currentWidget()
-            env_id = current_tab_widget.objectName()[len(EnvSwitcherView.ENV_TAB_WIDGET_PREFIX):]
-            self.apply_environment_hook(env_id)
+            if self.apply_worker is not None:
+                return
+            if self.current_env_id is None:
+                return
+            self.start_apply(self.create_apply_worker_hook(self.current_env_id))
+
+    def start_apply(self, worker: ApplyWorker):
+        """
+        Starts `worker` and follows it with a progress dialog, that is only displayed if applying takes some time.
+        The dialog's 'Cancel' button requests the cancellation. Errors are displayed in a popup, see PopupOnError.
+        :param worker:
+        :return:
+        """
+        self.apply_worker = worker
+        apply_button = self.mainButtonBox.button(QDialogButtonBox.Apply)
+        apply_button.setEnabled(False)
+
+        dialog = QProgressDialog("Applying environment '" + worker.env.name + "'...", 'Cancel', 0, 0, self)
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(500)
+        dialog.setAutoClose(False)
+        dialog.setAutoReset(False)
+        # noinspection PyUnresolvedReferences
+        dialog.canceled.connect(worker.requestInterruption)
+
+        def on_progress(done: int, total: int, var_name: str):
+            dialog.setMaximum(total)
+            dialog.setValue(done)
+            if var_name:
+                dialog.setLabelText("Applying environment '" + worker.env.name + "': " + var_name)
+
+        def on_finished():
+            dialog.close()
+            dialog.deleteLater()
+            apply_button.setEnabled(True)
+            self.apply_worker = None
+
+        worker.progress.connect(on_progress)
+        worker.failed.connect(partial(PopupOnError.show_error, self))
+        # noinspection PyUnresolvedReferences
+        worker.finished.connect(on_finished)
+        worker.start()
+
+    def closeEvent(self, event: QCloseEvent):
+        """ Overridden from FileAwareMixin: an environment being applied is never interrupted in the middle """
+        if self.apply_worker is not None:
+            self.apply_worker.requestInterruption()
+            self.apply_worker.wait()
+        super(EnvSwitcherView, self).closeEvent(event)
 
 
 class FileRestoreException(Exception):
@@ -752,15 +1033,16 @@ class EnvSwitcherAppHeadless(QApplication):
         self.settings = QSettings()
 
         # set to none explicitly so that subclasses may see when init has failed
+        self.bundle = None
         self.internal_state = None
 
         if config_file_path is None:
             # config_file_path = None means 'open the last opened file'
             config_file_path = self.get_last_opened_file()
             try:
-                print("Restoring last open file: " + config_file_path)
-                self.internal_state = EnvSwitcherState(configuration_file_path=config_file_path)
-                print("Opened file successfully: " + config_file_path)
+                logger.info("Restoring last open file: " + config_file_path)
+                self._open(config_file_path)
+                logger.info("Opened file successfully: " + config_file_path)
 
             except Exception as e:  # FileNotFoundError, PermissionError, CouldNotRestoreStateException
                 raise FileRestoreException("Could not restore last open file : " + str(e)).with_traceback(
@@ -768,18 +1050,47 @@ class EnvSwitcherAppHeadless(QApplication):
         else:
             # load the specified file
             try:
-                print("Opening file: " + config_file_path)
-                self.internal_state = EnvSwitcherState(configuration_file_path=config_file_path)
-                print("Opened file successfully: " + config_file_path)
+                logger.info("Opening file: " + config_file_path)
+                self._open(config_file_path)
+                logger.info("Opened file successfully: " + config_file_path)
 
             except Exception as e:  # FileNotFoundError, PermissionError, CouldNotRestoreStateException
                 raise FileRestoreException("Could not open file : " + str(e)).with_traceback(e.__traceback__)
 
+    def _open(self, config_file_path: str):
+        """
+        Opens a configuration file. Compiled bundles are opened with mmap and the full configuration is only loaded
+        when the internal state is first needed, so that looking up a single environment (see get_env) is fast.
+
+        :param config_file_path:
+        :return:
+        """
+        if is_bundle(config_file_path):
+            try:
+                self.bundle = EnvsBundle(config_file_path)
+                return
+            except InvalidBundleException:
+                # the state falls back to the source configuration if possible, see load_bundle
+                pass
+        self.internal_state = EnvSwitcherState(configuration_file_path=config_file_path)
+
+    @property
+    def internal_state(self) -> EnvSwitcherState:
+        if self._internal_state is None and self.bundle is not None:
+            self._internal_state = EnvSwitcherState(configuration_file_path=self.bundle.path)
+        return self._internal_state
+
+    @internal_state.setter
+    def internal_state(self, state: EnvSwitcherState):
+        self._internal_state = state
+
     def get_current_config_file_path(self) -> str:
         """
 
         :return: the path to the currently loaded file
         """
+        if self._internal_state is None and self.bundle is not None:
+            return self.bundle.path
         return self.internal_state.current_config_file
 
     def get_current_config(self) -> GlobalEnvsConfig:
@@ -791,11 +1102,31 @@ class EnvSwitcherAppHeadless(QApplication):
         """
         return self.internal_state.current_configuration
 
+    def get_available_envs(self) -> List[str]:
+        """
+        :return: the list of environment ids available in the currently loaded configuration
+        """
+        if self._internal_state is None and self.bundle is not None:
+            return self.bundle.get_available_envs()
+        return self.get_current_config().get_available_envs()
+
+    def get_env(self, env_id: str) -> EnvConfig:
+        """
+        Returns environment 'id' of the currently loaded configuration. If a bundle is open, only this environment is
+        read from the bundle.
+
+        :param env_id:
+        :return:
+        """
+        if self._internal_state is None and self.bundle is not None:
+            return self.bundle.get_env(env_id)
+        return self.get_current_config().get_env(env_id)
+
     def get_last_opened_file(self):
         return self.settings.value(EnvSwitcherApp.SETTING_LAST_OPENED_FILE_PATH, type=str) or ''
 
     def _persist_last_opened_file(self, file_path):
-        print("saving last open file path for future launches : '" + file_path + "'")
+        logger.info("saving last open file path for future launches : '" + file_path + "'")
         self.settings.setValue(EnvSwitcherApp.SETTING_LAST_OPENED_FILE_PATH, file_path)
 
     def persist_last_opened_file(self):
@@ -804,7 +1135,7 @@ class EnvSwitcherAppHeadless(QApplication):
         remember it
         :return:
         """
-        file_path = self.internal_state.current_config_file
+        file_path = self.get_current_config_file_path()
         self._persist_last_opened_file(file_path)
 
     def set_target_whole_machine(self, whole_machine: bool):
@@ -814,7 +1145,152 @@ class EnvSwitcherAppHeadless(QApplication):
         return self.settings.value(EnvSwitcherApp.SETTING_TARGET_IS_WHOLE_MACHINE, type=bool) or False
 
     def apply_environment(self, env_id):
-        self.internal_state.apply(env_id, whole_machine=self.is_target_whole_machine())
+        # if a bundle is open and the full configuration is not loaded yet, only this environment is read
+        self.get_env(env_id).apply(whole_machine=self.is_target_whole_machine())
+
+    def create_apply_worker(self, env_id) -> ApplyWorker:
+        """
+        Returns a worker thread applying environment `env_id`, see ApplyWorker. It is not started. A copy of the
+        environment is applied, so that the configuration can still be edited meanwhile.
+
+        :param env_id:
+        :return:
+        """
+        worker = ApplyWorker(deepcopy(self.get_env(env_id)), self.is_target_whole_machine(), parent=self)
+        # noinspection PyUnresolvedReferences
+        worker.finished.connect(worker.deleteLater)
+        return worker
+
+
+class EnvSwitcherTray(QSystemTrayIcon):
+    """
+    The system tray icon of the resident mode (see EnvSwitcherApp). Its menu lists the environments of the current
+    configuration, so that one can be applied with a single click. The menu is only rebuilt when the current
+    configuration changed since it was last shown.
+    """
+
+    # the maximum number of environments listed in the menu. The others are available in the main window
+    MAX_MENU_ENVS = 40
+
+    def __init__(self, app: 'EnvSwitcherApp'):
+        super(EnvSwitcherTray, self).__init__(QIcon(_abs_icon_path), app)
+        self.app = app
+        self.setToolTip('EnvSwitch')
+
+        # the ApplyWorker currently running, if any
+        self.apply_worker = None
+
+        # the id of the environment last applied, marked in the menu
+        try:
+            self.current_env_id = EnvHistory().get_snapshot().env_id
+        except NoSuchSnapshotException:
+            self.current_env_id = None
+
+        # the configuration the menu was built for, see refresh_menu
+        self._menu_key = None
+        self.menu = QMenu()
+        # noinspection PyUnresolvedReferences
+        self.menu.aboutToShow.connect(self.refresh_menu)
+        self.setContextMenu(self.menu)
+        # noinspection PyUnresolvedReferences
+        self.activated.connect(self.lslot_activated)
+
+    def _get_menu_key(self):
+        if self.app._internal_state is None:
+            if self.app.bundle is None:
+                return None
+            config_key = (self.app.bundle.path, None)
+        else:
+            config_key = (self.app.get_current_config_file_path(), self.app.get_current_config().content_hash())
+        return config_key + (self.current_env_id, self.app.is_target_whole_machine())
+
+    def refresh_menu(self):
+        """
+        Rebuilds the menu if the configuration changed since it was last built (another file was opened, or it was
+        modified in the main window)
+        :return:
+        """
+        menu_key = self._get_menu_key()
+        if menu_key is not None and menu_key == self._menu_key:
+            return
+        self._menu_key = menu_key
+
+        with span('gui.tray_menu'):
+            self.menu.clear()
+            if menu_key is None:
+                self.menu.addAction('No configuration file').setEnabled(False)
+            else:
+                env_ids = self.app.get_available_envs()
+                for env_id in env_ids[:self.MAX_MENU_ENVS]:
+                    action = self.menu.addAction(self._get_env_name(env_id))
+                    action.setCheckable(True)
+                    action.setChecked(env_id == self.current_env_id)
+                    # noinspection PyUnresolvedReferences
+                    action.triggered.connect(partial(self.lslot_apply, env_id))
+                if len(env_ids) > self.MAX_MENU_ENVS:
+                    self.menu.addAction(str(len(env_ids) - self.MAX_MENU_ENVS) + ' more environment(s) in the '
+                                        'main window').setEnabled(False)
+
+            self.menu.addSeparator()
+            whole_machine_action = self.menu.addAction('Set for local machine')
+            whole_machine_action.setCheckable(True)
+            whole_machine_action.setChecked(self.app.is_target_whole_machine())
+            # noinspection PyUnresolvedReferences
+            whole_machine_action.triggered.connect(self.lslot_whole_machine_toggled)
+            # noinspection PyUnresolvedReferences
+            self.menu.addAction('Open EnvSwitch...').triggered.connect(self.app.show_main_window)
+            # noinspection PyUnresolvedReferences
+            self.menu.addAction('Quit').triggered.connect(self.app.lslot_quit)
+
+    def _get_env_name(self, env_id: str) -> str:
+        if self.app._internal_state is None and self.app.bundle is not None:
+            # read from the bundle, do not load the whole configuration
+            return self.app.bundle.get_env(env_id).name
+        return self.app.get_current_config().get_env(env_id).name
+
+    def lslot_activated(self, reason):
+        """ A click on the icon shows the menu (by default only a right-click does on some platforms) """
+        if reason == QSystemTrayIcon.Trigger:
+            self.refresh_menu()
+            self.menu.popup(QCursor.pos())
+
+    def lslot_whole_machine_toggled(self, whole_machine: bool):
+        self.app.set_target_whole_machine(whole_machine)
+        if self.app.ui is not None:
+            self.app.ui.actionSet_for_local_machine.setChecked(whole_machine)
+            self.app.ui.actionSet_for_current_user.setChecked(not whole_machine)
+
+    def lslot_apply(self, env_id: str):
+        """
+        Called when an environment is selected in the menu. It is applied in a worker thread (see ApplyWorker), and
+        the result is reported with a notification
+        :param env_id:
+        :return:
+        """
+        if self.apply_worker is not None:
+            self.showMessage('EnvSwitch', "Environment '" + self.apply_worker.env.name + "' is still being applied",
+                             QSystemTrayIcon.Warning, 3000)
+            return
+        try:
+            self.apply_worker = self.app.create_apply_worker(env_id)
+        except Exception as e:
+            self.rslot_apply_failed(e)
+            return
+        self.apply_worker.succeeded.connect(self.rslot_applied)
+        self.apply_worker.failed.connect(self.rslot_apply_failed)
+        # noinspection PyUnresolvedReferences
+        self.apply_worker.finished.connect(self.rslot_apply_finished)
+        self.apply_worker.start()
+
+    def rslot_applied(self, env_id: str):
+        self.showMessage('EnvSwitch', "Environment '" + self.apply_worker.env.name + "' applied",
+                         QSystemTrayIcon.Information, 3000)
+
+    def rslot_apply_failed(self, error: Exception):
+        self.showMessage('EnvSwitch', 'Could not apply environment: ' + str(error), QSystemTrayIcon.Critical)
+
+    def rslot_apply_finished(self):
+        self.apply_worker = None
 
 
 class EnvSwitcherApp(EnvSwitcherAppHeadless):
@@ -827,12 +1303,16 @@ class EnvSwitcherApp(EnvSwitcherAppHeadless):
     It is responsible to handle the current state, map it to persistence layer, and refresh the views.
     """
 
-    def __init__(self, argv, config_file_path: str = None):
+    def __init__(self, argv, config_file_path: str = None, tray: bool = False):
         """
         Initializes the application in gui mode
 
         :param argv: generic Qt arguments for the underlying Qt application
         :param config_file_path: the alternate config file to use instead of the last one loaded by the app
+        :param tray: if True the application starts in resident mode: only an icon is displayed in the system tray,
+        with a menu to apply environments, and the main window is only created when it is first opened. Closing the
+        main window does not terminate the application, use the 'Quit' item of the menu. If the platform has no
+        system tray, the main window is displayed as usual.
         """
 
         # ** Application + Model **
@@ -843,39 +1323,97 @@ class EnvSwitcherApp(EnvSwitcherAppHeadless):
             # we will handle that below
             pass
 
-        # ** View **
-        print("Creating Main View")
-        self.ui = EnvSwitcherView(apply_environment_hook=self.apply_environment,
-                                  set_environment_target_hook=self.set_target_whole_machine,
-                                  initial_config={self.SETTING_TARGET_IS_WHOLE_MACHINE: self.is_target_whole_machine()})
+        # ** Views ** - the main window is created by show_main_window
+        self.ui = None
+        self.tray = None
+        if tray:
+            if QSystemTrayIcon.isSystemTrayAvailable():
+                self.setQuitOnLastWindowClosed(False)
+                with span('gui.create_tray'):
+                    self.tray = EnvSwitcherTray(self)
+                self.tray.show()
+            else:
+                logger.warning('No system tray is available, showing the main window instead')
+
+        if self.tray is None or (self._internal_state is None and self.bundle is None):
+            # no configuration file could be loaded: the main window asks for one
+            self.show_main_window()
+        logger.info('Application ready')
+
+    def show_main_window(self):
+        """
+        Shows the main window, and creates it the first time
+        :return:
+        """
+        if self.ui is None:
+            self._create_main_window()
+        self.ui.show()
+        self.ui.raise_()
+        self.ui.activateWindow()
+
+    def apply_environment(self, env_id):
+        super(EnvSwitcherApp, self).apply_environment(env_id)
+        self.rslot_env_applied(env_id)
+
+    def create_apply_worker(self, env_id) -> ApplyWorker:
+        worker = super(EnvSwitcherApp, self).create_apply_worker(env_id)
+        worker.succeeded.connect(self.rslot_env_applied)
+        return worker
+
+    def rslot_env_applied(self, env_id: str):
+        """ Called after an environment was applied, from the tray or the main window """
+        if self.tray is not None:
+            self.tray.current_env_id = env_id
+
+    def lslot_quit(self):
+        """
+        Called when the user selects 'Quit' in the tray menu. If the main window has unsaved modifications, the user is
+        asked first.
+        :return:
+        """
+        if self.ui is None or self.ui.close():
+            if self.tray is not None and self.tray.apply_worker is not None:
+                # never interrupt an environment being written
+                self.tray.apply_worker.requestInterruption()
+                self.tray.apply_worker.wait()
+            self.quit()
+
+    def _create_main_window(self):
+        logger.info("Creating Main View")
+        with span('gui.create_view'):
+            self.ui = EnvSwitcherView(create_apply_worker_hook=self.create_apply_worker,
+                                      set_environment_target_hook=self.set_target_whole_machine,
+                                      initial_config={self.SETTING_TARGET_IS_WHOLE_MACHINE:
+                                                      self.is_target_whole_machine()})
         self.ui.show()  # Do this now, so that the 'open file' dialog below can show
 
         # --Handle the case where no configuration file could be loaded in the constructor
         if self.internal_state is None:
             # this means that an error happened when opening
             # we have to ask the user to open a configuration file
-            print("We need a configuration file, ask the user")
+            logger.info("We need a configuration file, ask the user")
             loaded = False
+            file_filter = 'Configuration files (' + ' '.join('*.' + ext for ext in get_file_extensions()) + ')'
             # TODO one days when we support the 'new' function (empty document) this will be removed.
             while not loaded:
                 try:
                     # ask the user to select a configuration file to open
                     config_file_path, _ = QFileDialog.getOpenFileName(parent=self.ui,
                                                                       caption='Open a Configuration File',
-                                                                      filter="Configuration files (*.yml *.yaml)")
+                                                                      filter=file_filter)
                     # 'cancel' will return without exception but with an empty config_file_path
                     if config_file_path == '':
-                        print('User cancelled opening file. Terminating')
+                        logger.info('User cancelled opening file. Terminating')
                         sys.exit(1)
                 except FileNotFoundError:
                     # 'exit' button press will raise a FileNotFoundError
-                    print('User cancelled opening file. Terminating')
+                    logger.info('User cancelled opening file. Terminating')
                     sys.exit(1)
                 try:
                     # try to create a state = try to open the configuration file
                     self.internal_state = EnvSwitcherState(configuration_file_path=config_file_path)
                     # remember the last opened file
-                    print("saving last open file path for future launches : '" + config_file_path + "'")
+                    logger.info("saving last open file path for future launches : '" + config_file_path + "'")
                     self._persist_last_opened_file(config_file_path)
                     loaded = True
                 except TypeError as e:
@@ -889,20 +1427,52 @@ class EnvSwitcherApp(EnvSwitcherAppHeadless):
 
         # connect the view to the model
         self.ui.set_model(self.internal_state)
-        print('Application ready')
 
 
-def main(config_file_path: str=None):
+def _pop_option(argv: List[str], option: str):
+    """
+    Removes option `option` and its value from the list of arguments `argv`, and returns the value. Both the
+    '--option value' and '--option=value' syntaxes are supported.
+
+    :param argv:
+    :param option:
+    :return: the value, or None if the option is not present
+    """
+    for i, arg in enumerate(argv):
+        if arg == option and i + 1 < len(argv):
+            value = argv[i + 1]
+            del argv[i:i + 2]
+            return value
+        elif arg.startswith(option + '='):
+            del argv[i]
+            return arg[len(option) + 1:]
+    return None
+
+
+def main(config_file_path: str=None, profile_path: str=None, tray: bool=False):
     """
     Main entry point for GUI mode
 
     :param config_file_path: optional - to load the gui with a given conf file instead of the last opened one
+    :param profile_path: optional - to dump a json timing report (or cProfile stats if the file extension is '.prof')
+    at exit. It can also be provided on the command line with '--profile <path>'.
+    :param tray: optional - to start in resident mode with a system tray icon, see EnvSwitcherApp. It can also be
+    enabled on the command line with '--tray'.
     :return:
     """
     print('*** ENVSWITCH <' + get_version() + '> ***')
+    configure_logging()
+
+    argv = sys.argv[1:]
+    profile_path = _pop_option(argv, '--profile') or profile_path
+    if profile_path is not None:
+        enable_profiling(profile_path)
+    if '--tray' in argv:
+        argv.remove('--tray')
+        tray = True
 
     # create the application (the frame around everything), passing in the possible commandline arguments
-    app = EnvSwitcherApp(sys.argv[1:], config_file_path=config_file_path)
+    app = EnvSwitcherApp(argv, config_file_path=config_file_path, tray=tray)
 
     sys.exit(app.exec_())
 
@@ -0,0 +1,231 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional, List, Any
+
+from envswitch.env_api import get_external_env_vars, set_env_variables_permanently, store_transaction
+from envswitch.file_lock import exclusive_lock
+from envswitch.list_vars import resolve_value
+from envswitch.tracing import logger, span
+
+# maximum number of snapshots kept in the history. Older snapshots are dropped
+DEFAULT_HISTORY_SIZE = 20
+
+
+def get_default_history_file_path() -> str:
+    """
+    Returns the path to the file where the history of snapshots is stored by default
+    :return:
+    """
+    return os.path.join(os.path.expanduser('~'), '.envswitch', 'history.json')
+
+
+class NoSuchSnapshotException(Exception):
+    """ Raised whenever a snapshot id can not be found in the history """
+
+
+class Snapshot:
+    """
+    The persisted values of some environment variables, captured right before an environment was applied.
+
+    Snapshots are delta-encoded: they only contain the variables that the apply was about to change, with their
+    previous value (None if the variable was not defined).
+    """
+    __slots__ = ('id', 'time', 'env_id', 'whole_machine', 'previous_values')
+
+    def __init__(self, snapshot_id: int, timestamp: float, env_id: str, whole_machine: bool,
+                 previous_values: Dict[str, Optional[str]]):
+        self.id = snapshot_id
+        self.time = timestamp
+        self.env_id = env_id
+        self.whole_machine = whole_machine
+        self.previous_values = previous_values
+
+    def __repr__(self):
+        return 'Snapshot #' + str(self.id) + ' (before applying ' + repr(self.env_id) + ') : ' \
+               + repr(self.previous_values)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return OrderedDict([('id', self.id), ('time', self.time), ('env_id', self.env_id),
+                            ('whole_machine', self.whole_machine), ('previous_values', self.previous_values)])
+
+    @staticmethod
+    def from_dict(dct: Dict[str, Any]):
+        return Snapshot(dct['id'], dct['time'], dct['env_id'], dct['whole_machine'],
+                        OrderedDict(dct['previous_values']))
+
+
+class EnvHistory:
+    """
+    A bounded ring of snapshots, persisted in a json file.
+    """
+
+    def __init__(self, file_path: str = None, max_size: int = DEFAULT_HISTORY_SIZE):
+        """
+        :param file_path: the path to the json file where snapshots are stored. Default is
+        get_default_history_file_path()
+        :param max_size: the maximum number of snapshots to keep
+        """
+        self.file_path = file_path or get_default_history_file_path()
+        self.max_size = max_size
+
+    @contextmanager
+    def lock(self):
+        """
+        A context manager holding an exclusive inter-process lock on the history file, so that the reads and writes of
+        snapshots performed inside it are not interleaved with the ones of other processes. The history file is shared
+        by the USER and MACHINE levels, so the store locks (see env_api.store_transaction) do not protect it. The lock
+        is taken on a separate '.lock' file, since the history file itself is replaced on each write. It is re-entrant
+        within a thread.
+
+        Callers that also lock a store must lock it first, as EnvConfig.apply does, so that there is no deadlock.
+
+        :return:
+        """
+        with exclusive_lock(self.file_path + '.lock', 'history.lock'):
+            yield
+
+    def get_snapshots(self) -> List[Snapshot]:
+        """
+        :return: the list of all snapshots in history, oldest first
+        """
+        try:
+            with open(self.file_path, 'r') as f:
+                return [Snapshot.from_dict(dct) for dct in json.load(f, object_pairs_hook=OrderedDict)]
+        except FileNotFoundError:
+            return []
+
+    def _save_snapshots(self, snapshots: List[Snapshot]):
+        # write to a temporary file and replace, so that the history is never left half-written
+        history_dir = os.path.dirname(self.file_path)
+        if history_dir and not os.path.isdir(history_dir):
+            os.makedirs(history_dir)
+        tmp_path = self.file_path + '.tmp' + str(os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump([snapshot.to_dict() for snapshot in snapshots], f, indent=1)
+        os.replace(tmp_path, self.file_path)
+
+    def get_snapshot(self, snapshot_id: int = None) -> Snapshot:
+        """
+        :param snapshot_id: the snapshot id, or None for the latest snapshot
+        :return: the snapshot. Raises a NoSuchSnapshotException if it is not found
+        """
+        snapshots = self.get_snapshots()
+        if snapshot_id is None:
+            if len(snapshots) > 0:
+                return snapshots[-1]
+            raise NoSuchSnapshotException('History is empty: there is nothing to undo')
+        for snapshot in snapshots:
+            if snapshot.id == snapshot_id:
+                return snapshot
+        raise NoSuchSnapshotException('Snapshot ' + str(snapshot_id) + ' is not in the history. Available snapshots: '
+                                      + str([s.id for s in snapshots]))
+
+    def record(self, env_id: str, whole_machine: bool, previous_values: Dict[str, Optional[str]]) -> Snapshot:
+        """
+        Adds a new snapshot to the history, dropping the oldest ones if needed
+
+        :param env_id: the id of the environment about to be applied
+        :param whole_machine:
+        :param previous_values: the values of the variables that are about to change
+        :return:
+        """
+        with self.lock():
+            snapshots = self.get_snapshots()
+            new_id = snapshots[-1].id + 1 if len(snapshots) > 0 else 1
+            snapshot = Snapshot(new_id, time.time(), env_id, whole_machine, previous_values)
+            snapshots.append(snapshot)
+            self._save_snapshots(snapshots[-self.max_size:])
+        return snapshot
+
+    def get_values_before(self, snapshot_id: int) -> Dict[str, Optional[str]]:
+        """
+        Returns the values that the variables had before snapshot `snapshot_id` was taken, for all variables changed
+        since then on the same target. Since snapshots are delta-encoded this is obtained by walking the history back
+        from the latest snapshot to `snapshot_id`.
+
+        :param snapshot_id:
+        :return:
+        """
+        target = self.get_snapshot(snapshot_id)
+        values = OrderedDict()
+        for snapshot in reversed(self.get_snapshots()):
+            if snapshot.id < target.id:
+                break
+            if snapshot.whole_machine == target.whole_machine:
+                values.update(snapshot.previous_values)
+        return values
+
+    def truncate(self, snapshot_id: int):
+        """
+        Removes snapshot `snapshot_id` and all more recent snapshots on the same target from the history
+
+        :param snapshot_id:
+        :return:
+        """
+        with self.lock():
+            target = self.get_snapshot(snapshot_id)
+            self._save_snapshots([s for s in self.get_snapshots()
+                                  if s.id < target.id or s.whole_machine != target.whole_machine])
+
+
+def take_snapshot(env_id: str, key_value_pairs: Dict[str, Any], whole_machine: bool,
+                  history: EnvHistory = None) -> Optional[Snapshot]:
+    """
+    Captures the persisted values of the variables that applying `key_value_pairs` would change, with a single bulk
+    read of the backend, and records them in the history.
+
+    :param env_id: the id of the environment about to be applied
+    :param key_value_pairs: the values that are about to be applied
+    :param whole_machine:
+    :param history: the history to use. Default is EnvHistory()
+    :return: the new snapshot, or None if nothing would change
+    """
+    with span('snapshot'):
+        previous = get_external_env_vars(key_value_pairs.keys(), whole_machine=whole_machine)
+        changes = OrderedDict((name, previous[name]) for name, value in key_value_pairs.items()
+                              if (previous[name] or '') != (resolve_value(name, value, previous[name]) or ''))
+        if len(changes) == 0:
+            return None
+        return (history or EnvHistory()).record(env_id, whole_machine, changes)
+
+
+def restore_snapshot(snapshot_id: int = None, history: EnvHistory = None) -> Dict[str, str]:
+    """
+    Restores the variables to the state they had before snapshot `snapshot_id` was taken, or before the latest
+    snapshot if `snapshot_id` is None ('undo'). Only the variables whose current value differ are written. The
+    restored snapshots are then removed from the history.
+
+    :param snapshot_id:
+    :param history: the history to use. Default is EnvHistory()
+    :return: the variables that were written
+    """
+    history = history or EnvHistory()
+    whole_machine = history.get_snapshot(snapshot_id).whole_machine
+    while True:
+        # the store is locked before the history, as when applying an environment, so that there is no deadlock
+        with store_transaction(whole_machine=whole_machine):
+            with history.lock():
+                snapshot = history.get_snapshot(snapshot_id)
+                if snapshot.whole_machine != whole_machine:
+                    # the latest snapshot was replaced by another process in the meantime: lock its store instead
+                    whole_machine = snapshot.whole_machine
+                    continue
+                target_values = history.get_values_before(snapshot.id)
+                current = get_external_env_vars(target_values.keys(), whole_machine=whole_machine)
+                to_write = OrderedDict((name, value or '') for name, value in target_values.items()
+                                       if (current[name] or '') != (value or ''))
+
+                if len(to_write) > 0:
+                    logger.info("Restoring " + str(len(to_write)) + " variable(s) to their state before snapshot "
+                                + str(snapshot.id))
+                    set_env_variables_permanently(to_write, whole_machine=whole_machine, merge_list_variables=False)
+                else:
+                    logger.info("Nothing to restore: all variables already have their state before snapshot "
+                                + str(snapshot.id))
+
+                history.truncate(snapshot.id)
+                return to_write
+
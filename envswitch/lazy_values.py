@@ -0,0 +1,236 @@
+import os
+import shlex
+import subprocess
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Dict, Optional
+
+from autoclass import check_var
+from envswitch.tracing import count, logger, span
+
+# maximum duration of a `!cmd` helper command, in seconds
+COMMAND_TIMEOUT = 30
+
+
+class LazyValueException(Exception):
+    def __init__(self, msg):
+        """
+        Same as UnknownEnvIdException: the constructor only has one argument, use the static constructor `create_from`
+        :param msg:
+        """
+        super(LazyValueException, self).__init__(msg)
+
+    @staticmethod
+    def create_from(value, reason):
+        e = LazyValueException("Could not resolve value '" + str(value) + "': " + reason)
+        e.value = value
+        return e
+
+
+class TTLCache:
+    """
+    A bounded cache whose entries expire `ttl` seconds after they were stored. When the cache is full, the least
+    recently used entry is evicted. It is thread-safe.
+    """
+    __slots__ = ('maxsize', 'ttl', '_entries', '_lock')
+
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        :param maxsize: the maximum number of entries
+        :param ttl: the time to live of each entry, in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (expiry time, value), least recently used first
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        :param key:
+        :param default:
+        :return: the value stored for `key` if it has not expired, `default` otherwise
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# the values already resolved: LazyValue -> str
+_RESOLVED_CACHE = TTLCache(maxsize=256, ttl=300)
+
+
+def configure_cache(maxsize: int = None, ttl: float = None):
+    """
+    Changes the size and time to live of the cache of resolved values. Values already cached are dropped.
+
+    :param maxsize: the maximum number of resolved values kept. Default is unchanged (256)
+    :param ttl: the duration in seconds during which a resolved value is reused. Default is unchanged (300)
+    :return:
+    """
+    if maxsize is not None:
+        _RESOLVED_CACHE.maxsize = maxsize
+    if ttl is not None:
+        _RESOLVED_CACHE.ttl = ttl
+    _RESOLVED_CACHE.clear()
+
+
+def clear_cache():
+    """
+    Forgets all resolved values, so that the next resolutions read the files and run the commands again
+
+    :return:
+    """
+    _RESOLVED_CACHE.clear()
+
+
+class LazyValue:
+    """
+    A variable value that is only known when the environment is applied: it is resolved from an external source (a
+    file, a helper command) described by a yaml tag in the configuration file:
+
+        CURL_CA_BUNDLE: !file ~/certs/ca_bundle_path.txt
+        GITHUB_TOKEN: !cmd pass show github/token
+
+    Loading a configuration never resolves anything. Values are only resolved for the environment being applied (or
+    run, see env_overlay), and the results are kept in a bounded cache with a time to live (see configure_cache) so
+    that applying the same environment again does not run the helpers again. Instances are immutable.
+    """
+    __slots__ = ('source',)
+
+    # the yaml tag of this kind of values
+    tag = None
+
+    def __init__(self, source: str):
+        """
+        :param source: the description of the source, for example the path to the file
+        """
+        check_var(source, var_types=str, var_name=self.tag + ' source', min_len=1)
+        object.__setattr__(self, 'source', source)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(type(self).__name__ + ' is immutable')
+
+    def resolve(self) -> str:
+        """
+        Returns the value, from the cache if it was resolved recently
+
+        :return:
+        """
+        value = _RESOLVED_CACHE.get(self)
+        if value is None:
+            count('lazy_values_resolved')
+            with span('resolve'):
+                value = self._resolve()
+            _RESOLVED_CACHE.set(self, value)
+        return value
+
+    def get_cached(self) -> Optional[str]:
+        """
+        Returns the value if it was resolved recently (see resolve), without ever resolving it
+
+        :return: the value, or None if it is not in the cache
+        """
+        return _RESOLVED_CACHE.get(self)
+
+    def _resolve(self) -> str:
+        raise NotImplementedError()
+
+    def __reduce__(self):
+        return type(self), (self.source,)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __eq__(self, other):
+        return type(other) is type(self) and other.source == self.source
+
+    def __hash__(self):
+        return hash((self.tag, self.source))
+
+    def __repr__(self):
+        return type(self).__name__ + '(' + repr(self.source) + ')'
+
+    def __str__(self):
+        """ The description of this value in the configuration file, used in the GUI """
+        return self.tag + ' ' + self.source
+
+
+class FileValue(LazyValue):
+    """
+    A value read from a file (`!file path`). The trailing line break, if any, is removed. '~' is expanded.
+    """
+    __slots__ = ()
+    tag = '!file'
+
+    def _resolve(self) -> str:
+        try:
+            with open(os.path.expanduser(self.source), 'r') as f:
+                return f.read().rstrip('\r\n')
+        except OSError as e:
+            raise LazyValueException.create_from(self, e.strerror)
+
+
+class CommandValue(LazyValue):
+    """
+    A value printed by a helper command (`!cmd command args...`). The command is split with shell-like syntax but is
+    not run in a shell. The trailing line break of its output, if any, is removed. It fails if the command returns a
+    non-zero exit code or takes longer than COMMAND_TIMEOUT.
+    """
+    __slots__ = ()
+    tag = '!cmd'
+
+    def _resolve(self) -> str:
+        logger.debug("Running helper command %r", self.source)
+        try:
+            proc = subprocess.run(shlex.split(self.source), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE, timeout=COMMAND_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            raise LazyValueException.create_from(self, 'timeout after ' + str(COMMAND_TIMEOUT) + 's')
+        except (OSError, ValueError) as e:
+            raise LazyValueException.create_from(self, str(e))
+        if proc.returncode != 0:
+            raise LazyValueException.create_from(self, 'exit code ' + str(proc.returncode) + ': '
+                                                 + proc.stderr.decode(errors='replace').strip())
+        return proc.stdout.decode(errors='replace').rstrip('\r\n')
+
+
+# the kinds of lazy values, by yaml tag
+LAZY_VALUE_TYPES = OrderedDict((t.tag, t) for t in (FileValue, CommandValue))
+
+
+def resolve_lazy_values(key_value_pairs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns `key_value_pairs` where the lazy values are replaced with their resolved value. If there is no lazy value,
+    `key_value_pairs` itself is returned.
+
+    :param key_value_pairs:
+    :return:
+    """
+    if not any(isinstance(v, LazyValue) for v in key_value_pairs.values()):
+        return key_value_pairs
+    return OrderedDict((k, v.resolve() if isinstance(v, LazyValue) else v) for k, v in key_value_pairs.items())
@@ -0,0 +1,174 @@
+import os
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Iterable, Tuple
+
+from autoclass import check_var
+
+_PREPEND = 'prepend'
+_APPEND = 'append'
+_REMOVE = 'remove'
+_SEPARATOR = 'separator'
+_DEDUPE = 'dedupe'
+
+
+def _to_tuple(items, var_name: str) -> Tuple[str, ...]:
+    """ Accepts a single string or a list of strings """
+    if isinstance(items, str):
+        items = (items,)
+    items = tuple(items)
+    for item in items:
+        check_var(item, var_types=str, var_name=var_name)
+    return items
+
+
+class ListVarOps:
+    """
+    Operations on a separator-based list variable such as PATH. Instead of replacing the whole value, the environment
+    prepends, appends and removes items, optionally removing duplicates.
+
+    In the configuration file, such a variable is described with a mapping instead of a string:
+
+        PATH:
+          prepend: [/opt/tool/bin]
+          append: /opt/other/bin
+          remove: [/opt/old/bin]
+          separator: ':'   # optional, default is the os path separator
+          dedupe: true     # optional, default is true
+
+    Merging is linear-time and order-preserving, and idempotent: applying the same operations twice leaves the
+    variable unchanged. Instances are immutable.
+    """
+    __slots__ = ('prepend', 'append', 'remove', 'separator', 'dedupe')
+
+    def __init__(self, prepend: Iterable[str] = (), append: Iterable[str] = (), remove: Iterable[str] = (),
+                 separator: str = None, dedupe: bool = True):
+        object.__setattr__(self, 'prepend', _to_tuple(prepend, 'prepend item'))
+        object.__setattr__(self, 'append', _to_tuple(append, 'append item'))
+        object.__setattr__(self, 'remove', _to_tuple(remove, 'remove item'))
+        if separator is not None:
+            check_var(separator, var_types=str, var_name='separator', min_len=1)
+        object.__setattr__(self, 'separator', separator)
+        check_var(dedupe, var_types=bool, var_name='dedupe')
+        object.__setattr__(self, 'dedupe', dedupe)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('ListVarOps is immutable')
+
+    @staticmethod
+    def from_dict(dct: Dict[str, Any]):
+        """
+        Creates a ListVarOps from its description in the configuration file
+
+        :param dct:
+        :return:
+        """
+        unknown = set(dct.keys()) - {_PREPEND, _APPEND, _REMOVE, _SEPARATOR, _DEDUPE}
+        if len(unknown) > 0:
+            raise ValueError('Unknown list variable operation(s) ' + str(sorted(unknown)) + '. Supported operations '
+                             'are ' + str([_PREPEND, _APPEND, _REMOVE, _SEPARATOR, _DEDUPE]))
+        return ListVarOps(prepend=dct.get(_PREPEND, ()), append=dct.get(_APPEND, ()), remove=dct.get(_REMOVE, ()),
+                          separator=dct.get(_SEPARATOR), dedupe=dct.get(_DEDUPE, True))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns the description of this object for the configuration file. Default values are omitted.
+
+        :return:
+        """
+        dct = OrderedDict()
+        if len(self.prepend) > 0:
+            dct[_PREPEND] = list(self.prepend)
+        if len(self.append) > 0:
+            dct[_APPEND] = list(self.append)
+        if len(self.remove) > 0:
+            dct[_REMOVE] = list(self.remove)
+        if self.separator is not None:
+            dct[_SEPARATOR] = self.separator
+        if not self.dedupe:
+            dct[_DEDUPE] = self.dedupe
+        return dct
+
+    def get_separator(self) -> str:
+        return self.separator if self.separator is not None else os.pathsep
+
+    def merge(self, current_value: Optional[str]) -> str:
+        """
+        Applies the operations on the current value of the variable and returns the new value. Items to prepend or
+        append that are already present are moved to their expected position, so that the result does not depend on
+        how many times the operations were applied.
+
+        :param current_value: the current value, or None if the variable is not defined
+        :return:
+        """
+        sep = self.get_separator()
+        excluded = set(self.remove)
+        excluded.update(self.prepend)
+        excluded.update(self.append)
+
+        items = list(self.prepend)
+        if current_value:
+            items.extend(item for item in current_value.split(sep) if item and item not in excluded)
+        items.extend(self.append)
+
+        if self.dedupe:
+            items = list(OrderedDict.fromkeys(items))
+        return sep.join(items)
+
+    def __reduce__(self):
+        return ListVarOps, self._key()
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __eq__(self, other):
+        return type(other) is ListVarOps and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def _key(self):
+        return self.prepend, self.append, self.remove, self.separator, self.dedupe
+
+    def __repr__(self):
+        return 'ListVarOps(' + ', '.join(k + '=' + repr(v) for k, v in self.to_dict().items()) + ')'
+
+    def __str__(self):
+        """ A short human-readable description, used in the GUI """
+        sep = self.get_separator()
+        return '; '.join(k + ' ' + (sep.join(v) if isinstance(v, list) else repr(v))
+                         for k, v in self.to_dict().items())
+
+
+def as_list_var_ops(var_name: str, value: Any) -> Optional[ListVarOps]:
+    """
+    Returns the list operations to perform for a variable, or None if it is a plain variable.
+
+    PATH can not be entirely replaced: a plain string value for PATH is appended to the current value (without
+    creating duplicates when applied several times).
+
+    :param var_name:
+    :param value:
+    :return:
+    """
+    if isinstance(value, ListVarOps):
+        return value
+    elif value and var_name.upper() == 'PATH':
+        return ListVarOps(append=value.split(os.pathsep))
+    else:
+        return None
+
+
+def resolve_value(var_name: str, value: Any, current_value: Optional[str]) -> str:
+    """
+    Returns the value that a variable will have once `value` is applied, knowing its current value
+
+    :param var_name:
+    :param value: a string or a ListVarOps
+    :param current_value: the current value, or None if the variable is not defined
+    :return:
+    """
+    ops = as_list_var_ops(var_name, value)
+    return ops.merge(current_value) if ops is not None else value
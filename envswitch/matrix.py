@@ -0,0 +1,159 @@
+import json
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Sequence
+from xml.etree import ElementTree
+
+from envswitch.env_config import EnvConfig, GlobalEnvsConfig, UnknownEnvIdException
+from envswitch.env_overlay import build_child_env
+from envswitch.lazy_values import LazyValueException
+from envswitch.tracing import logger, span
+
+PASSED = 'passed'
+FAILED = 'failed'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+
+
+class MatrixRunResult:
+    """
+    The outcome of running the matrix command with one environment
+    """
+    __slots__ = ('env_id', 'returncode', 'output', 'duration', 'status')
+
+    def __init__(self, env_id: str, status: str, returncode: Optional[int], output: str, duration: float):
+        """
+        :param env_id:
+        :param status: one of PASSED, FAILED (non-zero exit code), TIMEOUT or ERROR (the command could not be started)
+        :param returncode: the exit code of the command, or None if it timed out or could not be started
+        :param output: the captured standard output and error of the command
+        :param duration: the duration of the run in seconds
+        """
+        self.env_id = env_id
+        self.status = status
+        self.returncode = returncode
+        self.output = output
+        self.duration = duration
+
+    def __repr__(self):
+        return 'MatrixRunResult(' + repr(self.env_id) + ', ' + self.status + ')'
+
+    def to_dict(self) -> Dict:
+        return OrderedDict([('env_id', self.env_id), ('status', self.status), ('returncode', self.returncode),
+                            ('duration', round(self.duration, 3)), ('output', self.output)])
+
+
+def select_envs(config: GlobalEnvsConfig, patterns: Iterable[str] = ()) -> List[EnvConfig]:
+    """
+    Returns the environments of `config` whose id matches at least one of the shell-style `patterns` (for example
+    'proxy_*'), in the configuration order. All environments are returned if no pattern is provided. Environments
+    generated by templates are only created if they are selected.
+
+    :param config:
+    :param patterns:
+    :return:
+    """
+    patterns = tuple(patterns)
+    if len(patterns) == 0:
+        return [env for env in config.iter_envs()]
+    env_ids = config.get_available_envs()
+    selected = [config.get_env(env_id) for env_id in env_ids if any(fnmatchcase(env_id, p) for p in patterns)]
+    if len(selected) == 0:
+        raise UnknownEnvIdException.create_from(', '.join(patterns), env_ids)
+    return selected
+
+
+def _run_one(env: EnvConfig, command: Sequence[str], timeout: Optional[float],
+             base_env: Optional[Dict[str, str]]) -> MatrixRunResult:
+    start = perf_counter()
+    try:
+        child_env = build_child_env(env, base_env)
+    except LazyValueException as e:
+        return MatrixRunResult(env.id, ERROR, None, str(e), perf_counter() - start)
+    try:
+        proc = subprocess.run(command, env=child_env, stdin=subprocess.DEVNULL,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
+    except subprocess.TimeoutExpired as e:
+        output = (e.output or b'').decode(errors='replace')
+        return MatrixRunResult(env.id, TIMEOUT, None, output, perf_counter() - start)
+    except OSError as e:
+        return MatrixRunResult(env.id, ERROR, None, str(e), perf_counter() - start)
+    return MatrixRunResult(env.id, PASSED if proc.returncode == 0 else FAILED, proc.returncode,
+                           proc.stdout.decode(errors='replace'), perf_counter() - start)
+
+
+def run_matrix(envs: Iterable[EnvConfig], command: Sequence[str], max_workers: int = None, timeout: float = None,
+               base_env: Dict[str, str] = None) -> List[MatrixRunResult]:
+    """
+    Runs `command` once per environment, each time with the environment overlaid on `base_env` (see
+    env_overlay.build_child_env). Runs are executed in parallel and their output is captured. Nothing is persisted.
+
+    :param envs: the environments to run the command with
+    :param command: the command and its arguments
+    :param max_workers: the maximum number of commands running at the same time. Default is the ThreadPoolExecutor
+    default
+    :param timeout: an optional timeout in seconds for each run. A run exceeding it is killed
+    :param base_env: the environment on which each environment is overlaid. Default is os.environ
+    :return: the result of each run, in the same order than `envs`
+    """
+    envs = tuple(envs)
+    logger.info("Running %r with %s environment(s)", ' '.join(command), len(envs))
+    with span('matrix'):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_run_one, env, command, timeout, base_env) for env in envs]
+            return [f.result() for f in futures]
+
+
+def format_matrix_summary(results: List[MatrixRunResult]) -> str:
+    """
+    Returns a summary table of the matrix results, with one line per environment followed by the totals
+
+    :param results:
+    :return:
+    """
+    width = max([len('ENVIRONMENT')] + [len(r.env_id) for r in results])
+    lines = ['%s  %-7s  %4s  %9s' % ('ENVIRONMENT'.ljust(width), 'STATUS', 'CODE', 'TIME')]
+    for r in results:
+        lines.append('%s  %-7s  %4s  %8.2fs' % (r.env_id.ljust(width), r.status.upper(),
+                                                 '-' if r.returncode is None else r.returncode, r.duration))
+    nb_passed = len([r for r in results if r.status == PASSED])
+    lines.append('%s/%s environment(s) passed' % (nb_passed, len(results)))
+    return '\n'.join(lines)
+
+
+def to_junit_xml(results: List[MatrixRunResult], suite_name: str = 'envswitch.matrix') -> str:
+    """
+    Returns the matrix results as a JUnit xml report, with one test case per environment
+
+    :param results:
+    :param suite_name:
+    :return:
+    """
+    suites = ElementTree.Element('testsuites')
+    suite = ElementTree.SubElement(suites, 'testsuite', name=suite_name, tests=str(len(results)),
+                                   failures=str(len([r for r in results if r.status in (FAILED, TIMEOUT)])),
+                                   errors=str(len([r for r in results if r.status == ERROR])),
+                                   time='%.3f' % sum(r.duration for r in results))
+    for r in results:
+        case = ElementTree.SubElement(suite, 'testcase', classname=suite_name, name=r.env_id, time='%.3f' % r.duration)
+        if r.status == FAILED:
+            ElementTree.SubElement(case, 'failure', message='exit code ' + str(r.returncode))
+        elif r.status == TIMEOUT:
+            ElementTree.SubElement(case, 'failure', message='timeout')
+        elif r.status == ERROR:
+            ElementTree.SubElement(case, 'error', message=r.output)
+        ElementTree.SubElement(case, 'system-out').text = r.output
+    return ElementTree.tostring(suites, encoding='unicode')
+
+
+def to_json(results: List[MatrixRunResult]) -> str:
+    """
+    Returns the matrix results as a json document
+
+    :param results:
+    :return:
+    """
+    return json.dumps([r.to_dict() for r in results], indent=2)
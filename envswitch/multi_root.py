@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from envswitch.env_api import set_env_variables_permanently
+from envswitch.env_config import EnvConfig
+from envswitch.tracing import logger, span
+
+
+class RootApplyResult:
+    """
+    The outcome of applying an environment into one target root directory
+    """
+    __slots__ = ('root', 'error', 'duration')
+
+    def __init__(self, root: str, error: Optional[Exception], duration: float):
+        """
+        :param root: the target root directory
+        :param error: the exception raised while applying, or None if it succeeded
+        :param duration: the time spent applying into this root, in seconds
+        """
+        self.root = root
+        self.error = error
+        self.duration = duration
+
+    def __repr__(self):
+        return 'RootApplyResult(' + repr(self.root) + ', ' + ('OK' if self.error is None else repr(self.error)) + ')'
+
+    def is_ok(self) -> bool:
+        return self.error is None
+
+
+def _apply_to_root(env: EnvConfig, variables: Dict[str, Any], root: str, whole_machine: bool) -> RootApplyResult:
+    start = perf_counter()
+    try:
+        set_env_variables_permanently(variables, also_apply_on_this_process=False,
+                                      whole_machine=whole_machine, root=root)
+        error = None
+    except Exception as e:
+        logger.warning("Could not apply environment '" + env.id + "' into '" + root + "': " + str(e))
+        error = e
+    return RootApplyResult(root, error, perf_counter() - start)
+
+
+def apply_to_roots(env: EnvConfig, roots: Iterable[str], whole_machine: bool = False,
+                   max_workers: int = None) -> List[RootApplyResult]:
+    """
+    Applies environment `env` into several target root directories concurrently, through a thread pool. Each root is
+    either a user home (USER level) or an image root file system (if whole_machine is True), see
+    env_api_linuximpl.get_store_path.
+
+    Contrary to EnvConfig.apply, the current process and the current user are left untouched and no snapshot is
+    recorded in the history. An error in one root does not prevent the others from being written: all errors are
+    reported in the results.
+
+    :param env:
+    :param roots: the target root directories
+    :param whole_machine: if True the MACHINE level file of each root is written, otherwise the USER level file
+    :param max_workers: the maximum number of roots written concurrently. Default is the ThreadPoolExecutor default
+    :return: the result for each root, in the same order than `roots`
+    """
+    roots = tuple(roots)
+    logger.info("Applying environment '" + env.id + "' into " + str(len(roots)) + " root(s)")
+    with span('apply.roots'):
+        # lazy values are resolved once for all roots
+        variables = env.get_resolved_variables()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return [f.result() for f in [executor.submit(_apply_to_root, env, variables, root, whole_machine)
+                                         for root in roots]]
+
+
+def format_roots_report(results: List[RootApplyResult]) -> str:
+    """
+    Returns a human-readable report of the results of apply_to_roots, one line per root followed by a summary line
+
+    :param results:
+    :return:
+    """
+    lines = []
+    for result in results:
+        if result.is_ok():
+            lines.append('  OK     %s (%.3fs)' % (result.root, result.duration))
+        else:
+            lines.append('  ERROR  %s: %s' % (result.root, result.error))
+    nb_errors = len([r for r in results if not r.is_ok()])
+    lines.append('%s root(s) written, %s error(s)' % (len(results) - nb_errors, nb_errors))
+    return '\n'.join(lines)
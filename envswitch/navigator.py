@@ -0,0 +1,137 @@
+from typing import Iterable, List, Optional, Tuple
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+
+
+def fuzzy_score(pattern: str, text: str) -> Optional[int]:
+    """
+    Matches `pattern` against `text`, ignoring case. The text matches if the characters of the pattern appear in it in
+    the same order, not necessarily contiguous: for example 'prx' matches 'proxy_paris'. Substrings get the best
+    scores, then characters that follow each other or that start a word.
+
+    :param pattern:
+    :param text:
+    :return: a score, higher for better matches, or None if `text` does not match
+    """
+    pattern = pattern.lower()
+    text = text.lower()
+    pos = text.find(pattern)
+    if pos >= 0:
+        return 3 * len(pattern) + (2 if pos == 0 or not text[pos - 1].isalnum() else 0)
+
+    score = 0
+    start = 0
+    for c in pattern:
+        i = text.find(c, start)
+        if i < 0:
+            return None
+        score += 1
+        if i == start or not text[i - 1].isalnum():
+            # follows the previous character, or starts a word
+            score += 1
+        start = i + 1
+    return score
+
+
+class EnvListModel(QAbstractListModel):
+    """
+    The list of the environments of a configuration, displayed by the navigator of the main window. Rows display the
+    environment names, the ids are available with the EnvIdRole role (and as tooltips).
+
+    The list can be filtered with a fuzzy pattern (see fuzzy_score) matched against the ids and names: the matching
+    environments are sorted by decreasing score, and by configuration order for equal scores. The filter is incremental:
+    when the pattern is extended (the user types one more character), only the environments that matched the previous
+    pattern are matched again.
+    """
+
+    EnvIdRole = Qt.UserRole
+
+    def __init__(self, parent=None):
+        super(EnvListModel, self).__init__(parent)
+        # all the (env_id, name), in configuration order
+        self._envs = []
+        self._pattern = ''
+        # the indices in self._envs of the environments matching self._pattern, in configuration order
+        self._matches = []
+        # the indices in self._envs of the displayed rows
+        self._rows = []
+
+    def set_envs(self, envs: Iterable[Tuple[str, str]]):
+        """
+        Replaces the environments of this list. The current filter is applied.
+
+        :param envs: the (env_id, name) of the environments
+        :return:
+        """
+        self.beginResetModel()
+        self._envs = list(envs)
+        self._update_rows(self._pattern, range(len(self._envs)))
+        self.endResetModel()
+
+    def set_filter(self, pattern: str):
+        """
+        Only displays the environments matching `pattern`. An empty pattern displays all environments.
+
+        :param pattern:
+        :return:
+        """
+        pattern = pattern.strip()
+        if pattern == self._pattern:
+            return
+        if pattern.lower().startswith(self._pattern.lower()):
+            # more specific than the previous pattern: only the previous matches can match
+            candidates = self._matches
+        else:
+            candidates = range(len(self._envs))
+        self.beginResetModel()
+        self._update_rows(pattern, candidates)
+        self.endResetModel()
+
+    def get_filter(self) -> str:
+        return self._pattern
+
+    def _update_rows(self, pattern: str, candidates: Iterable[int]):
+        self._pattern = pattern
+        if pattern == '':
+            self._matches = list(candidates)
+            self._rows = self._matches
+            return
+        scores = []
+        for i in candidates:
+            env_id, name = self._envs[i]
+            id_score = fuzzy_score(pattern, env_id)
+            name_score = fuzzy_score(pattern, name)
+            if id_score is not None or name_score is not None:
+                scores.append((max(s for s in (id_score, name_score) if s is not None), i))
+        self._matches = [i for _, i in scores]
+        self._rows = [i for _, i in sorted(scores, key=lambda score_i: -score_i[0])]
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self._rows):
+            return None
+        env_id, name = self._envs[self._rows[index.row()]]
+        if role == Qt.DisplayRole:
+            return name
+        elif role in (Qt.ToolTipRole, EnvListModel.EnvIdRole):
+            return env_id
+        return None
+
+    def get_env_id(self, row: int) -> str:
+        return self._envs[self._rows[row]][0]
+
+    def get_row(self, env_id: str) -> Optional[int]:
+        """
+        :param env_id:
+        :return: the row displaying environment `env_id`, or None if it is not displayed
+        """
+        for row, i in enumerate(self._rows):
+            if self._envs[i][0] == env_id:
+                return row
+        return None
+
+    def get_env_ids(self) -> List[str]:
+        """ The ids of the displayed environments, in display order """
+        return [self._envs[i][0] for i in self._rows]
@@ -0,0 +1,202 @@
+import os
+import platform
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from envswitch.env_config import EnvConfig
+from envswitch.list_vars import resolve_value
+from envswitch.status import EnvStatus, compare_envs, get_var_names, observed_value
+from envswitch.tracing import count, span
+
+PROC_DIR = '/proc'
+
+
+def _check_proc():
+    if platform.system() != 'Linux':
+        raise NotImplementedError('Reading the environment of running processes is only supported on linux')
+
+
+def _decode(b: bytes) -> str:
+    return b.decode('utf-8', errors='replace')
+
+
+def parse_environ(buf: bytes, var_names: Iterable[str] = None) -> Dict[str, Optional[str]]:
+    """
+    Parses the contents of a /proc/PID/environ file: NAME=VALUE entries separated by NUL characters.
+
+    If `var_names` is provided, only those variables are looked up directly in the buffer, and only their values are
+    decoded: the other entries are not copied. Otherwise all variables are returned. As with getenv, the first
+    definition of a variable wins.
+
+    :param buf: the raw contents of the file
+    :param var_names: the names of the variables to look up, or None for all variables
+    :return: a dictionary var name -> value. If `var_names` is provided, the value is None for the variables that are
+    not defined
+    """
+    res = OrderedDict()
+    if var_names is None:
+        for entry in buf.split(b'\0'):
+            name, sep, value = entry.partition(b'=')
+            if sep:
+                res.setdefault(_decode(name), _decode(value))
+        return res
+
+    for var_name in var_names:
+        key = var_name.encode('utf-8') + b'='
+        if buf.startswith(key):
+            start = len(key)
+        else:
+            start = buf.find(b'\0' + key)
+            if start < 0:
+                res[var_name] = None
+                continue
+            start += len(key) + 1
+        end = buf.find(b'\0', start)
+        res[var_name] = _decode(buf[start:end if end >= 0 else len(buf)])
+    return res
+
+
+def read_process_environ(pid: int, var_names: Iterable[str] = None) -> Dict[str, Optional[str]]:
+    """
+    Reads the environment of running process `pid`, as it was when the process started (or as it was last modified
+    with execve): later modifications done by the process itself, for example with os.environ, are not visible. The
+    file is read in a single buffer, see parse_environ.
+
+    Raises a PermissionError for processes of other users (unless running as root), and a ProcessLookupError if the
+    process does not exist.
+
+    :param pid:
+    :param var_names: the names of the variables to look up, or None for all variables
+    :return: see parse_environ
+    """
+    _check_proc()
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), 'environ'), 'rb') as f:
+            buf = f.read()
+    except FileNotFoundError:
+        raise ProcessLookupError('No process with pid ' + str(pid))
+    return parse_environ(buf, var_names)
+
+
+def get_process_user(pid: int) -> str:
+    """
+    :param pid:
+    :return: the name of the user owning process `pid`, or its uid if the user is unknown
+    """
+    import pwd
+    uid = os.stat(os.path.join(PROC_DIR, str(pid))).st_uid
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
+
+
+def get_process_cmdline(pid: int) -> str:
+    """
+    :param pid:
+    :return: the command line of process `pid`, or '' for kernel threads
+    """
+    with open(os.path.join(PROC_DIR, str(pid), 'cmdline'), 'rb') as f:
+        return ' '.join(_decode(arg) for arg in f.read().split(b'\0') if arg)
+
+
+def inspect_process(pid: int, envs: Iterable[EnvConfig]) -> List[EnvStatus]:
+    """
+    Compares the environment of running process `pid` with environments `envs`, for example to check what a running
+    service actually uses without restarting it. Only the variables used by `envs` are decoded.
+
+    :param pid:
+    :param envs: the environments to compare with, for example `config.envs.values()`
+    :return: the status of each environment, see status.compare_envs
+    """
+    envs = tuple(envs)
+    return compare_envs(envs, read_process_environ(pid, get_var_names(envs)))
+
+
+class StaleProcess:
+    """
+    A running process whose environment does not match an environment that was applied since it started
+    """
+    __slots__ = ('pid', 'user', 'cmdline', 'stale_vars')
+
+    def __init__(self, pid: int, user: str, cmdline: str, stale_vars: Dict[str, Tuple[str, str]]):
+        """
+        :param pid:
+        :param user: the name of the user owning the process
+        :param cmdline: the command line of the process
+        :param stale_vars: a dictionary var name -> (expected value, value in the process) for all variables that do
+        not match
+        """
+        self.pid = pid
+        self.user = user
+        self.cmdline = cmdline
+        self.stale_vars = stale_vars
+
+    def __repr__(self):
+        return 'StaleProcess(' + str(self.pid) + ', ' + repr(self.cmdline) + ')'
+
+
+def list_pids() -> List[int]:
+    """
+    :return: the ids of all running processes
+    """
+    _check_proc()
+    return [int(name) for name in os.listdir(PROC_DIR) if name.isdigit()]
+
+
+def _scan_chunk(pids: List[int], expected: Dict[str, object], unreadable: List[int]) -> List[StaleProcess]:
+    """ Scans some processes, see find_stale_processes. The processes that can not be read are added to unreadable """
+    var_names = tuple(expected)
+    res = []
+    for pid in pids:
+        try:
+            with open(os.path.join(PROC_DIR, str(pid), 'environ'), 'rb') as f:
+                buf = f.read()
+        except OSError:
+            # processes of other users, or processes that ended in the meantime
+            unreadable.append(pid)
+            continue
+        current = parse_environ(buf, var_names)
+
+        # variables that the process does not define are not considered: many processes (daemons, kernel threads) do
+        # not inherit the user environment at all
+        stale_vars = OrderedDict((name, (resolve_value(name, value, current[name]), current[name]))
+                                 for name, value in expected.items()
+                                 if current[name] is not None and observed_value(name, value, current[name]) != value)
+        if len(stale_vars) > 0:
+            try:
+                res.append(StaleProcess(pid, get_process_user(pid), get_process_cmdline(pid), stale_vars))
+            except OSError:
+                unreadable.append(pid)
+    return res
+
+
+def find_stale_processes(env: EnvConfig, pids: Iterable[int] = None, max_workers: int = None,
+                         chunk_size: int = 256) -> Tuple[List[StaleProcess], int]:
+    """
+    Finds the running processes that still carry old values for the variables of environment `env`, for example
+    shells and services started before it was applied. Only the variables of `env` are looked up in each process
+    environment (see parse_environ), and processes are scanned in parallel, by chunks.
+
+    A process is stale if it defines at least one variable of `env` with a different value, or with a value that the
+    environment removes (empty value). List variables such as PATH match if they contain the expected items. The
+    current process is ignored.
+
+    :param env:
+    :param pids: the processes to scan. Default is all running processes
+    :param max_workers: the maximum number of threads scanning processes. Default is the ThreadPoolExecutor default
+    :param chunk_size: the number of processes scanned by each task
+    :return: a tuple (stale processes sorted by pid, number of processes that could not be read)
+    """
+    own_pid = os.getpid()
+    pids = sorted(pid for pid in (list_pids() if pids is None else pids) if pid != own_pid)
+    expected = env.get_resolved_variables()
+    unreadable = []
+    with span('stale.scan'):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            chunks = [pids[i:i + chunk_size] for i in range(0, len(pids), chunk_size)]
+            results = [f.result() for f in [executor.submit(_scan_chunk, chunk, expected, unreadable)
+                                            for chunk in chunks]]
+    count('processes_scanned', len(pids))
+    return [p for chunk_result in results for p in chunk_result], len(unreadable)
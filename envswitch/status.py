@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from envswitch.env_api import get_external_env_vars, get_backend_generation, get_store_generation
+from envswitch.env_config import GlobalEnvsConfig, EnvConfig
+from envswitch.lazy_values import LazyValue
+from envswitch.list_vars import resolve_value, as_list_var_ops
+from envswitch.tracing import logger, span
+
+
+def get_default_status_cache_path() -> str:
+    """
+    Returns the path to the file where the last status of each level is cached, next to the history of snapshots
+    :return:
+    """
+    return os.path.join(os.path.expanduser('~'), '.envswitch', 'status.json')
+
+
+class EnvStatus:
+    """
+    How much the current persisted state matches an environment.
+    """
+    __slots__ = ('env_id', 'name', 'nb_vars', 'drift', 'unknown')
+
+    def __init__(self, env_id: str, name: str, nb_vars: int, drift: Dict[str, Tuple[str, Optional[str]]],
+                 unknown: List[str] = ()):
+        """
+        :param env_id:
+        :param name:
+        :param nb_vars: the number of variables in the environment
+        :param drift: a dictionary var name -> (expected value, current value) for all variables that do not match.
+        current value is None if the variable is not defined
+        :param unknown: the names of the variables whose value is only known when the environment is applied (see
+        LazyValue), and that could not be compared
+        """
+        self.env_id = env_id
+        self.name = name
+        self.nb_vars = nb_vars
+        self.drift = drift
+        self.unknown = list(unknown)
+
+    def __repr__(self):
+        return 'EnvStatus(' + repr(self.env_id) + ', ' + str(self.nb_matching) + '/' + str(self.nb_vars) + ')'
+
+    @property
+    def nb_matching(self) -> int:
+        return self.nb_vars - len(self.drift) - len(self.unknown)
+
+    def is_exact_match(self) -> bool:
+        return len(self.drift) == 0 and len(self.unknown) == 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return OrderedDict([('env_id', self.env_id), ('name', self.name), ('nb_vars', self.nb_vars),
+                            ('drift', OrderedDict((k, list(v)) for k, v in self.drift.items())),
+                            ('unknown', self.unknown)])
+
+    @staticmethod
+    def from_dict(dct: Dict[str, Any]):
+        return EnvStatus(dct['env_id'], dct['name'], dct['nb_vars'],
+                         OrderedDict((k, tuple(v)) for k, v in dct['drift'].items()), dct.get('unknown', ()))
+
+
+def _get_env_status(env: EnvConfig, current_values: Dict[str, Optional[str]]) -> EnvStatus:
+    """
+    Compares an environment with the current values, in a single pass over its variables.
+
+    A list variable (see ListVarOps) matches if applying its operations would not change the current value. Lazy values
+    (see LazyValue) are never resolved here, since they may run helper commands: they are compared only if they were
+    resolved recently (when the environment was applied by this process), and are reported as unknown otherwise.
+
+    :param env:
+    :param current_values:
+    :return:
+    """
+    variables, unknown = _known_variables(env)
+    drift = OrderedDict()
+    for name, value in variables.items():
+        current_value = current_values[name]
+        if observed_value(name, value, current_value) != value:
+            drift[name] = (resolve_value(name, value, current_value), current_value)
+    return EnvStatus(env.id, env.name, len(env.env_variables_dct), drift, unknown)
+
+
+def _known_variables(env: EnvConfig) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Returns the variables of `env` that can be compared without resolving anything: the lazy values are replaced with
+    their cached value (see LazyValue.get_cached), or left out if there is none.
+
+    :param env:
+    :return: a tuple (variables, names of the left out variables). If `env` has no lazy value, variables is
+    `env.env_variables_dct` itself
+    """
+    variables = env.env_variables_dct
+    if not any(isinstance(value, LazyValue) for value in variables.values()):
+        return variables, []
+    known = OrderedDict()
+    unknown = []
+    for name, value in variables.items():
+        if isinstance(value, LazyValue):
+            value = value.get_cached()
+            if value is None:
+                unknown.append(name)
+                continue
+        known[name] = value
+    return known, unknown
+
+
+def observed_value(var_name: str, value, current_value: Optional[str]):
+    """
+    Returns what should be compared with the expected `value` of a variable: the current value, or `value` itself if
+    the current value satisfies it (case of list variables, see ListVarOps). A variable matches if the result is equal
+    to `value`.
+
+    :param var_name:
+    :param value: the expected value, as found in the environment
+    :param current_value: the current value, None if the variable is not defined
+    :return:
+    """
+    current_value = current_value or ''
+    if as_list_var_ops(var_name, value) is not None and resolve_value(var_name, value, current_value) == current_value:
+        return value
+    return current_value
+
+
+# the last status computed in this process, for each target: whole_machine -> (cache key, result)
+_STATUS_CACHE = dict()
+
+
+def get_status(config: GlobalEnvsConfig, whole_machine: bool = False, cache_file_path: str = None) -> List[EnvStatus]:
+    """
+    Detects which environments of `config` match the current persisted state. All variables used by the environments
+    are read from the backend in one bulk pass.
+
+    The result is cached until either the configuration or the backend store changes, so that this can be polled
+    cheaply, for example from a shell prompt or a status bar. The cache is kept in memory for the current process
+    (see get_backend_generation) and in a file for the next processes (see get_store_generation), so that each new
+    `envswitch status` command does not read and compare everything again.
+
+    :param config:
+    :param whole_machine: if True the MACHINE level variables are checked, otherwise the USER level variables
+    :param cache_file_path: the file where the status is cached across processes. Default is
+    get_default_status_cache_path()
+    :return: the status of each environment, exact matches first, then partial matches by decreasing ratio of
+    matching variables
+    """
+    # the content hash is maintained on each modification, so checking the key does not depend on the configuration size
+    cache_key = (get_backend_generation(whole_machine), config.content_hash())
+    cached = _STATUS_CACHE.get(whole_machine)
+    if cached is not None and cached[0] == cache_key:
+        return cached[1]
+
+    cache_file_path = cache_file_path or get_default_status_cache_path()
+    level = 'machine' if whole_machine else 'user'
+    persisted_key = [get_store_generation(whole_machine), _config_digest(config)]
+    statuses = _read_persisted_status(cache_file_path, level, persisted_key)
+    if statuses is None:
+        statuses = _compute_status(config, whole_machine)
+        _persist_status(cache_file_path, level, persisted_key, statuses)
+
+    _STATUS_CACHE[whole_machine] = (cache_key, statuses)
+    return statuses
+
+
+def _compute_status(config: GlobalEnvsConfig, whole_machine: bool) -> List[EnvStatus]:
+    with span('status'):
+        # all variable names used in the configuration, in a single bulk read. The generated environments have the
+        # variables of their template
+        var_names = OrderedDict((name, None) for name in get_var_names(config.envs.values()))
+        for template in config.templates.values():
+            var_names.update((name, None) for name in template.variables)
+        current_values = get_external_env_vars(list(var_names), whole_machine=whole_machine)
+        # the environments generated by templates are created one at a time, and only kept during their comparison
+        return compare_envs(config.iter_envs(), current_values)
+
+
+def _config_digest(config: GlobalEnvsConfig) -> str:
+    """ A digest of the contents of `config`. Contrary to the content hashes, it is the same in all processes """
+    digest = hashlib.sha1()
+    for env in config.envs.values():
+        digest.update(repr((env.id, env.name, tuple(env.env_variables_dct.items()))).encode('utf-8'))
+    for template in config.templates.values():
+        digest.update(repr((template.template_name, template.to_dict())).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _read_status_file(cache_file_path: str) -> Dict[str, Any]:
+    try:
+        with open(cache_file_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def _read_persisted_status(cache_file_path: str, level: str, key: List[Any]) -> Optional[List[EnvStatus]]:
+    """ Returns the status persisted for `level` if it was computed for the same key, None otherwise """
+    entry = _read_status_file(cache_file_path).get(level)
+    # json turns tuples into lists
+    if entry is None or entry.get('key') != json.loads(json.dumps(key)):
+        return None
+    try:
+        return [EnvStatus.from_dict(dct) for dct in entry['statuses']]
+    except (KeyError, TypeError):
+        return None
+
+
+def _persist_status(cache_file_path: str, level: str, key: List[Any], statuses: List[EnvStatus]):
+    """ Persists the status of `level`. This is only a cache: failures are ignored """
+    contents = _read_status_file(cache_file_path)
+    contents[level] = OrderedDict([('key', key), ('statuses', [s.to_dict() for s in statuses])])
+    tmp_path = cache_file_path + '.' + str(os.getpid()) + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file_path)), exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump(contents, f)
+        os.replace(tmp_path, cache_file_path)
+    except OSError as e:
+        logger.debug('Could not persist the status in %s: %s', cache_file_path, e)
+
+
+def get_var_names(envs: Iterable[EnvConfig]) -> List[str]:
+    """
+    :param envs:
+    :return: the names of all variables used by `envs`, without duplicates
+    """
+    var_names = OrderedDict()
+    for env in envs:
+        for name in env.env_variables_dct:
+            var_names[name] = None
+    return [name for name in var_names]
+
+
+def compare_envs(envs: Iterable[EnvConfig], current_values: Dict[str, Optional[str]]) -> List[EnvStatus]:
+    """
+    Compares environments with the current values of their variables, wherever they come from (the persisted store,
+    a running process...)
+
+    :param envs:
+    :param current_values: a dictionary var name -> current value (None if the variable is not defined), containing
+    at least all the variables of `envs` (see get_var_names)
+    :return: the status of each environment, exact matches first, then partial matches by decreasing ratio of
+    matching variables
+    """
+    statuses = [_get_env_status(env, current_values) for env in envs]
+    statuses.sort(key=lambda s: (not s.is_exact_match(), -(s.nb_matching / s.nb_vars) if s.nb_vars else 0))
+    return statuses
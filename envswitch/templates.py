@@ -0,0 +1,313 @@
+import re
+from collections import OrderedDict
+from itertools import product
+from string import Formatter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from autoclass import check_var
+from envswitch.lazy_values import LazyValue
+from envswitch.list_vars import ListVarOps
+
+# the top-level key of the templates section of a configuration
+TEMPLATES_KEY = '_templates'
+
+_ID = 'id'
+_NAME = 'name'
+_AXES = 'axes'
+_VARIABLES = 'variables'
+
+
+class InvalidTemplateException(Exception):
+    def __init__(self, msg):
+        """
+        Same as UnknownEnvIdException: the constructor only has one argument, use the static constructor `create_from`
+        :param msg:
+        """
+        super(InvalidTemplateException, self).__init__(msg)
+
+    @staticmethod
+    def create_from(template_name, reason):
+        e = InvalidTemplateException("Invalid environment template '" + template_name + "': " + reason)
+        e.template_name = template_name
+        return e
+
+
+class _AxisValue(str):
+    """
+    A value of an axis. In templates `{axis}` is replaced with its label, and `{axis[param]}` with one of its
+    parameters, if the axis values were declared with a mapping label -> parameters
+    """
+
+    def __new__(cls, label: str, params: Dict[str, str]):
+        res = str.__new__(cls, label)
+        res.params = params
+        return res
+
+    def __getitem__(self, key):
+        if not isinstance(key, str):
+            return str.__getitem__(self, key)
+        try:
+            return self.params[key]
+        except KeyError:
+            raise KeyError("'" + str(self) + "' has no parameter '" + key + "'")
+
+
+def _fields(template: str) -> List[str]:
+    """ Returns the names of the fields used by a str.format template, for example 'proxy' for '{proxy[url]}' """
+    return [re.split(r'[.\[]', field_name, 1)[0] for _, field_name, _, _ in Formatter().parse(template)
+            if field_name is not None]
+
+
+def _freeze(value: Any):
+    """ Returns a hashable version of `value`: dictionaries and lists are converted to tuples, recursively """
+    if isinstance(value, dict):
+        return tuple((k, _freeze(v)) for k, v in value.items())
+    elif isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class EnvTemplate:
+    """
+    A parameterized environment, expanded into one environment per combination of the values of its axes. It is
+    declared in the `_templates` section of a configuration:
+
+        _templates:
+          sites:
+            id: "{site}_{proxy}"
+            name: "{site} through {proxy}"
+            axes:
+              site: [paris, london]
+              proxy:
+                direct: {url: ""}
+                corp: {url: "http://proxy.corp:8080"}
+            variables:
+              SITE: "{site}"
+              http_proxy: "{proxy[url]}"
+              PATH: {prepend: ["/opt/{site}/bin"]}
+
+    Templates use the str.format syntax (use '{{' and '}}' for literal braces). The id template must use all axes
+    so that each combination has a distinct id.
+
+    Nothing is generated when a template is loaded: ids are generated when listed (see iter_env_ids), and an
+    environment is only created when it is requested with get_env, so that thousands of combinations do not cost
+    thousands of EnvConfig objects. Generated environments are not owned by the configuration: modifying them does not
+    modify the template.
+    """
+    __slots__ = ('template_name', 'id_template', 'name_template', 'axes', 'variables', '_id_regex', '_hash')
+
+    def __init__(self, template_name: str, template_desc: Dict[str, Any]):
+        """
+        :param template_name: the key of this template in the `_templates` section
+        :param template_desc: the template contents, see above
+        """
+        check_var(template_name, var_types=str, var_name='template name')
+        check_var(template_desc, var_types=dict, var_name='template ' + template_name)
+        self.template_name = template_name
+
+        unknown_keys = [k for k in template_desc if k not in (_ID, _NAME, _AXES, _VARIABLES)]
+        if len(unknown_keys) > 0:
+            raise InvalidTemplateException.create_from(template_name, 'unknown keys ' + str(unknown_keys))
+
+        self.id_template = template_desc.get(_ID)
+        check_var(self.id_template, var_types=str, var_name='template ' + template_name + ' id', min_len=1)
+        self.name_template = template_desc.get(_NAME, self.id_template)
+        check_var(self.name_template, var_types=str, var_name='template ' + template_name + ' name')
+
+        # axis name -> list of _AxisValue
+        self.axes = OrderedDict()
+        for axis, values in (template_desc.get(_AXES) or {}).items():
+            if not isinstance(axis, str) or not axis.isidentifier():
+                raise InvalidTemplateException.create_from(template_name, "axis name '" + str(axis) + "' is not a "
+                                                           "valid identifier")
+            if isinstance(values, dict):
+                self.axes[axis] = [_AxisValue(str(label),
+                                              OrderedDict((str(k), str(v)) for k, v in (params or {}).items()))
+                                   for label, params in values.items()]
+            elif isinstance(values, list):
+                self.axes[axis] = [_AxisValue(str(label), {}) for label in values]
+            else:
+                raise InvalidTemplateException.create_from(template_name, "the values of axis '" + axis + "' should "
+                                                           "be a list of labels or a mapping of labels to parameters")
+            if len(self.axes[axis]) == 0:
+                raise InvalidTemplateException.create_from(template_name, "axis '" + axis + "' has no value")
+
+        self.variables = OrderedDict()
+        for var_name, value in (template_desc.get(_VARIABLES) or {}).items():
+            check_var(var_name, var_types=str, var_name='environment variable name')
+            check_var(value, var_types=[str, dict, LazyValue], var_name='environment variable value')
+            if isinstance(value, dict):
+                # validate the list operations now rather than when an environment is generated
+                ListVarOps.from_dict(value)
+            self.variables[var_name] = value
+
+        self._check_fields()
+        self._id_regex = self._compile_id_regex()
+        self._hash = hash((self.template_name, _freeze(self.to_dict())))
+
+    def _check_fields(self):
+        id_fields = _fields(self.id_template)
+        missing = [axis for axis in self.axes if axis not in id_fields]
+        if len(missing) > 0:
+            raise InvalidTemplateException.create_from(self.template_name, 'the id template should use all axes, '
+                                                       'missing ' + str(missing))
+        for template in [self.id_template, self.name_template] + _template_strings(self.variables):
+            unknown = [f for f in _fields(template) if f not in self.axes]
+            if len(unknown) > 0:
+                raise InvalidTemplateException.create_from(self.template_name, "'" + template + "' uses unknown "
+                                                           "axes " + str(unknown))
+
+    def _compile_id_regex(self):
+        """ Returns a regular expression matching the generated ids, with one named group per axis """
+        pattern = ''
+        seen = set()
+        for literal, field_name, format_spec, conversion in Formatter().parse(self.id_template):
+            pattern += re.escape(literal)
+            if field_name is None:
+                continue
+            if field_name not in self.axes or format_spec or conversion:
+                raise InvalidTemplateException.create_from(self.template_name, "the id template can only use plain "
+                                                           "axes fields such as '{axis}'")
+            if field_name in seen:
+                pattern += '(?P=' + field_name + ')'
+            else:
+                seen.add(field_name)
+                # longest labels first so that a label that is a prefix of another one does not hide it
+                labels = sorted(self.axes[field_name], key=len, reverse=True)
+                pattern += '(?P<' + field_name + '>' + '|'.join(re.escape(label) for label in labels) + ')'
+        return re.compile(pattern)
+
+    def __len__(self):
+        """ The number of environments generated by this template """
+        res = 1
+        for values in self.axes.values():
+            res *= len(values)
+        return res
+
+    def __eq__(self, other):
+        return type(other) is EnvTemplate and self._hash == other._hash and self.to_dict() == other.to_dict() \
+               and self.template_name == other.template_name
+
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        return 'EnvTemplate(' + repr(self.template_name) + ', ' + str(len(self)) + ' environments)'
+
+    def content_hash(self) -> int:
+        return self._hash
+
+    def _combinations(self) -> Iterator[Dict[str, _AxisValue]]:
+        axes = list(self.axes)
+        for values in product(*self.axes.values()):
+            yield dict(zip(axes, values))
+
+    def iter_env_ids(self) -> Iterator[str]:
+        """
+        Generates the ids of the environments of this template, in the order of the axes values (the last axis varies
+        first). No environment is created.
+
+        :return:
+        """
+        for combination in self._combinations():
+            yield self.id_template.format_map(combination)
+
+    def iter_env_names(self) -> Iterator[Tuple[str, str]]:
+        """
+        Generates the ids and names of the environments of this template, in the same order than iter_env_ids. No
+        environment is created.
+
+        :return: an iterator of (env_id, name)
+        """
+        for combination in self._combinations():
+            yield self.id_template.format_map(combination), self.name_template.format_map(combination)
+
+    def _parse_id(self, env_id: str) -> Optional[Dict[str, _AxisValue]]:
+        match = self._id_regex.fullmatch(env_id)
+        if match is None:
+            return None
+        combination = dict()
+        for axis, label in match.groupdict().items():
+            combination[axis] = next(v for v in self.axes[axis] if v == label)
+        # the labels may be ambiguous (for example with separators in labels): check that this is the same id
+        return combination if self.id_template.format_map(combination) == env_id else None
+
+    def __contains__(self, env_id: str) -> bool:
+        return self._parse_id(env_id) is not None
+
+    def get_env(self, env_id: str):
+        """
+        Creates the environment `env_id` of this template.
+
+        :param env_id:
+        :return: a new EnvConfig, or None if `env_id` is not generated by this template
+        """
+        combination = self._parse_id(env_id)
+        if combination is None:
+            return None
+        from envswitch.env_config import EnvConfig
+        dct = OrderedDict()
+        dct[_NAME] = self.name_template.format_map(combination)
+        for var_name, value in self.variables.items():
+            dct[var_name] = self._expand(var_name, value, combination)
+        return EnvConfig(env_id, dct)
+
+    def _expand(self, var_name: str, value: Any, combination: Dict[str, _AxisValue]) -> Any:
+        try:
+            if isinstance(value, str):
+                return value.format_map(combination)
+            elif isinstance(value, LazyValue):
+                return type(value)(value.source.format_map(combination))
+            elif isinstance(value, list):
+                return [self._expand(var_name, v, combination) for v in value]
+            elif isinstance(value, dict):
+                return OrderedDict((k, self._expand(var_name, v, combination)) for k, v in value.items())
+            else:
+                return value
+        except (KeyError, IndexError) as e:
+            raise InvalidTemplateException.create_from(self.template_name, "variable '" + var_name + "': "
+                                                       + str(e.args[0]))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns a dictionary version of this template, as declared in the configuration
+
+        :return:
+        """
+        dct = OrderedDict()
+        dct[_ID] = self.id_template
+        if self.name_template != self.id_template:
+            dct[_NAME] = self.name_template
+        axes = OrderedDict()
+        for axis, values in self.axes.items():
+            if any(len(v.params) > 0 for v in values):
+                axes[axis] = OrderedDict((str(v), OrderedDict(v.params)) for v in values)
+            else:
+                axes[axis] = [str(v) for v in values]
+        dct[_AXES] = axes
+        dct[_VARIABLES] = OrderedDict(self.variables)
+        return dct
+
+
+def _template_strings(value: Any) -> List[str]:
+    """ Returns all the template strings contained in `value` """
+    if isinstance(value, str):
+        return [value]
+    elif isinstance(value, LazyValue):
+        return [value.source]
+    elif isinstance(value, (list, tuple)):
+        return [s for v in value for s in _template_strings(v)]
+    elif isinstance(value, dict):
+        return [s for v in value.values() for s in _template_strings(v)]
+    return []
+
+
+def load_templates(dct: Dict[str, Any]) -> Dict[str, EnvTemplate]:
+    """
+    Creates the templates declared in the `_templates` section of a configuration
+
+    :param dct: the contents of the `_templates` section
+    :return: an ordered dictionary template name -> EnvTemplate
+    """
+    check_var(dct, var_types=dict, var_name=TEMPLATES_KEY)
+    return OrderedDict((name, EnvTemplate(name, desc)) for name, desc in dct.items())
@@ -0,0 +1,40 @@
+"""
+Fixtures shared by all test modules: a builder of large synthetic catalogs (used by the benchmarks, the memory and
+caching tests) and the redirection of the linux backend store to a temporary file.
+"""
+from collections import OrderedDict
+
+import pytest
+
+import envswitch.env_api_linuximpl as linuximpl
+
+
+def _create_catalog(nb_envs: int):
+    """
+    Creates a synthetic catalog of environments similar to what a yaml parser returns: all strings are distinct
+    objects, even when their values are identical. Each environment has 10 variables, 9 of which have values shared
+    with other environments (proxy hosts, CA bundles) and one that is specific to the environment.
+    """
+    catalog = OrderedDict()
+    for i in range(nb_envs):
+        env = OrderedDict()
+        env[''.join(['na', 'me'])] = 'Environment %s' % i
+        for j in range(9):
+            env['var_%s' % j] = 'http://proxy-%s.example.com:%s' % (i % 5, 8080 + j)
+        env['env_specific'] = 'value-%s' % i
+        catalog['env_%s' % i] = env
+    return catalog
+
+
+@pytest.fixture
+def create_catalog():
+    """ The function creating a synthetic catalog of `nb_envs` environments, see _create_catalog """
+    return _create_catalog
+
+
+@pytest.fixture
+def store_path(tmpdir, monkeypatch):
+    """ Redirects the linux backend to a temporary environment file, not created yet, and returns its path """
+    store_path = str(tmpdir.join('environment'))
+    monkeypatch.setattr(linuximpl, 'get_store_path', lambda whole_machine, root=None: store_path)
+    return store_path
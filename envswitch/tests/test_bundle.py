@@ -0,0 +1,90 @@
+import os
+import shutil
+
+import pytest
+
+from envswitch.bundle import EnvsBundle, InvalidBundleException, compile_bundle, load_bundle
+from envswitch.env_config import GlobalEnvsConfig, UnknownEnvIdException
+from envswitch.formats import ReadOnlyFormatException, detect_format, read_config, write_config
+from envswitch.gui import CouldNotSaveCurrentConfigurationException, EnvSwitcherState
+from envswitch.list_vars import ListVarOps
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONF_PATH = os.path.join(THIS_DIR, 'data', 'test_conf.yaml')
+
+
+def test_bundle_lookup(tmpdir, create_catalog):
+    """ Checks that single environments and the whole configuration are read back identical from a bundle """
+    conf = GlobalEnvsConfig(create_catalog(500))
+    conf.get_env('env_3').env_variables_dct['PATH'] = ListVarOps(prepend=['/opt/bin'], dedupe=False)
+    bundle_path = str(tmpdir.join('catalog.esb'))
+    compile_bundle(conf, bundle_path)
+    assert detect_format(bundle_path).name == 'bundle'
+
+    with EnvsBundle(bundle_path) as bundle:
+        assert len(bundle) == 500
+        assert bundle.get_available_envs() == conf.get_available_envs()
+        for env_id in ('env_0', 'env_3', 'env_499'):
+            assert env_id in bundle
+            assert bundle.get_env(env_id) == conf.get_env(env_id)
+        assert 'env_500' not in bundle
+        with pytest.raises(UnknownEnvIdException):
+            bundle.get_env('env_500')
+        assert bundle.to_config() == conf
+
+    assert read_config(bundle_path) == conf
+
+
+def test_bundle_invalid(tmpdir):
+    """ Checks that corrupted and outdated bundles are detected, and that the source is used instead """
+    source_path = str(tmpdir.join('conf.yml'))
+    shutil.copy(CONF_PATH, source_path)
+    bundle_path = str(tmpdir.join('conf.esb'))
+    compile_bundle(read_config(source_path), bundle_path, source_path=source_path)
+
+    # corrupted: flip the last byte
+    with open(bundle_path, 'rb') as f:
+        contents = bytearray(f.read())
+    contents[-1] ^= 0xFF
+    with open(bundle_path, 'wb') as f:
+        f.write(contents)
+    with pytest.raises(InvalidBundleException) as exc_info:
+        EnvsBundle(bundle_path)
+    assert 'checksum' in str(exc_info.value)
+    assert load_bundle(bundle_path) == read_config(source_path)
+
+    # outdated: the source was modified after compilation
+    compile_bundle(read_config(source_path), bundle_path, source_path=source_path)
+    with open(source_path, 'a') as f:
+        f.write('\nother:\n  name: other env\n')
+    with pytest.raises(InvalidBundleException) as exc_info:
+        EnvsBundle(bundle_path)
+    assert exc_info.value.source_path == os.path.abspath(source_path)
+    assert load_bundle(bundle_path).get_available_envs() == ['no_proxy', 'proxy', 'other']
+
+
+def test_bundle_read_only(tmpdir):
+    """ Checks that bundles can not be saved like other configurations: the GUI has to save them to another file """
+    source_path = str(tmpdir.join('conf.yml'))
+    shutil.copy(CONF_PATH, source_path)
+    bundle_path = str(tmpdir.join('conf.esb'))
+    compile_bundle(read_config(source_path), bundle_path, source_path=source_path)
+    with open(bundle_path, 'rb') as f:
+        contents = f.read()
+
+    with pytest.raises(ReadOnlyFormatException):
+        write_config(read_config(source_path), bundle_path)
+
+    state = EnvSwitcherState(bundle_path)
+    assert state.is_read_only()
+    state.current_configuration.envs['proxy'].env_variables_dct['http_proxy'] = 'http://modified:8080'
+    with pytest.raises(CouldNotSaveCurrentConfigurationException):
+        state.save_modifications()
+    with open(bundle_path, 'rb') as f:
+        assert f.read() == contents
+
+    # 'save as' to a yaml file
+    new_path = str(tmpdir.join('modified.yml'))
+    state.save_as(new_path)
+    assert not state.is_read_only() and state.current_config_file == new_path
+    assert read_config(new_path).envs['proxy'].env_variables_dct['http_proxy'] == 'http://modified:8080'
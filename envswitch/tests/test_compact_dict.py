@@ -0,0 +1,36 @@
+from copy import deepcopy
+
+from envswitch.compact_dict import CompactDict
+
+
+def test_compact_dict():
+    """ Checks that CompactDict behaves as an ordered dict, and that keys tables are shared """
+    a = CompactDict([('http_proxy', 'http://localhost:8080'), ('no_proxy', '')])
+    b = CompactDict([('http_proxy', 'http://localhost:' + '8080'), ('no_proxy', 'localhost')])
+
+    # same keys: same table, and identical values are stored once
+    assert a._table is b._table
+    assert a['http_proxy'] is b['http_proxy']
+
+    # modifications
+    b['curl_ca_bundle'] = 'ca.pem'
+    assert list(b) == ['http_proxy', 'no_proxy', 'curl_ca_bundle']
+    del b['http_proxy']
+    assert list(b.items()) == [('no_proxy', 'localhost'), ('curl_ca_bundle', 'ca.pem')]
+    assert 'http_proxy' in a and 'http_proxy' not in b
+    assert dict(a) == {'http_proxy': 'http://localhost:8080', 'no_proxy': ''}
+
+    # copies are independent
+    c = deepcopy(a)
+    c['no_proxy'] = 'foo'
+    assert a['no_proxy'] == ''
+
+
+def test_incremental_hash():
+    """ Checks that the content hash maintained on each modification is the same as a full computation """
+    a = CompactDict([('http_proxy', 'http://localhost:8080'), ('no_proxy', '')])
+    a.content_hash()
+    a['no_proxy'] = 'localhost'
+    a['curl_ca_bundle'] = 'ca.pem'
+    del a['http_proxy']
+    assert a.content_hash() == CompactDict(reversed(list(a.items()))).content_hash()
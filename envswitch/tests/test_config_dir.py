@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+import envswitch.env_config as env_config
+from envswitch.env_config import GlobalEnvsConfig, ConflictingEnvIdException
+from envswitch.formats import write_config
+
+
+def _write(dir_path, file_name, contents):
+    with open(os.path.join(dir_path, file_name), 'w') as f:
+        f.write(contents)
+
+
+def test_load_config_dir(tmpdir, monkeypatch):
+    """ Checks that files are merged in file name order, and that unchanged files are not parsed again """
+    _write(str(tmpdir), 'b_proxy.yaml', 'proxy:\n  http_proxy: "http://localhost:8080"\n')
+    _write(str(tmpdir), 'a_no_proxy.yml', 'no_proxy:\n  name: "No Proxy"\n  http_proxy: ""\n')
+    _write(str(tmpdir), 'README.txt', 'not a configuration file')
+
+    parsed_files = []
+    parse = env_config._parse_yaml_file
+
+    def _parse_and_remember(file_path):
+        parsed_files.append(os.path.basename(file_path))
+        return parse(file_path)
+    monkeypatch.setattr(env_config, '_parse_yaml_file', _parse_and_remember)
+
+    conf = GlobalEnvsConfig.from_yaml_dir(str(tmpdir))
+    assert conf.get_available_envs() == ['no_proxy', 'proxy']
+    assert conf.envs['no_proxy'].name == 'No Proxy'
+    assert sorted(parsed_files) == ['a_no_proxy.yml', 'b_proxy.yaml']
+
+    # modify a single file: only that one should be parsed again
+    del parsed_files[:]
+    _write(str(tmpdir), 'b_proxy.yaml', 'proxy:\n  http_proxy: "http://proxy:3128"\n')
+    conf2 = GlobalEnvsConfig.from_yaml_dir(str(tmpdir))
+    assert parsed_files == ['b_proxy.yaml']
+    assert conf2.envs['proxy'].env_variables_dct['http_proxy'] == 'http://proxy:3128'
+
+    # save back to the directory: each environment goes back to its file
+    conf2.envs['no_proxy'].env_variables_dct['http_proxy'] = 'foo'
+    conf2.to_yaml_dir(str(tmpdir))
+    assert GlobalEnvsConfig.from_yaml_dir(str(tmpdir)) == conf2
+    assert sorted(os.listdir(str(tmpdir))) == ['README.txt', 'a_no_proxy.yml', 'b_proxy.yaml']
+
+
+def test_load_config_dir_conflict(tmpdir):
+    """ Checks that an environment id defined in two files raises an error """
+    _write(str(tmpdir), 'a.yml', 'proxy:\n  http_proxy: "http://localhost:8080"\n')
+    _write(str(tmpdir), 'b.yml', 'proxy:\n  http_proxy: "http://proxy:3128"\n')
+
+    with pytest.raises(ConflictingEnvIdException) as exc_info:
+        GlobalEnvsConfig.from_yaml_dir(str(tmpdir))
+
+    assert exc_info.value.env_id == 'proxy'
+
+
+@pytest.mark.parametrize('use_cache', [True, False], ids=['cache', 'stream'])
+def test_save_config_dir_elsewhere(tmpdir, use_cache):
+    """ Checks that saving a configuration directory to another directory does not modify the source directory """
+    src = tmpdir.mkdir('src')
+    _write(str(src), 'one.yml', 'proxy:\n  http_proxy: "http://localhost:8080"\n')
+    _write(str(src), 'two.yml', 'no_proxy:\n  http_proxy: ""\n')
+    conf = GlobalEnvsConfig.from_yaml_dir(str(src))
+    conf.envs['proxy'].env_variables_dct['http_proxy'] = 'http://proxy:3128'
+
+    dst = tmpdir.mkdir('dst')
+    write_config(conf, str(dst), 'yaml-dir', use_cache=use_cache)
+    assert sorted(os.listdir(str(dst))) == ['one.yml', 'two.yml']
+    assert GlobalEnvsConfig.from_yaml_dir(str(dst)) == conf
+    assert GlobalEnvsConfig.from_yaml_dir(str(src)).envs['proxy'].env_variables_dct['http_proxy'] \
+        == 'http://localhost:8080'
+
+
+def test_save_config_dir_removed_env(tmpdir):
+    """ Checks that the source file of a removed environment is emptied, so that it does not come back on reload """
+    _write(str(tmpdir), 'one.yml', 'proxy:\n  http_proxy: "http://localhost:8080"\n')
+    _write(str(tmpdir), 'two.yml', 'no_proxy:\n  http_proxy: ""\n')
+    conf = GlobalEnvsConfig.from_yaml_dir(str(tmpdir))
+
+    without_proxy = GlobalEnvsConfig({'no_proxy': {'http_proxy': ''}})
+    without_proxy.env_sources = dict(conf.env_sources)
+    without_proxy.to_yaml_dir(str(tmpdir))
+    assert GlobalEnvsConfig.from_yaml_dir(str(tmpdir)).get_available_envs() == ['no_proxy']
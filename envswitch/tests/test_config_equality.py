@@ -0,0 +1,54 @@
+from copy import deepcopy
+
+import pytest
+
+from envswitch.env_config import GlobalEnvsConfig
+from envswitch.list_vars import ListVarOps
+from envswitch.tracing import get_report, reset
+
+
+def test_config_equality(create_catalog):
+    """ Checks that hashes are maintained on modifications, and that comparisons do not serialize configurations """
+    conf = GlobalEnvsConfig(create_catalog(100))
+    bak = deepcopy(conf)
+    other = GlobalEnvsConfig(create_catalog(100))
+
+    reset()
+    assert conf == bak and conf == other
+    assert hash(conf) == hash(bak) == hash(other)
+
+    conf.envs['env_10'].env_variables_dct['var_1'] = 'new'
+    assert conf != bak and hash(conf) != hash(bak)
+    conf.envs['env_20'].name = 'renamed'
+    # back to the original value: equal again
+    conf.envs['env_10'].env_variables_dct['var_1'] = bak.envs['env_10'].env_variables_dct['var_1']
+    assert conf != bak
+    conf.envs['env_20'].name = 'Environment 20'
+    assert conf == bak and hash(conf) == hash(bak)
+
+    # the copy is independent
+    bak.envs['env_0'].env_variables_dct['other'] = 'x'
+    del bak.envs['env_0'].env_variables_dct['other']
+    assert conf == bak
+
+    # can be used as cache keys
+    cache = {conf: 'cached'}
+    assert cache[other] == 'cached'
+    # ... so environments can not be added or removed
+    with pytest.raises(TypeError):
+        conf.envs['env_100'] = deepcopy(conf.envs['env_0'])
+    with pytest.raises(TypeError):
+        del conf.envs['env_0']
+
+    # list operations written as plain dictionaries are converted when assigned, and invalid values are rejected
+    conf.envs['env_0'].env_variables_dct['PATH'] = {'prepend': ['/opt/bin'], 'separator': ':'}
+    bak.envs['env_0'].env_variables_dct['PATH'] = {'separator': ':', 'prepend': ['/opt/bin']}
+    assert conf.envs['env_0'].env_variables_dct['PATH'] == ListVarOps(prepend=['/opt/bin'], separator=':')
+    assert conf == bak and hash(conf) == hash(bak)
+    with pytest.raises(TypeError):
+        conf.envs['env_0'].env_variables_dct['PATH'] = 3
+    with pytest.raises(ValueError):
+        conf.envs['env_0'].env_variables_dct['PATH'] = {'prepend': ['/opt/bin'], 'unknown': ':'}
+    assert conf == bak
+
+    assert 'yaml_fragments_dumped' not in get_report()['counters']
@@ -0,0 +1,61 @@
+import json
+from copy import deepcopy
+from time import perf_counter
+
+import pytest
+
+from envswitch.diff import diff_configs, diff_envs, format_unified, to_json
+from envswitch.env_config import GlobalEnvsConfig
+from envswitch.lazy_values import FileValue
+from envswitch.list_vars import ListVarOps
+
+
+def test_diff_envs(create_catalog):
+    """ Checks the variables reported as added, removed and changed between two environments, and both outputs """
+    conf = GlobalEnvsConfig(create_catalog(2))
+    old, new = conf.get_env('env_0'), conf.get_env('env_1')
+    del new.env_variables_dct['var_8']
+    new.env_variables_dct['PATH'] = ListVarOps(prepend=['/opt/bin'])
+    new.env_variables_dct['TOKEN'] = FileValue('~/token.txt')
+
+    d = diff_envs(old, new)
+    assert list(d.added) == ['PATH', 'TOKEN']
+    assert list(d.removed) == ['var_8']
+    assert list(d.changed) == ['var_%s' % j for j in range(8)] + ['env_specific']
+    assert d.changed['env_specific'] == ('value-0', 'value-1')
+    assert not d.is_empty()
+    assert diff_envs(old, deepcopy(old)).is_empty()
+
+    text = format_unified(d, 'a', 'b').splitlines()
+    assert text[:3] == ['--- a', '+++ b', '@@ env_0 -> env_1 @@']
+    assert '-var_8: http://proxy-0.example.com:8088' in text
+    assert '+TOKEN: !file ~/token.txt' in text
+
+    dct = json.loads(to_json(d))
+    assert dct['name'] == ['Environment 0', 'Environment 1']
+    assert dct['added']['PATH'] == {'prepend': ['/opt/bin']}
+    assert dct['changed']['env_specific'] == ['value-0', 'value-1']
+
+
+@pytest.mark.benchmark
+def test_diff_configs_benchmark(create_catalog):
+    """ Checks that comparing two large catalogs only reports (and only walks) the environments that differ """
+    catalog = create_catalog(5000)
+    old = GlobalEnvsConfig(catalog)
+    catalog['env_10']['env_specific'] = 'modified'
+    del catalog['env_20']
+    catalog['env_5000'] = catalog['env_0']
+    new = GlobalEnvsConfig(catalog)
+
+    start = perf_counter()
+    d = diff_configs(old, new)
+    elapsed = perf_counter() - start
+    print('Compared 2 catalogs of 5000 environments in %.3fs' % elapsed)
+
+    assert [e.id for e in d.removed_envs] == ['env_20']
+    assert [e.id for e in d.added_envs] == ['env_5000']
+    assert [e.new_id for e in d.changed_envs] == ['env_10']
+    assert d.changed_envs[0].changed == {'env_specific': ('value-10', 'modified')}
+    assert diff_configs(old, deepcopy(old)).is_empty()
+    assert '@@ env_20 @@ removed' in format_unified(d)
+    assert elapsed < 1
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+import envswitch
+import envswitch.env_api_linuximpl as linuximpl
+import envswitch.env_overlay as env_overlay
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONF_PATH = os.path.join(THIS_DIR, 'data', 'test_conf.yaml')
+
+
+def test_temporary_nested(monkeypatch):
+    """ Checks that nested overlays restore exactly the variables they changed, and never touch the store """
+    def _fail(*args, **kwargs):
+        raise AssertionError('the persisted variables should not be modified')
+    monkeypatch.setattr(linuximpl, 'set_env_variables_permanently_linux', _fail)
+
+    monkeypatch.delenv('http_proxy', raising=False)
+    monkeypatch.setenv('no_proxy', 'localhost')
+    monkeypatch.setenv('OTHER', 'unchanged')
+    before = dict(os.environ)
+
+    proxy = envswitch.temporary('proxy', config_path=CONF_PATH)
+    with proxy:
+        assert os.environ['http_proxy'] == 'http://localhost:8080'
+        assert 'no_proxy' not in os.environ
+        with envswitch.temporary('no_proxy', config_path=CONF_PATH):
+            assert 'http_proxy' not in os.environ
+            # re-entrant: the same instance is entered again
+            with proxy:
+                assert os.environ['https_proxy'] == 'http://localhost:4443'
+            assert 'https_proxy' not in os.environ
+        assert os.environ['http_proxy'] == 'http://localhost:8080'
+        os.environ['OTHER'] = 'modified inside'
+
+    # only the overlaid variables are restored
+    assert os.environ.pop('OTHER') == 'modified inside'
+    before.pop('OTHER')
+    assert dict(os.environ) == before
+
+
+def test_temporary_decorator(monkeypatch):
+    """ Checks the decorator usage, and that the environment is restored when an exception is raised """
+    monkeypatch.delenv('http_proxy', raising=False)
+
+    @envswitch.temporary('proxy', config_path=CONF_PATH)
+    def get_proxy(fail=False):
+        if fail:
+            raise ValueError()
+        return os.environ['http_proxy']
+
+    assert get_proxy() == 'http://localhost:8080'
+    try:
+        get_proxy(fail=True)
+    except ValueError:
+        pass
+    assert 'http_proxy' not in os.environ
+
+
+def test_build_child_env():
+    """ Checks the child environment of 'envswitch run', and that it follows the modifications of the environment """
+    assert envswitch.load_config(CONF_PATH) is envswitch.load_config(CONF_PATH)
+    # a separate copy since it is modified below
+    env = envswitch.GlobalEnvsConfig.from_path(CONF_PATH).get_env('proxy')
+
+    base = {'no_proxy': 'localhost', 'PATH': '/usr/bin', 'OTHER': 'x'}
+    child_env = envswitch.build_child_env(env, base)
+    assert child_env == {'PATH': '/usr/bin', 'OTHER': 'x', 'http_proxy': 'http://localhost:8080',
+                         'https_proxy': 'http://localhost:4443'}
+    assert base['no_proxy'] == 'localhost'
+
+    env.env_variables_dct['PATH'] = '/opt/bin'
+    env.env_variables_dct['http_proxy'] = ''
+    child_env = envswitch.build_child_env(env, base)
+    assert child_env['PATH'] == os.pathsep.join(['/usr/bin', '/opt/bin'])
+    assert 'http_proxy' not in child_env
+
+
+def test_no_config(tmpdir, monkeypatch):
+    """ Checks that without a configuration path nor a last opened file, the current directory is not loaded """
+    monkeypatch.setattr(env_overlay, 'get_last_opened_file_path', lambda: '')
+    tmpdir.join('stray.yml').write('stray:\n  A: a\n')
+    monkeypatch.chdir(tmpdir)
+    with pytest.raises(FileNotFoundError):
+        envswitch.load_config()
+    with pytest.raises(FileNotFoundError):
+        envswitch.load_env('stray')
+    with pytest.raises(FileNotFoundError):
+        with envswitch.temporary('stray'):
+            pass
@@ -0,0 +1,80 @@
+import os
+from collections import OrderedDict
+from time import perf_counter
+
+import pytest
+
+from envswitch.env_config import GlobalEnvsConfig
+from envswitch.formats import detect_format, read_config, write_config
+from envswitch.list_vars import ListVarOps
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONF_PATH = os.path.join(THIS_DIR, 'data', 'test_conf.yaml')
+
+
+@pytest.mark.parametrize('file_name, format_name', [('conf.json', 'json'), ('conf.toml', 'toml'),
+                                                    ('envs', 'dotenv-dir'), ('conf.yml', 'yaml')])
+def test_round_trip(tmpdir, file_name, format_name):
+    """ Checks that a configuration is identical once saved and loaded again, and that the format is detected """
+    conf = read_config(CONF_PATH)
+    if format_name != 'dotenv-dir':
+        conf.get_env('proxy').env_variables_dct['PATH'] = ListVarOps(prepend=['/opt/a b'], remove=['/tmp'])
+    path = str(tmpdir.join(file_name))
+    write_config(conf, path, format_name if format_name.endswith('-dir') else None)
+
+    assert detect_format(path).name == format_name
+    assert read_config(path) == conf
+
+
+def test_detect_by_contents(tmpdir):
+    """ Checks that the format of files with an unknown extension is detected from their contents """
+    conf = read_config(CONF_PATH)
+    for format_name in ('json', 'toml', 'yaml'):
+        path = str(tmpdir.join('conf_' + format_name + '.txt'))
+        write_config(conf, path, format_name)
+        assert detect_format(path).name == format_name
+        assert read_config(path) == conf
+
+
+@pytest.mark.benchmark
+def test_parse_benchmark(tmpdir, create_catalog):
+    """ Compares the time needed to load a large configuration in each format """
+    conf = GlobalEnvsConfig(create_catalog(2000))
+    durations = OrderedDict()
+    for format_name, file_name in (('yaml', 'catalog.yml'), ('json', 'catalog.json'), ('toml', 'catalog.toml'),
+                                   ('yaml-dir', 'catalog.d'), ('dotenv-dir', 'catalog_env')):
+        path = str(tmpdir.join(file_name))
+        write_config(conf, path, format_name)
+        start = perf_counter()
+        loaded = read_config(path, format_name)
+        durations[format_name] = perf_counter() - start
+        # directories of dotenv files are loaded in file name order
+        assert dict(loaded.envs) == dict(conf.envs)
+    print('Loading 2000 environments: ' + ', '.join('%s %.3fs' % item for item in durations.items()))
+    assert durations['json'] < durations['yaml']
+    assert durations['toml'] < durations['yaml']
+
+
+def test_dotenv_dir_invalid_env_id(tmpdir):
+    """ Checks that environment ids that are not plain file names are rejected before anything is written """
+    path = str(tmpdir.join('envs'))
+    for env_id in ('../outside', 'sub/env', '..', '.hidden'):
+        conf = GlobalEnvsConfig({'fine': {'A': 'a'}, env_id: {'A': 'a'}})
+        with pytest.raises(ValueError):
+            write_config(conf, path, 'dotenv-dir')
+        assert not os.path.exists(path)
+    assert not tmpdir.join('outside.env').exists()
+
+
+def test_detect_dir_with_stray_dotenv(tmpdir):
+    """ Checks that a directory of yaml files with a stray .env file is a yaml-dir, and that dotfiles are skipped """
+    tmpdir.join('one.yml').write('proxy:\n  http_proxy: "http://localhost:8080"\n')
+    tmpdir.join('.env').write('SECRET=1\n')
+    assert detect_format(str(tmpdir)).name == 'yaml-dir'
+    assert read_config(str(tmpdir)).get_available_envs() == ['proxy']
+
+    envs_dir = tmpdir.mkdir('envs')
+    envs_dir.join('dev.env').write('A=a\n')
+    envs_dir.join('.env').write('SECRET=1\n')
+    assert detect_format(str(envs_dir)).name == 'dotenv-dir'
+    assert read_config(str(envs_dir)).get_available_envs() == ['dev']
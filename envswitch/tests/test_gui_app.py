@@ -0,0 +1,159 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONF_PATH = os.path.join(THIS_DIR, 'data', 'test_conf.yaml')
+
+TRAY_SCRIPT = """
+import sys
+from PyQt5.QtWidgets import QSystemTrayIcon
+from envswitch.env_config import EnvConfig
+from envswitch.gui import EnvSwitcherApp
+
+# the offscreen platform has no system tray
+QSystemTrayIcon.isSystemTrayAvailable = staticmethod(lambda: True)
+applied = []
+EnvConfig.apply = lambda self, whole_machine=False, history=None, progress=None, should_cancel=None: \\
+    applied.append(self.id)
+
+app = EnvSwitcherApp([], config_file_path=sys.argv[1], tray=True)
+assert app.ui is None, 'the main window should not be created'
+
+app.tray.refresh_menu()
+actions = app.tray.menu.actions()
+assert [a.text() for a in actions[:2]] == ['No Proxy', 'proxy'], [a.text() for a in actions]
+actions[1].trigger()
+while app.tray.apply_worker is not None:
+    app.processEvents()
+assert applied == ['proxy'], applied
+
+# the menu is only rebuilt when something changed: here the checked environment
+app.tray.refresh_menu()
+actions = app.tray.menu.actions()
+assert actions[1].isChecked() and not actions[0].isChecked()
+app.tray.refresh_menu()
+assert app.tray.menu.actions() == actions
+
+app.show_main_window()
+assert app.ui is not None and app.ui.isVisible()
+assert app.ui.envs_model.rowCount() == 2 and app.ui.current_env_id == 'no_proxy'
+app.lslot_quit()
+print('OK')
+"""
+
+APPLY_SCRIPT = """
+import sys
+from time import perf_counter
+from PyQt5.QtCore import QTimer
+from envswitch.env_api_linuximpl import get_store_path
+from envswitch.gui import EnvSwitcherApp
+
+app = EnvSwitcherApp([], config_file_path=sys.argv[1])
+
+# the event loop keeps running while the helper commands of the environment run
+ticks = []
+timer = QTimer()
+timer.timeout.connect(lambda: ticks.append(perf_counter()))
+timer.start(20)
+
+def run(worker, cancel_after=None):
+    events = []
+    worker.progress.connect(lambda done, total, name: events.append((done, total, name)))
+    worker.succeeded.connect(lambda env_id: events.append('succeeded'))
+    worker.cancelled.connect(lambda env_id: events.append('cancelled'))
+    if cancel_after is not None:
+        worker.progress.connect(lambda done, total, name: done == cancel_after and worker.requestInterruption())
+    app.ui.start_apply(worker)
+    while app.ui.apply_worker is not None:
+        app.processEvents()
+    return events
+
+events = run(app.create_apply_worker('slow'))
+assert events == [(1, 4, 'A'), (2, 4, 'B'), (3, 4, 'C'), (4, 4, ''), 'succeeded'], events
+assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.2, 'the event loop was blocked'
+with open(get_store_path(False)) as f:
+    assert 'A="a"' in f.read()
+
+# cancelled while the second variable is prepared: nothing is written
+events = run(app.create_apply_worker('other'), cancel_after=1)
+assert events == [(1, 4, 'A'), (2, 4, 'B'), 'cancelled'], events
+with open(get_store_path(False)) as f:
+    assert 'A="x"' not in f.read()
+print('OK')
+"""
+
+NAVIGATOR_SCRIPT = """
+import sys
+from envswitch.gui import EnvSwitcherApp
+
+app = EnvSwitcherApp([], config_file_path=sys.argv[1])
+ui = app.ui
+assert ui.envs_model.rowCount() == 500 and ui.current_env_id == 'env_0'
+
+# the editor pane reuses its rows: one per variable of the largest environment displayed
+ui.select_env('env_499')
+assert [e.text() for e in ui.line_editors] == ['499_0', '499_1', '499_2']
+assert len(ui._editor_rows) == 3
+
+# filtering selects the best match when the displayed environment is filtered out
+ui.envFilterLineEdit.setText('nv_42')
+assert ui.envs_model.get_env_ids()[:2] == ['env_42', 'env_420'] and ui.current_env_id == 'env_42'
+ui.envFilterLineEdit.setText('nv_4')
+assert ui.current_env_id == 'env_42'
+
+# edits go to the displayed environment, and survive switching back and forth
+ui.line_editors[1].textEdited.emit('edited')
+ui.select_env('env_420')
+assert ui.line_editors[1].text() == '420_1'
+ui.select_env('env_42')
+assert ui.line_editors[1].text() == 'edited' and ui.isWindowModified()
+ui.lslot_cancel_modifications()
+assert ui.line_editors[1].text() == '42_1'
+
+ui.envFilterLineEdit.setText('no such environment')
+assert ui.envs_model.rowCount() == 0 and ui.current_env_id is None and ui.line_editors == []
+print('OK')
+"""
+
+SLOW_CONF = """slow:
+  A: !cmd {python} -c "import time; time.sleep(0.3); print('a')"
+  B: !cmd {python} -c "import time; time.sleep(0.3); print('b')"
+  C: c
+other:
+  A: !cmd {python} -c "import time; time.sleep(0.3); print('x')"
+  B: !cmd {python} -c "import time; time.sleep(0.3); print('y')"
+  C: z
+"""
+
+
+def _run_script(script, tmpdir, *args):
+    # run in a separate process since a process can only create one QApplication
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen', HOME=str(tmpdir), XDG_CONFIG_HOME=str(tmpdir))
+    proc = subprocess.run([sys.executable, '-c', script] + list(args), env=env, stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT, timeout=60)
+    output = proc.stdout.decode(errors='replace')
+    assert proc.returncode == 0, output
+    assert output.splitlines()[-1] == 'OK', output
+
+
+def test_tray(tmpdir):
+    """ Checks the tray menu of the resident mode, and that the main window is only created when requested """
+    _run_script(TRAY_SCRIPT, tmpdir, CONF_PATH)
+
+
+def test_navigator(tmpdir):
+    """ Checks the navigator of the main window: filtering, selection and the reused editor pane """
+    conf_path = tmpdir.join('conf.yml')
+    conf_path.write(''.join('env_%s:\n  A: "%s_0"\n  B: "%s_1"\n  C: "%s_2"\n' % (i, i, i, i) for i in range(500)))
+    _run_script(NAVIGATOR_SCRIPT, tmpdir, str(conf_path))
+
+
+@pytest.mark.skipif(sys.platform != 'linux', reason='the check of the written values uses the linux backend')
+def test_apply_worker(tmpdir):
+    """ Checks that environments are applied in a worker thread, with progress and cancellation """
+    conf_path = tmpdir.join('slow.yml')
+    conf_path.write(SLOW_CONF.format(python=sys.executable))
+    _run_script(APPLY_SCRIPT, tmpdir, str(conf_path))
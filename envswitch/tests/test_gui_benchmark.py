@@ -0,0 +1,171 @@
+import os
+import subprocess
+import sys
+from statistics import median
+from time import perf_counter
+
+import pytest
+
+pytest.importorskip('pytestqt')
+
+from PyQt5 import sip
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication, QDialogButtonBox
+
+from envswitch.gui import EnvSwitcherState, EnvSwitcherView
+
+# the maximum durations in seconds. They are several times the durations measured on a developer machine so that a
+# loaded CI machine does not fail randomly, but a regression of the hot paths (for example work proportional to the
+# whole configuration on each keystroke) fails the build. The measures are added to the junit report.
+THRESHOLDS = {
+    'time_to_window': 5.,
+    'recreate_envs_view': 0.1,
+    # above 0.1s the latency is perceived while typing
+    'keystroke': 0.1,
+    # saving is measured for the original size of 300 environments, and for the largest size
+    'save': 1.,
+    'save_1000': 2.,
+    'cancel': 0.5,
+}
+
+# the sizes of the synthetic configurations: number of environments, with 10 variables each
+SIZES = (10, 100, 1000)
+
+# the sizes of the configurations saved and cancelled, and the name of the save threshold of each size
+SAVE_SIZES = {300: 'save', 1000: 'save_1000'}
+
+TIME_TO_WINDOW_SCRIPT = """
+from time import perf_counter
+start = perf_counter()
+import sys
+from envswitch.gui import EnvSwitcherApp
+
+app = EnvSwitcherApp([], config_file_path=sys.argv[1])
+app.processEvents()
+assert app.ui.isVisible() and app.ui.envs_model.rowCount() == int(sys.argv[2])
+print(perf_counter() - start)
+"""
+
+
+def _synthetic_config(nb_envs: int, nb_vars: int = 10) -> str:
+    lines = []
+    for i in range(nb_envs):
+        lines.append('env_%s:' % i)
+        lines.append('  name: Environment %s' % i)
+        for j in range(nb_vars):
+            lines.append('  VAR_%s: value_%s_%s' % (j, i, j))
+    return '\n'.join(lines) + '\n'
+
+
+def _check(record_property, measure: str, duration: float):
+    """ Publishes a measure in the junit report and fails if it is above its threshold """
+    record_property(measure, '%.6f' % duration)
+    print('%s: %.6fs (threshold %ss)' % (measure, duration, THRESHOLDS[measure]))
+    assert duration < THRESHOLDS[measure], measure + ' is too slow: %.6fs' % duration
+
+
+@pytest.fixture(scope='module')
+def qapp():
+    """
+    Overrides the pytest-qt fixture: the application is deleted at the end of this module, since other tests create
+    their own QApplication and a process can only have one at a time.
+    """
+    app = QApplication.instance()
+    if app is not None:
+        yield app
+    else:
+        app = QApplication(['envswitch', '-platform', 'offscreen'])
+        yield app
+        sip.delete(app)
+
+
+@pytest.fixture
+def open_view(qtbot, tmpdir):
+    """ A function creating a main window (without the application around it) on a synthetic configuration """
+    views = []
+
+    def _open_view(nb_envs: int):
+        conf_path = tmpdir.join('conf_%s.yml' % nb_envs)
+        conf_path.write(_synthetic_config(nb_envs))
+        state = EnvSwitcherState(str(conf_path))
+        view = EnvSwitcherView(create_apply_worker_hook=None, set_environment_target_hook=lambda whole_machine: None,
+                               initial_config=dict())
+        views.append(view)
+        view.set_model(state)
+        view.show()
+        return view, state
+
+    yield _open_view
+
+    # the windows are not registered with qtbot.addWidget: it closes them before this teardown, and closing a window
+    # with modifications asks whether to save them
+    for view in views:
+        view.state.cancel_modifications()
+        view.close()
+        view.deleteLater()
+
+
+def test_time_to_window(tmpdir, record_property):
+    """ Measures the time from the import of the gui module to the main window displayed, in a new process """
+    nb_envs = SIZES[1]
+    conf_path = tmpdir.join('conf.yml')
+    conf_path.write(_synthetic_config(nb_envs))
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen', HOME=str(tmpdir), XDG_CONFIG_HOME=str(tmpdir))
+    proc = subprocess.run([sys.executable, '-c', TIME_TO_WINDOW_SCRIPT, str(conf_path), str(nb_envs)], env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=60)
+    output = proc.stdout.decode(errors='replace')
+    assert proc.returncode == 0, output
+    _check(record_property, 'time_to_window', float(output.splitlines()[-1]))
+
+
+@pytest.mark.parametrize('nb_envs', SIZES)
+def test_recreate_envs_view(open_view, record_property, nb_envs):
+    """ Measures the time to list the environments again, for configurations of growing size """
+    view, state = open_view(nb_envs)
+    start = perf_counter()
+    view.recreate_envs_view(state)
+    duration = perf_counter() - start
+    assert view.envs_model.rowCount() == nb_envs
+    _check(record_property, 'recreate_envs_view', duration)
+
+
+@pytest.mark.parametrize('nb_envs', SIZES)
+def test_keystroke_latency(qtbot, open_view, record_property, nb_envs):
+    """ Measures the time to process one key typed in a value editor, from textEdited to the refreshed view """
+    view, state = open_view(nb_envs)
+    view.select_env('env_%s' % (nb_envs - 1))
+    editor = next(e for e in view.line_editors if e.var_name == 'VAR_0')
+    editor.setFocus()
+
+    durations = []
+    for char in 'http://proxy:8080':
+        start = perf_counter()
+        qtbot.keyClick(editor, char)
+        durations.append(perf_counter() - start)
+
+    assert state.get_env_variables(editor.env_id)['VAR_0'] == 'value_%s_0http://proxy:8080' % (nb_envs - 1)
+    assert view.isWindowModified()
+    _check(record_property, 'keystroke', median(durations))
+
+
+@pytest.mark.parametrize('nb_envs', sorted(SAVE_SIZES))
+@pytest.mark.parametrize('button', [QDialogButtonBox.Save, QDialogButtonBox.Cancel])
+def test_save_cancel_latency(qtbot, open_view, record_property, button, nb_envs):
+    """ Measures the time to save or cancel a modification with the buttons of the main window """
+    view, state = open_view(nb_envs)
+    editor = view.line_editors[-1]
+    qtbot.keyClicks(editor, '_modified')
+    assert state.is_dirty()
+
+    start = perf_counter()
+    qtbot.mouseClick(view.mainButtonBox.button(button), Qt.LeftButton)
+    duration = perf_counter() - start
+
+    assert not state.is_dirty() and not view.isWindowModified()
+    if button == QDialogButtonBox.Save:
+        assert EnvSwitcherState(state.current_config_file).get_env_variables(editor.env_id)[editor.var_name] \
+               .endswith('_modified')
+        _check(record_property, SAVE_SIZES[nb_envs], duration)
+    else:
+        assert not editor.text().endswith('_modified')
+        _check(record_property, 'cancel', duration)
@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+import envswitch.env_api_linuximpl as linuximpl
+from envswitch.env_config import GlobalEnvsConfig
+from envswitch.history import EnvHistory, restore_snapshot
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+NB_RECORDS = 25
+
+
+@pytest.fixture
+def linux_store(store_path):
+    """ A temporary environment file of the linux backend, with initial values """
+    with open(store_path, 'w') as f:
+        f.write('# a comment\nhttp_proxy="http://initial:8080"\nother="untouched"\n')
+    return store_path
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='uses the linux file backend')
+def test_snapshot_undo_restore(tmpdir, linux_store):
+    """ Applies two environments and checks that undo and restore bring back the previous persisted values """
+    history = EnvHistory(str(tmpdir.join('history.json')), max_size=5)
+    with open(os.path.join(THIS_DIR, 'data', 'test_conf.yaml'), 'r') as f:
+        conf = GlobalEnvsConfig.from_yaml(f)
+
+    conf.apply('proxy', history=history)
+    conf.apply('no_proxy', history=history)
+    assert linuximpl.read_store(linux_store) == {'other': 'untouched'}
+
+    # snapshots only contain the variables that changed
+    snapshots = history.get_snapshots()
+    assert [s.env_id for s in snapshots] == ['proxy', 'no_proxy']
+    assert snapshots[0].previous_values == {'http_proxy': 'http://initial:8080', 'https_proxy': None}
+    assert snapshots[1].previous_values == {'http_proxy': 'http://localhost:8080',
+                                            'https_proxy': 'http://localhost:4443'}
+
+    # undo the last apply
+    restore_snapshot(history=history)
+    assert linuximpl.read_store(linux_store) == {'http_proxy': 'http://localhost:8080', 'other': 'untouched',
+                                                 'https_proxy': 'http://localhost:4443'}
+    assert len(history.get_snapshots()) == 1
+
+    # apply again, and restore the first snapshot directly: only the differing keys are written
+    conf.apply('no_proxy', history=history)
+    written = restore_snapshot(snapshots[0].id, history=history)
+    assert written == {'http_proxy': 'http://initial:8080'}
+    assert linuximpl.read_store(linux_store) == {'http_proxy': 'http://initial:8080', 'other': 'untouched'}
+    assert history.get_snapshots() == []
+    with open(linux_store, 'r') as f:
+        assert f.readline() == '# a comment\n'
+
+
+def _record_many(history_path: str, process_idx: int):
+    """ Records snapshots of both levels, as processes applying environments for a user and for the machine would """
+    history = EnvHistory(history_path, max_size=1000)
+    for i in range(NB_RECORDS):
+        history.record('env_%s_%s' % (process_idx, i), whole_machine=(process_idx % 2 == 0),
+                       previous_values={'VAR': str(i)})
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='uses fork')
+def test_history_concurrent_records(tmpdir):
+    """ Checks that no snapshot is lost when several processes record into the same history at the same time """
+    history_path = str(tmpdir.join('history.json'))
+    ctx = multiprocessing.get_context('fork')
+    processes = [ctx.Process(target=_record_many, args=(history_path, idx)) for idx in range(6)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    assert all(p.exitcode == 0 for p in processes)
+
+    snapshots = EnvHistory(history_path).get_snapshots()
+    assert len(snapshots) == 6 * NB_RECORDS
+    assert [s.id for s in snapshots] == list(range(1, 6 * NB_RECORDS + 1))
@@ -0,0 +1,38 @@
+from copy import deepcopy
+
+import yaml
+
+from envswitch.env_config import GlobalEnvsConfig
+from envswitch.list_vars import ListVarOps
+from envswitch.tracing import get_report, reset
+
+
+def test_incremental_save(create_catalog):
+    """ Checks that saving reuses the fragments of unmodified environments, and is identical to a full dump """
+    conf = GlobalEnvsConfig(create_catalog(200))
+    conf.envs['env_3'].env_variables_dct['PATH'] = ListVarOps(prepend=['/opt/bin'], separator=':')
+    conf = GlobalEnvsConfig(yaml.safe_load(conf.to_yaml()))
+
+    reset()
+    assert conf.to_yaml() == yaml.dump(conf.to_dict())
+    assert get_report()['counters']['yaml_fragments_dumped'] == 200
+
+    # edit a variable, the name of an environment, and remove a variable
+    reset()
+    conf.envs['env_10'].env_variables_dct['var_1'] = 'new'
+    conf.envs['env_20'].name = 'renamed'
+    del conf.envs['env_3'].env_variables_dct['var_5']
+    assert conf.to_yaml() == yaml.dump(conf.to_dict())
+    assert get_report()['counters']['yaml_fragments_dumped'] == 3
+
+    # copies (used by the GUI to detect modifications) share the fragments until they are modified
+    reset()
+    copy = deepcopy(conf)
+    assert copy == conf
+    copy.envs['env_0'].env_variables_dct['var_0'] = 'other'
+    assert copy != conf
+    # comparisons use the hashes: only saving the copy dumps its modified environment
+    assert copy.to_yaml() != conf.to_yaml()
+    assert get_report()['counters']['yaml_fragments_dumped'] == 1
+
+    assert GlobalEnvsConfig(dict()).to_yaml() == yaml.dump(dict())
@@ -0,0 +1,88 @@
+import sys
+
+import envswitch.lazy_values as lazy_values
+from envswitch.bundle import EnvsBundle, compile_bundle
+from envswitch.env_config import GlobalEnvsConfig
+from envswitch.env_overlay import build_child_env
+from envswitch.lazy_values import CommandValue, FileValue, TTLCache
+
+CONF = """token_env:
+  name: Token
+  CA_BUNDLE: !file {ca_file}
+  TOKEN: !cmd {python} {script} {counter}
+other_env:
+  name: Other
+  TOKEN: !cmd {python} -c "raise SystemExit(1)"
+"""
+
+SCRIPT = """import sys
+with open(sys.argv[1], 'a') as f:
+    f.write('x')
+print('secret-token')
+"""
+
+
+def _load(tmpdir):
+    tmpdir.join('ca.txt').write('/etc/ssl/ca.pem\n')
+    tmpdir.join('helper.py').write(SCRIPT)
+    conf = CONF.format(ca_file=tmpdir.join('ca.txt'), python=sys.executable, script=tmpdir.join('helper.py'),
+                       counter=tmpdir.join('counter'))
+    tmpdir.join('conf.yml').write(conf)
+    return GlobalEnvsConfig.from_path(str(tmpdir.join('conf.yml')))
+
+
+def test_lazy_values(tmpdir):
+    """ Checks that lazy values are only resolved when an environment is used, and only once thanks to the cache """
+    lazy_values.clear_cache()
+    conf = _load(tmpdir)
+    counter = tmpdir.join('counter')
+
+    # nothing is resolved at load time, and the lazy values are saved back
+    env = conf.get_env('token_env')
+    assert type(env.env_variables_dct['CA_BUNDLE']) is FileValue
+    assert type(env.env_variables_dct['TOKEN']) is CommandValue
+    assert not counter.exists()
+    assert GlobalEnvsConfig.from_yaml(conf.to_yaml()) == conf
+
+    # resolved when used, only once
+    for _ in range(3):
+        child_env = build_child_env(env, base={})
+        assert child_env == {'CA_BUNDLE': '/etc/ssl/ca.pem', 'TOKEN': 'secret-token'}
+    assert counter.read() == 'x'
+    assert env.get_resolved_variables()['TOKEN'] == 'secret-token'
+    assert counter.read() == 'x'
+
+    lazy_values.clear_cache()
+    build_child_env(env, base={})
+    assert counter.read() == 'xx'
+
+    # the other environment was never resolved, its helper fails
+    try:
+        conf.get_env('other_env').get_resolved_variables()
+        assert False
+    except lazy_values.LazyValueException as e:
+        assert 'exit code 1' in str(e)
+
+    # bundles keep the lazy values
+    bundle_path = str(tmpdir.join('conf.esb'))
+    compile_bundle(conf, bundle_path)
+    with EnvsBundle(bundle_path) as bundle:
+        assert bundle.get_env('token_env') == env
+
+
+def test_ttl_cache(monkeypatch):
+    """ Checks the expiry and the size bound of the cache """
+    now = [0.]
+    monkeypatch.setattr(lazy_values, 'monotonic', lambda: now[0])
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    # 'b' is the least recently used
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert len(cache) == 2
+    now[0] = 10
+    assert cache.get('a') is None
+    assert cache.get('c') is None
+    assert len(cache) == 0
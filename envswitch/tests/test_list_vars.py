@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+import envswitch.env_api_linuximpl as linuximpl
+from envswitch.env_config import GlobalEnvsConfig
+from envswitch.history import EnvHistory
+from envswitch.list_vars import ListVarOps
+from envswitch.yaml_ordered_dict import safe_load_ordered
+
+
+def test_list_var_ops_merge():
+    """ Checks prepend/append/remove/dedupe semantics and idempotence """
+    ops = ListVarOps(prepend=['/opt/a', '/opt/b'], append='/opt/z', remove=['/old'], separator=':')
+
+    merged = ops.merge('/usr/bin:/opt/z:/old:/usr/bin:/opt/a')
+    assert merged == '/opt/a:/opt/b:/usr/bin:/opt/z'
+    assert ops.merge(merged) == merged
+    assert ops.merge(None) == '/opt/a:/opt/b:/opt/z'
+
+    no_dedupe = ListVarOps(append=['/opt/z'], separator=':', dedupe=False)
+    assert no_dedupe.merge('/a:/a') == '/a:/a:/opt/z'
+
+    with pytest.raises(ValueError):
+        ListVarOps.from_dict({'prepend': ['/a'], 'insert': ['/b']})
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='uses the linux file backend')
+def test_list_var_apply(tmpdir, monkeypatch, store_path):
+    """ Checks that re-applying an environment with list variables leaves them unchanged """
+    linuximpl.write_store(store_path, {'MY_PATH': '/usr/bin:/opt/old'})
+    monkeypatch.setenv('MY_PATH', '/bin:/usr/bin')
+
+    conf = GlobalEnvsConfig(safe_load_ordered("""
+tools:
+  MY_PATH:
+    prepend: /opt/tools/bin
+    remove: [/opt/old]
+    separator: ':'
+"""))
+    assert conf.envs['tools'].to_dict()['MY_PATH'] == {'prepend': ['/opt/tools/bin'], 'remove': ['/opt/old'],
+                                                       'separator': ':'}
+    assert conf == GlobalEnvsConfig.from_yaml(conf.to_yaml())
+
+    history = EnvHistory(str(tmpdir.join('history.json')))
+    for _ in range(2):
+        conf.apply('tools', history=history)
+        assert linuximpl.read_store(store_path) == {'MY_PATH': '/opt/tools/bin:/usr/bin'}
+
+    # the second apply did not change anything so no snapshot was taken
+    assert len(history.get_snapshots()) == 1
+
+    # the current process is updated from its own value
+    assert os.environ['MY_PATH'] == '/opt/tools/bin:/bin:/usr/bin'
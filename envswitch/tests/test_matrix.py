@@ -0,0 +1,31 @@
+import json
+import os
+import sys
+from xml.etree import ElementTree
+
+from envswitch.env_config import GlobalEnvsConfig
+from envswitch.matrix import run_matrix, select_envs, to_junit_xml, to_json, format_matrix_summary
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_matrix():
+    """ Checks that the command runs once per environment with its overlay, and the timeouts and reports """
+    config = GlobalEnvsConfig.from_path(os.path.join(THIS_DIR, 'data', 'test_conf.yaml'))
+    assert [env.id for env in select_envs(config, ['*proxy'])] == ['no_proxy', 'proxy']
+    assert [env.id for env in select_envs(config, ['p*'])] == ['proxy']
+
+    # prints the proxy, and hangs if there is one
+    command = [sys.executable, '-c', "import os, time; p = os.environ.get('http_proxy'); print(p); "
+                                     "time.sleep(30 if p else 0)"]
+    results = run_matrix(select_envs(config), command, max_workers=2, timeout=2, base_env={'http_proxy': 'other'})
+
+    assert [(r.env_id, r.status, r.returncode) for r in results] == [('no_proxy', 'passed', 0),
+                                                                     ('proxy', 'timeout', None)]
+    assert results[0].output.strip() == 'None'
+    assert results[1].duration < 10
+    assert format_matrix_summary(results).splitlines()[-1] == '1/2 environment(s) passed'
+
+    suite = ElementTree.fromstring(to_junit_xml(results)).find('testsuite')
+    assert (suite.get('tests'), suite.get('failures')) == ('2', '1')
+    assert [d['status'] for d in json.loads(to_json(results))] == ['passed', 'timeout']
@@ -0,0 +1,32 @@
+import gc
+import tracemalloc
+
+from envswitch.env_config import GlobalEnvsConfig
+
+# maximum memory used by a loaded configuration, in bytes per environment variable
+# (it was about 266 when each environment held its own OrderedDict)
+BYTES_PER_VARIABLE_BUDGET = 64
+
+
+def test_memory_benchmark(create_catalog):
+    """ Checks the memory used by a large configuration against the budget """
+    nb_envs = 2000
+    nb_vars = nb_envs * 10
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        catalog = create_catalog(nb_envs)
+        conf = GlobalEnvsConfig(catalog)
+        del catalog
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+
+    assert len(conf.get_available_envs()) == nb_envs
+    bytes_per_var = used / nb_vars
+    print('Configuration with %s environments: %s bytes, %.1f bytes per variable (budget: %s)'
+          % (nb_envs, used, bytes_per_var, BYTES_PER_VARIABLE_BUDGET))
+    assert bytes_per_var <= BYTES_PER_VARIABLE_BUDGET
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+import envswitch.env_api_linuximpl as linuximpl
+from envswitch.env_config import GlobalEnvsConfig
+from envswitch.multi_root import apply_to_roots, format_roots_report
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='uses the linux file backend')
+def test_apply_to_roots(tmpdir):
+    """ Checks that an environment is written into all roots, and that a failing root does not stop the others """
+    with open(os.path.join(THIS_DIR, 'data', 'test_conf.yaml'), 'r') as f:
+        env = GlobalEnvsConfig.from_yaml(f).get_env('proxy')
+
+    roots = [str(tmpdir.join('home' + str(i))) for i in range(8)]
+    # a root that can not be written: its environment.d is a file
+    broken = tmpdir.join('broken')
+    broken.join('.config').ensure(file=True)
+    roots.append(str(broken))
+
+    before = dict(os.environ)
+    results = apply_to_roots(env, roots, max_workers=4)
+
+    assert [r.root for r in results] == roots
+    assert [r.is_ok() for r in results] == [True] * 8 + [False]
+    for root in roots[:-1]:
+        assert linuximpl.read_store(linuximpl.get_store_path(False, root)) == {'http_proxy': 'http://localhost:8080',
+                                                                               'https_proxy': 'http://localhost:4443'}
+    # the current process is left untouched
+    assert dict(os.environ) == before
+    assert format_roots_report(results).splitlines()[-1] == '8 root(s) written, 1 error(s)'
+
+    # machine level: the roots are image root file systems
+    results = apply_to_roots(env, roots[:2], whole_machine=True)
+    assert all(r.is_ok() for r in results)
+    assert os.path.exists(os.path.join(roots[0], 'etc', 'environment'))
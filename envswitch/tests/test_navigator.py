@@ -0,0 +1,49 @@
+import envswitch.navigator as navigator
+from envswitch.navigator import EnvListModel, fuzzy_score
+
+
+def test_fuzzy_score():
+    """ Checks the fuzzy matching used by the navigator filter """
+    assert fuzzy_score('prx', 'proxy_paris') is not None
+    assert fuzzy_score('PARIS', 'proxy_paris') is not None
+    assert fuzzy_score('xp', 'proxy') is None
+    # substrings first, then word starts
+    assert fuzzy_score('pari', 'proxy_paris') > fuzzy_score('pp', 'proxy_paris') > fuzzy_score('oy', 'proxy')
+    assert fuzzy_score('par', 'paris') > fuzzy_score('par', 'compare')
+
+
+def test_env_list_model(monkeypatch):
+    """ Checks the filtering of the environments list, and that extending the filter only matches previous matches """
+    model = EnvListModel()
+    model.set_envs([('no_proxy', 'No Proxy'), ('corp', 'Corporate proxy'), ('paris', 'Paris office'),
+                    ('london', 'London office')])
+    assert model.rowCount() == 4
+    assert model.data(model.index(1)) == 'Corporate proxy'
+    assert model.data(model.index(1), EnvListModel.EnvIdRole) == 'corp'
+
+    # ids and names are matched, best matches first and configuration order for equal scores
+    model.set_filter('prox')
+    assert model.get_env_ids() == ['no_proxy', 'corp']
+    model.set_filter('office')
+    assert model.get_env_ids() == ['paris', 'london']
+    model.set_filter('ofice')
+    assert model.get_env_ids() == ['paris', 'london']
+    model.set_filter('pof')
+    assert model.get_env_ids() == ['paris']
+    assert model.get_row('paris') == 0 and model.get_row('london') is None
+
+    # incremental: when the filter is extended, only the previous matches are matched again
+    model.set_filter('of')
+    matched = []
+    monkeypatch.setattr(navigator, 'fuzzy_score', lambda pattern, text: matched.append(text) or fuzzy_score(pattern,
+                                                                                                           text))
+    model.set_filter('off')
+    assert model.get_env_ids() == ['paris', 'london']
+    assert sorted(matched) == ['London office', 'Paris office', 'london', 'paris']
+    monkeypatch.undo()
+
+    # the filter is kept when the environments are replaced
+    model.set_envs([('lyon', 'Lyon office'), ('corp', 'Corporate proxy')])
+    assert model.get_env_ids() == ['lyon']
+    model.set_filter('')
+    assert model.rowCount() == 2
@@ -0,0 +1,82 @@
+import os
+import platform
+import subprocess
+import sys
+from time import perf_counter
+
+import pytest
+
+import envswitch.proc_env as proc_env
+from envswitch.env_config import GlobalEnvsConfig
+from envswitch.proc_env import inspect_process, parse_environ, read_process_environ
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONF_PATH = os.path.join(THIS_DIR, 'data', 'test_conf.yaml')
+
+
+def test_parse_environ():
+    """ Checks the parsing of a raw environ buffer, with and without a list of variables to look up """
+    buf = b'A=1\0PATH=/usr/bin:/bin\0EMPTY=\0A=2\0B=x=y'
+    assert parse_environ(buf) == {'A': '1', 'PATH': '/usr/bin:/bin', 'EMPTY': '', 'B': 'x=y'}
+    assert parse_environ(buf, ['B', 'A', 'EMPTY', 'MISSING', 'ATH']) == {'B': 'x=y', 'A': '1', 'EMPTY': '',
+                                                                         'MISSING': None, 'ATH': None}
+    assert parse_environ(b'', ['A']) == {'A': None}
+
+
+@pytest.mark.skipif(platform.system() != 'Linux', reason='/proc is only available on linux')
+def test_inspect_process():
+    """ Checks that the environment of a running child process is compared with the configuration """
+    child_env = {'PATH': os.environ.get('PATH', ''), 'http_proxy': 'http://localhost:8080',
+                 'https_proxy': 'http://localhost:4443'}
+    proc = subprocess.Popen([sys.executable, '-c', 'import sys; print("ready", flush=True); sys.stdin.read()'],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=child_env)
+    try:
+        # wait until the child has started, its environment is the parent one before that
+        assert proc.stdout.readline() == b'ready\n'
+        assert read_process_environ(proc.pid)['http_proxy'] == 'http://localhost:8080'
+        statuses = inspect_process(proc.pid, GlobalEnvsConfig.from_path(CONF_PATH).envs.values())
+        assert [(s.env_id, s.is_exact_match()) for s in statuses] == [('proxy', True), ('no_proxy', False)]
+        assert statuses[1].drift['https_proxy'] == ('', 'http://localhost:4443')
+    finally:
+        proc.communicate(b'')
+
+
+def _fake_proc(tmpdir, monkeypatch, nb_processes: int):
+    """ Creates a fake /proc where one process out of 100 still uses an old proxy """
+    for pid in range(1, nb_processes + 1):
+        proc_dir = tmpdir.mkdir(str(pid))
+        http_proxy = 'http://localhost:8080' if pid % 100 else 'http://old-proxy:3128'
+        proc_dir.join('environ').write_binary(('HOME=/home/user%s\0LANG=C.UTF-8\0PATH=/usr/bin:/bin\0SHELL=/bin/bash\0'
+                                               'http_proxy=%s\0TERM=xterm\0' % (pid, http_proxy)).encode() * 3)
+        proc_dir.join('cmdline').write_binary(b'bash\0-l\0')
+    monkeypatch.setattr(proc_env, 'PROC_DIR', str(tmpdir))
+    monkeypatch.setattr(proc_env, '_check_proc', lambda: None)
+
+
+def test_find_stale_processes(tmpdir, monkeypatch):
+    """ Checks that the processes using other values than an environment are found """
+    _fake_proc(tmpdir, monkeypatch, 300)
+    env = GlobalEnvsConfig.from_path(CONF_PATH).get_env('proxy')
+    stale, nb_unreadable = proc_env.find_stale_processes(env, chunk_size=16)
+
+    assert nb_unreadable == 0
+    assert [p.pid for p in stale] == [100, 200, 300]
+    assert stale[0].cmdline == 'bash -l'
+    assert stale[0].stale_vars == {'http_proxy': ('http://localhost:8080', 'http://old-proxy:3128')}
+
+
+@pytest.mark.benchmark
+def test_stale_scan_benchmark(tmpdir, monkeypatch):
+    """ Scans a fake /proc with 5000 processes, and checks that the stale ones are found within a second """
+    nb_processes = 5000
+    _fake_proc(tmpdir, monkeypatch, nb_processes)
+
+    env = GlobalEnvsConfig.from_path(CONF_PATH).get_env('proxy')
+    start = perf_counter()
+    stale, nb_unreadable = proc_env.find_stale_processes(env)
+    duration = perf_counter() - start
+    print('Scanned %s processes in %.3fs' % (nb_processes, duration))
+
+    assert nb_unreadable == 0
+    assert [p.pid for p in stale] == list(range(100, nb_processes + 1, 100))
+    assert duration < 1
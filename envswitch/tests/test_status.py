@@ -0,0 +1,79 @@
+import os
+import sys
+
+import pytest
+
+import envswitch.env_api_linuximpl as linuximpl
+import envswitch.lazy_values as lazy_values
+import envswitch.status as status_module
+from envswitch.env_config import GlobalEnvsConfig
+from envswitch.status import get_status
+from envswitch.tracing import get_report, reset
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='uses the linux file backend')
+def test_status(tmpdir, monkeypatch, store_path):
+    """ Checks exact and partial matches, and that the result is cached until the backend store changes """
+    linuximpl.write_store(store_path, {'http_proxy': 'http://localhost:8080', 'https_proxy': 'http://localhost:4443'})
+
+    with open(os.path.join(THIS_DIR, 'data', 'test_conf.yaml'), 'r') as f:
+        conf = GlobalEnvsConfig.from_yaml(f)
+
+    cache_path = str(tmpdir.join('status.json'))
+    statuses = get_status(conf, cache_file_path=cache_path)
+    assert [(s.env_id, s.is_exact_match()) for s in statuses] == [('proxy', True), ('no_proxy', False)]
+    assert statuses[1].drift == {'http_proxy': ('', 'http://localhost:8080'),
+                                 'https_proxy': ('', 'http://localhost:4443')}
+
+    # cached: the backend is not read again
+    def _fail(*args, **kwargs):
+        raise AssertionError('backend should not be read')
+    with monkeypatch.context() as m:
+        m.setattr(status_module, 'get_external_env_vars', _fail)
+        assert get_status(conf, cache_file_path=cache_path) is statuses
+
+        # the next processes read the status from the cache file
+        monkeypatch.setattr(status_module, '_STATUS_CACHE', dict())
+        persisted = get_status(conf, cache_file_path=cache_path)
+        assert [(s.env_id, s.drift) for s in persisted] == [(s.env_id, s.drift) for s in statuses]
+
+    # modify the store: the status is computed again
+    linuximpl.write_store(store_path, {'http_proxy': '', 'https_proxy': ''})
+    monkeypatch.setattr(status_module, '_STATUS_CACHE', dict())
+    statuses = get_status(conf, cache_file_path=cache_path)
+    assert [(s.env_id, s.is_exact_match()) for s in statuses] == [('no_proxy', True), ('proxy', False)]
+    assert statuses[1].nb_matching == 2
+
+    # modify the configuration: the status is computed again
+    conf.envs['no_proxy'].env_variables_dct['http_proxy'] = 'http://other:8080'
+    monkeypatch.setattr(status_module, '_STATUS_CACHE', dict())
+    assert not any(s.is_exact_match() for s in get_status(conf, cache_file_path=cache_path))
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='uses the linux file backend')
+def test_status_lazy_values(tmpdir, monkeypatch, store_path):
+    """ Checks that the status never runs the helpers of lazy values, even failing ones, and reports them as unknown
+    unless they were resolved recently """
+    linuximpl.write_store(store_path, {'T1': 'one'})
+    conf = GlobalEnvsConfig.from_yaml("""
+echo:
+  T1: !cmd echo one
+other:
+  T1: one
+  T2: !cmd false
+""")
+    lazy_values.clear_cache()
+    reset()
+    statuses = get_status(conf, cache_file_path=str(tmpdir.join('status.json')))
+    assert 'lazy_values_resolved' not in get_report()['counters']
+    assert [(s.env_id, s.is_exact_match(), s.unknown, s.nb_matching) for s in statuses] == \
+        [('other', False, ['T2'], 1), ('echo', False, ['T1'], 0)]
+    assert all(len(s.drift) == 0 for s in statuses)
+
+    # resolved when the environment was applied by this process: compared
+    conf.get_env('echo').get_resolved_variables()
+    monkeypatch.setattr(status_module, '_STATUS_CACHE', dict())
+    statuses = get_status(conf, cache_file_path=str(tmpdir.join('status2.json')))
+    assert [(s.env_id, s.is_exact_match()) for s in statuses] == [('echo', True), ('other', False)]
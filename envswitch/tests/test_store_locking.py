@@ -0,0 +1,46 @@
+import multiprocessing
+import os
+import platform
+from time import perf_counter
+
+import pytest
+
+from envswitch.env_api import set_env_variables_permanently
+from envswitch.env_api_linuximpl import get_store_path, read_store
+from envswitch.list_vars import ListVarOps
+
+NB_PROCESSES = 8
+NB_APPLIES = 25
+
+
+def _apply_many(root: str, process_idx: int):
+    """ Applies NB_APPLIES times a new variable, and a new PATH item that has to be merged with the current PATH """
+    for i in range(NB_APPLIES):
+        set_env_variables_permanently({'VAR_%s_%s' % (process_idx, i): 'value',
+                                       'PATH': ListVarOps(append=['/opt/p%s_%s' % (process_idx, i)])},
+                                      also_apply_on_this_process=False, root=root)
+
+
+@pytest.mark.skipif(platform.system() != 'Linux', reason='the file store is only used on linux')
+def test_store_stress(tmpdir):
+    """
+    Runs several processes applying environments in the same store at the same time, and checks that no update was
+    lost. Each apply is a read-modify-write of the store (PATH is merged with its current value).
+    """
+    root = str(tmpdir)
+    ctx = multiprocessing.get_context('fork')
+    processes = [ctx.Process(target=_apply_many, args=(root, idx)) for idx in range(NB_PROCESSES)]
+    start = perf_counter()
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    duration = perf_counter() - start
+    assert all(p.exitcode == 0 for p in processes)
+
+    nb_applies = NB_PROCESSES * NB_APPLIES
+    print('%s processes x %s applies: %.2fs, %.0f applies/s' % (NB_PROCESSES, NB_APPLIES, duration,
+                                                                nb_applies / duration))
+    store = read_store(get_store_path(False, root))
+    assert len([name for name in store if name.startswith('VAR_')]) == nb_applies
+    assert len(store['PATH'].split(os.pathsep)) == nb_applies
@@ -0,0 +1,156 @@
+import gc
+import sys
+import tracemalloc
+from time import perf_counter
+
+import pytest
+
+import envswitch.env_api_linuximpl as linuximpl
+from envswitch.bundle import EnvsBundle, compile_bundle
+from envswitch.diff import diff_configs
+from envswitch.env_config import GlobalEnvsConfig, UnknownEnvIdException
+from envswitch.formats import read_config, write_config
+from envswitch.gui import EnvSwitcherState
+from envswitch.lazy_values import FileValue
+from envswitch.list_vars import ListVarOps
+from envswitch.matrix import select_envs
+from envswitch.status import get_status
+from envswitch.templates import InvalidTemplateException
+
+CONF = """plain:
+  name: Plain
+  http_proxy: ''
+paris_direct_dev:
+  name: Overridden
+_templates:
+  sites:
+    id: '{site}_{proxy}_{tier}'
+    name: '{site} through {proxy} ({tier})'
+    axes:
+      site:
+      - paris
+      - london
+      - new-york
+      proxy:
+        direct:
+          url: ''
+        corp:
+          url: http://proxy.corp:8080
+      tier:
+      - dev
+      - prod
+    variables:
+      http_proxy: '{proxy[url]}'
+      TOKEN: !file '~/tokens/{tier}.txt'
+      PATH:
+        prepend:
+        - /opt/{site}/bin
+"""
+
+
+def test_templates(tmpdir):
+    """ Checks the ids and contents of the environments generated by a template, and that templates are saved back """
+    conf = GlobalEnvsConfig.from_yaml(CONF)
+    assert len(conf.envs) == 2
+    env_ids = conf.get_available_envs()
+    assert len(env_ids) == 2 + 12 - 1
+    assert env_ids[:3] == ['plain', 'paris_direct_dev', 'paris_direct_prod']
+    assert env_ids[-1] == 'new-york_corp_prod'
+
+    env = conf.get_env('new-york_corp_prod')
+    assert env.name == 'new-york through corp (prod)'
+    assert env.env_variables_dct['http_proxy'] == 'http://proxy.corp:8080'
+    assert env.env_variables_dct['TOKEN'] == FileValue('~/tokens/prod.txt')
+    assert env.env_variables_dct['PATH'] == ListVarOps(prepend=['/opt/new-york/bin'])
+    # explicit environments win
+    assert conf.get_env('paris_direct_dev').name == 'Overridden'
+    for unknown in ('paris_corp', 'rome_corp_dev', 'paris_corp_prod_'):
+        with pytest.raises(UnknownEnvIdException):
+            conf.get_env(unknown)
+
+    assert [e.id for e in select_envs(conf, ['london_*_dev'])] == ['london_direct_dev', 'london_corp_dev']
+    assert conf.to_yaml() == CONF
+    assert GlobalEnvsConfig.from_yaml(conf.to_yaml()) == conf
+
+    # bundles contain the generated environments
+    bundle_path = str(tmpdir.join('conf.esb'))
+    compile_bundle(conf, bundle_path)
+    with EnvsBundle(bundle_path) as bundle:
+        assert bundle.get_available_envs() == env_ids
+        assert bundle.get_env('london_corp_dev') == conf.get_env('london_corp_dev')
+
+    # diff only generates the environments of the templates that changed
+    other = GlobalEnvsConfig.from_yaml(CONF.replace('- prod\n', '- prod\n      - test\n'))
+    d = diff_configs(conf, other)
+    assert [e.id for e in d.added_envs] == ['%s_%s_test' % (s, p) for s in ('paris', 'london', 'new-york')
+                                            for p in ('direct', 'corp')]
+    assert len(d.removed_envs) == 0 and len(d.changed_envs) == 0
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='uses the linux file backend')
+def test_templates_gui_and_status(tmpdir, store_path):
+    """ Checks that the generated environments are listed read-only by the GUI, and compared by the status """
+    conf_path = tmpdir.join('conf.yml')
+    conf_path.write(CONF)
+    conf = GlobalEnvsConfig.from_yaml(CONF)
+
+    state = EnvSwitcherState(str(conf_path))
+    names = list(state.iter_env_names())
+    assert [env_id for env_id, _ in names] == state.get_env_ids() == conf.get_available_envs()
+    assert ('london_corp_dev', 'london through corp (dev)') in names
+    assert state.is_generated('london_corp_dev') and not state.is_generated('paris_direct_dev')
+    assert state.get_env_name('paris_direct_dev') == 'Overridden'
+    assert state.get_env_variables('london_corp_dev')['http_proxy'] == 'http://proxy.corp:8080'
+
+    linuximpl.write_store(store_path, {'http_proxy': 'http://proxy.corp:8080', 'PATH': '/opt/london/bin:/usr/bin'})
+    statuses = get_status(conf, cache_file_path=str(tmpdir.join('status.json')))
+    assert len(statuses) == len(names)
+    # the lazy TOKEN value is not compared
+    assert {s.env_id for s in statuses if s.nb_matching == 2} == {'london_corp_dev', 'london_corp_prod'}
+
+
+def test_templates_invalid():
+    """ Checks that invalid templates are detected when the configuration is loaded """
+    template = "_templates:\n  t:\n    id: '%s'\n    name: '%s'\n    axes:\n      site: [a, b]\n      tier: [dev]\n"
+    for id_template, name_template, msg in (("{site}", "{site}", "use all axes"),
+                                            ("{site}_{tier}", "{country}", "unknown axes"),
+                                            ("{site!r}_{tier}", "{site}", "plain axes")):
+        with pytest.raises(InvalidTemplateException) as exc_info:
+            GlobalEnvsConfig.from_yaml(template % (id_template, name_template))
+        assert msg in str(exc_info.value)
+
+
+@pytest.mark.benchmark
+def test_templates_benchmark(tmpdir):
+    """ Checks that a template with many combinations costs no memory until an environment is requested """
+    axes = '\n'.join("      axis_%s: [%s]" % (i, ', '.join('v%s' % j for j in range(10))) for i in range(4))
+    conf_str = "_templates:\n  big:\n    id: '{axis_0}-{axis_1}-{axis_2}-{axis_3}'\n    axes:\n" + axes + \
+               "\n    variables:\n      A: '{axis_0}'\n      B: 'http://{axis_1}.example.com:{axis_2}'\n"
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        start = perf_counter()
+        conf = GlobalEnvsConfig.from_yaml(conf_str)
+        load_time = perf_counter() - start
+        used = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+
+    start = perf_counter()
+    env = conf.get_env('v1-v2-v3-v4')
+    lookup_time = perf_counter() - start
+    print('10000 combinations: loaded in %.4fs using %s bytes, one environment generated in %.6fs'
+          % (load_time, used, lookup_time))
+    assert env.env_variables_dct['B'] == 'http://v2.example.com:v3'
+    assert len(conf.get_available_envs()) == 10000
+    assert used < 100000
+    assert lookup_time < 0.01
+
+    # saved as a template, not as 10000 environments
+    json_path = str(tmpdir.join('conf.json'))
+    write_config(conf, json_path)
+    assert read_config(json_path) == conf
+    with pytest.raises(ValueError):
+        write_config(conf, str(tmpdir.join('conf.toml')))
@@ -0,0 +1,56 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from envswitch import tracing
+from envswitch.env_config import GlobalEnvsConfig
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_tracing_report():
+    """ Checks that loading a configuration records the parse and validation phases """
+    tracing.reset()
+
+    with open(os.path.join(THIS_DIR, 'data', 'test_conf.yaml'), 'r') as f:
+        GlobalEnvsConfig.from_yaml(f)
+    tracing.count('vars_written', 4)
+    tracing.count('vars_written')
+
+    report = tracing.get_report()
+    assert report['spans']['config.parse']['count'] == 1
+    assert report['spans']['config.validate']['count'] == 1
+    assert report['counters'] == {'vars_written': 5}
+
+    # the report is json-able
+    json.dumps(report)
+
+
+def test_tracing_threads():
+    """ Checks that counters and spans updated from several threads are not lost """
+    tracing.reset()
+
+    def _work(_):
+        for _ in range(1000):
+            tracing.count('vars_read')
+            tracing.record('backend.read', 0.001)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(_work, range(8)))
+
+    report = tracing.get_report()
+    assert report['counters'] == {'vars_read': 8000}
+    assert report['spans']['backend.read']['count'] == 8000
+
+
+def test_logging_to_stdout(capsys):
+    """ Checks that the messages of the CLI and GUI are printed on stdout, as before the logger was introduced """
+    handlers = list(tracing.logger.handlers)
+    tracing.logger.handlers.clear()
+    try:
+        tracing.configure_logging()
+        tracing.logger.info('hello')
+        out, err = capsys.readouterr()
+        assert out == 'hello\n' and err == ''
+    finally:
+        tracing.logger.handlers[:] = handlers
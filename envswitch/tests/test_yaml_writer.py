@@ -0,0 +1,71 @@
+import tracemalloc
+from collections import OrderedDict
+from io import StringIO
+
+import yaml
+
+from envswitch.env_config import GlobalEnvsConfig
+from envswitch.formats import read_config, write_config
+from envswitch.tracing import get_report, reset
+
+
+def test_yaml_writer_identical(create_catalog):
+    """ Checks that the streaming writer produces exactly the same output than yaml.dump, including for values that
+    need quoting """
+    catalog = create_catalog(20)
+    catalog['env_1']['tricky'] = "it's a 'quoted' \"value\"\nwith: several\n\nlines "
+    catalog['env_2']['yes'] = 'no'
+    catalog['env_2']['number'] = '8080'
+    catalog['env_2']['null'] = 'null'
+    catalog['env_2']['unicode'] = 'caf\u00e9 \u2603'
+    catalog['env_2']['empty'] = ''
+    catalog['env_3']['long'] = ' '.join(['word'] * 50)
+    catalog['env_4']['PATH'] = OrderedDict([('prepend', ['/opt/bin', 'C:\\tools']), ('remove', '/old'),
+                                            ('separator', ';'), ('dedupe', False)])
+    catalog['3.14'] = OrderedDict([('true', '- item')])
+    conf = GlobalEnvsConfig(catalog)
+    expected = yaml.dump(conf.to_dict())
+
+    stream = StringIO()
+    conf.to_yaml(stream, use_cache=False)
+    assert stream.getvalue() == expected
+    assert conf.to_yaml() == expected
+    assert GlobalEnvsConfig.from_yaml(StringIO(expected)) == conf
+
+
+class _NullStream:
+    def write(self, data):
+        pass
+
+
+def _peak_memory(conf: GlobalEnvsConfig) -> int:
+    tracemalloc.start()
+    try:
+        conf.to_yaml(_NullStream(), use_cache=False)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_yaml_writer_memory(create_catalog):
+    """ Checks that the memory used to write a configuration to a stream does not depend on its size """
+    small = _peak_memory(GlobalEnvsConfig(create_catalog(100)))
+    large = _peak_memory(GlobalEnvsConfig(create_catalog(2000)))
+    assert large < 2 * small
+
+
+def test_write_config_uncached(tmpdir, create_catalog):
+    """ Checks that saving files and directories without cache streams the same output, and caches nothing """
+    conf = GlobalEnvsConfig(create_catalog(50))
+    expected = yaml.dump(conf.to_dict())
+
+    reset()
+    write_config(conf, str(tmpdir.join('conf.yml')), use_cache=False)
+    write_config(conf, str(tmpdir.join('conf.d')), 'yaml-dir', use_cache=False)
+    assert 'yaml_fragments_dumped' not in get_report()['counters']
+    assert tmpdir.join('conf.yml').read() == expected
+    assert read_config(str(tmpdir.join('conf.d'))) == conf
+
+    write_config(conf, str(tmpdir.join('cached.yml')))
+    assert get_report()['counters']['yaml_fragments_dumped'] == 50
+    assert tmpdir.join('cached.yml').read() == expected
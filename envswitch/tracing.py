@@ -0,0 +1,149 @@
+import atexit
+import json
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, Any
+
+# the logger used by all envswitch modules to report what they do
+logger = logging.getLogger('envswitch')
+
+# timings of all named spans: name -> [number of calls, total duration (s), max duration (s)]
+_spans = OrderedDict()
+
+# named counters, for example the number of environment variables read and written: name -> value
+_counters = OrderedDict()
+
+# protects _spans and _counters, that are updated from the thread pools of multi_root, matrix and proc_env
+_lock = threading.Lock()
+
+# reference time for the report
+_t_start = perf_counter()
+
+
+def configure_logging(level: int = logging.INFO):
+    """
+    Configures the envswitch logger so that messages are displayed in the console, the same way for the CLI and GUI.
+    Libraries using envswitch do not need to call this: messages are then handled by the standard logging config.
+
+    :param level:
+    :return:
+    """
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def record(name: str, duration: float):
+    """
+    Records a duration for the span named `name`. Most of the time you should rather use the `span` context manager.
+
+    :param name:
+    :param duration: the duration in seconds
+    :return:
+    """
+    with _lock:
+        stats = _spans.get(name)
+        if stats is None:
+            _spans[name] = [1, duration, duration]
+        else:
+            stats[0] += 1
+            stats[1] += duration
+            if duration > stats[2]:
+                stats[2] = duration
+
+
+@contextmanager
+def span(name: str):
+    """
+    A context manager measuring the time spent in a named phase, for example 'config.parse' or 'backend.write'.
+
+    :param name:
+    :return:
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        duration = perf_counter() - start
+        record(name, duration)
+        logger.debug("[%s] %.3fms", name, duration * 1000)
+
+
+def count(name: str, n: int = 1):
+    """
+    Increments the counter named `name` by `n`
+
+    :param name:
+    :param n:
+    :return:
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def get_report() -> Dict[str, Any]:
+    """
+    Returns a json-able report of all spans and counters recorded so far.
+
+    :return:
+    """
+    with _lock:
+        spans_copy = [(name, tuple(stats)) for name, stats in _spans.items()]
+        counters = OrderedDict(_counters)
+    spans = OrderedDict()
+    for name, (nb_calls, total, max_duration) in spans_copy:
+        spans[name] = OrderedDict([('count', nb_calls),
+                                   ('total_ms', round(total * 1000, 3)),
+                                   ('max_ms', round(max_duration * 1000, 3))])
+
+    report = OrderedDict()
+    report['elapsed_ms'] = round((perf_counter() - _t_start) * 1000, 3)
+    report['spans'] = spans
+    report['counters'] = counters
+    return report
+
+
+def reset():
+    """
+    Forgets all recorded spans and counters
+    :return:
+    """
+    global _t_start
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+    _t_start = perf_counter()
+
+
+def enable_profiling(output_path: str):
+    """
+    Enables profiling until the process exits, at which point the report is written to `output_path`.
+
+    If `output_path` ends with '.prof' or '.pstats', the whole execution is profiled with cProfile and the stats are
+    dumped in this file (you may open it with `python -m pstats`). Otherwise the json report of all spans and counters
+    (see `get_report`) is written.
+
+    :param output_path:
+    :return:
+    """
+    if output_path.endswith(('.prof', '.pstats')):
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def _dump_cprofile():
+            profiler.disable()
+            profiler.dump_stats(output_path)
+        atexit.register(_dump_cprofile)
+    else:
+        def _dump_report():
+            with open(output_path, 'w') as f:
+                json.dump(get_report(), f, indent=2)
+        atexit.register(_dump_report)
@@ -4,6 +4,8 @@
 import yaml
 import yaml.constructor
 
+from envswitch.lazy_values import LAZY_VALUE_TYPES
+
 try:
     # included in standard lib from Python 2.7
     from collections import OrderedDict
@@ -39,6 +41,13 @@ class OrderedDictYAMLLoader(yaml.SafeLoader):
         self.add_constructor(u'tag:yaml.org,2002:map', type(self).construct_yaml_map)
         self.add_constructor(u'tag:yaml.org,2002:omap', type(self).construct_yaml_map)
 
+        # values resolved when the environment is applied. Nothing is read or run while loading
+        for tag in LAZY_VALUE_TYPES:
+            self.add_constructor(tag, type(self).construct_lazy_value)
+
+    def construct_lazy_value(self, node):
+        return LAZY_VALUE_TYPES[node.tag](self.construct_scalar(node))
+
     def construct_yaml_map(self, node):
         data = OrderedDict()
         yield data
@@ -0,0 +1,93 @@
+from typing import Any, Dict
+
+import yaml
+from yaml.events import StreamStartEvent, StreamEndEvent, DocumentStartEvent, DocumentEndEvent, MappingStartEvent, \
+    MappingEndEvent, SequenceStartEvent, SequenceEndEvent, ScalarEvent
+from yaml.nodes import ScalarNode
+
+from envswitch.lazy_values import LazyValue
+
+_STR_TAG = 'tag:yaml.org,2002:str'
+_BOOL_TAG = 'tag:yaml.org,2002:bool'
+
+
+class EnvsYamlWriter:
+    """
+    Writes a configuration to a stream one environment at a time, by sending events directly to the yaml emitter.
+    Contrary to yaml.dump, no copy of the whole configuration and no representation graph are built, so the memory
+    used does not depend on the size of the configuration. The output is identical to yaml.dump of the configuration
+    dictionary.
+
+    Environments are described by mappings of variable names to strings, or to mappings of list operations (see
+    ListVarOps.to_dict) containing lists of strings and booleans, or to lazy values (see LazyValue).
+
+        writer = EnvsYamlWriter(stream)
+        for env_id, env in config.envs.items():
+            writer.write_env(env_id, env.to_dict())
+        writer.close()
+    """
+    __slots__ = ('_dumper',)
+
+    def __init__(self, stream):
+        """
+        :param stream: a text stream
+        """
+        self._dumper = yaml.Dumper(stream)
+        self._dumper.emit(StreamStartEvent())
+        self._dumper.emit(DocumentStartEvent(explicit=False))
+        # the top-level mapping contains mappings, so it is never in flow style
+        self._dumper.emit(MappingStartEvent(None, None, True, flow_style=self._flow_style(False)))
+
+    def _flow_style(self, only_scalars: bool) -> bool:
+        """ Same rule than the yaml representer: the default style, or flow style for collections of scalars only """
+        default_flow_style = self._dumper.default_flow_style
+        return default_flow_style if default_flow_style is not None else only_scalars
+
+    def _emit_scalar(self, value: str, tag: str):
+        resolve = self._dumper.resolve
+        implicit = (resolve(ScalarNode, value, (True, False)) == tag, resolve(ScalarNode, value, (False, True)) == tag)
+        self._dumper.emit(ScalarEvent(None, tag, implicit, value))
+
+    def _emit(self, value: Any):
+        if isinstance(value, str):
+            self._emit_scalar(value, _STR_TAG)
+        elif isinstance(value, bool):
+            self._emit_scalar('true' if value else 'false', _BOOL_TAG)
+        elif isinstance(value, LazyValue):
+            self._dumper.emit(ScalarEvent(None, value.tag, (False, False), value.source))
+        elif isinstance(value, dict):
+            only_scalars = all(isinstance(v, (str, bool)) for v in value.values())
+            self._dumper.emit(MappingStartEvent(None, None, True, flow_style=self._flow_style(only_scalars)))
+            for k, v in value.items():
+                self._emit(k)
+                self._emit(v)
+            self._dumper.emit(MappingEndEvent())
+        elif isinstance(value, (list, tuple)):
+            only_scalars = all(isinstance(v, (str, bool)) for v in value)
+            self._dumper.emit(SequenceStartEvent(None, None, True, flow_style=self._flow_style(only_scalars)))
+            for v in value:
+                self._emit(v)
+            self._dumper.emit(SequenceEndEvent())
+        else:
+            raise TypeError('Unsupported value type for the yaml writer: ' + repr(type(value)))
+
+    def write_env(self, env_id: str, env_dct: Dict[str, Any]):
+        """
+        Writes an environment as the next entry of the top-level mapping
+
+        :param env_id:
+        :param env_dct: the environment contents, see EnvConfig.to_dict
+        :return:
+        """
+        self._emit(env_id)
+        self._emit(env_dct)
+
+    def close(self):
+        """
+        Terminates the document. The stream itself is not closed.
+
+        :return:
+        """
+        self._dumper.emit(MappingEndEvent())
+        self._dumper.emit(DocumentEndEvent(explicit=False))
+        self._dumper.emit(StreamEndEvent())
@@ -21,7 +21,7 @@ except ImportError as e:
 INSTALL_REQUIRES = ['pyyaml', 'click', 'autoclass']  # we cannot include 'PyQt>=5.6' here for conda compatibility reasons, see doc/index.md
 DEPENDENCY_LINKS = []
 SETUP_REQUIRES = ['pytest-runner', 'setuptools_scm', 'pypandoc', 'pandoc']
-TESTS_REQUIRE = ['pytest', 'pytest-logging', 'pytest-cov']
+TESTS_REQUIRE = ['pytest', 'pytest-logging', 'pytest-cov', 'pytest-qt']
 
 # Unfortunately this does not enforce the installation with pip. And the package does not have the same name on conda!
 # EXTRAS_REQUIRE = {':sys_platform == "win32"': ['pypiwin32'],  #    'platform_system=="Windows"'
@@ -35,7 +35,7 @@ if system == 'Windows':
     except ImportError as e:
         print('This requires to install pywin32 (conda) / pypiwin32 (pip)')
         raise e
-EXTRAS_REQUIRE = {}
+EXTRAS_REQUIRE = {'toml': ['toml']}  # only needed to read toml configuration files on python < 3.11
 
 # simple check
 try: